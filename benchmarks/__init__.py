@@ -0,0 +1,6 @@
+"""
+Бенчмарки и проверки модулей src. Запускаются из корня репозитория
+как модули, чтобы импортировались пакеты src и benchmarks:
+
+    python -m benchmarks.<имя> [аргументы]
+"""
@@ -0,0 +1,101 @@
+"""
+Скорость вырезания кропов игроков из JPEG-кадров, кропов в секунду:
+
+- cv2.imdecode всего кадра + срезы (прежний labelme_to_crops);
+- PIL Image.open + Image.crop (прежний create_reid_dataset);
+- jpeg_crops.decode_crops с бэкендом full и turbojpeg (декодируются
+  только MCU-блоки под боксами, нужна libturbojpeg);
+- то же с --reduce 2.
+
+Для turbojpeg печатается максимальное отличие пикселей от полного
+декодирования.
+
+    python -m benchmarks.crop_decode_benchmark --frames 50 --boxes 12
+"""
+import argparse
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.iof_benchmark import make_boxes
+from src.data.jpeg_crops import decode_crops, decode_full, turbo
+
+
+def make_frame(width, height, seed):
+    # Гладкий шум, чтобы размер JPEG был близок к настоящему кадру
+    rng = np.random.default_rng(seed)
+    small = rng.integers(
+        0, 255, (height // 16, width // 16, 3), dtype=np.uint8
+    )
+    frame = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    frame = cv2.add(frame, rng.integers(0, 24, frame.shape, dtype=np.uint8))
+    params = [cv2.IMWRITE_JPEG_QUALITY, 90]
+    return cv2.imencode(".jpg", frame, params)[1].tobytes()
+
+
+def cv2_full(data, boxes):
+    frame = decode_full(data)
+    return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes]
+
+
+def pil_crop(data, boxes):
+    im = Image.open(io.BytesIO(data))
+    return [np.asarray(im.crop(box)) for box in boxes]
+
+
+def measure(fn, frames, boxes):
+    start = time.perf_counter()
+    for data, frame_boxes in zip(frames, boxes):
+        fn(data, frame_boxes)
+    elapsed = time.perf_counter() - start
+    return sum(map(len, boxes)) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--boxes", type=int, default=12)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    frames = [make_frame(args.width, args.height, s)
+              for s in range(args.frames)]
+    boxes = [make_boxes(args.boxes, args.width, args.height, seed=s).tolist()
+             for s in range(args.frames)]
+    print(f"{args.frames} frames {args.width}x{args.height}, "
+          f"{len(frames[0]) // 1024} KB, {args.boxes} boxes each")
+
+    cases = {
+        "cv2 full decode": cv2_full,
+        "PIL crop": pil_crop,
+        "decode_crops full": lambda d, b: decode_crops(d, b, backend="full"),
+        "decode_crops full, reduce 2":
+            lambda d, b: decode_crops(d, b, 2, backend="full"),
+    }
+    if turbo() is not None:
+        cases["decode_crops turbojpeg"] = \
+            lambda d, b: decode_crops(d, b, backend="turbojpeg")
+        cases["decode_crops turbojpeg, reduce 2"] = \
+            lambda d, b: decode_crops(d, b, 2, backend="turbojpeg")
+
+        diff = 0
+        for data, frame_boxes in zip(frames, boxes):
+            full, _ = decode_crops(data, frame_boxes, backend="full")
+            roi, _ = decode_crops(data, frame_boxes, backend="turbojpeg")
+            for a, b in zip(full, roi):
+                assert a.shape == b.shape
+                diff = max(diff, int(np.abs(a.astype(int) - b).max()))
+        print(f"turbojpeg vs full decode: max pixel difference {diff}")
+    else:
+        print("libturbojpeg not found, turbojpeg backend skipped")
+
+    for name, fn in cases.items():
+        print(f"{name:>34}: {measure(fn, frames, boxes):8.0f} crops/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Сравнение упакованного хранилища кропов (src/data/crop_store.py)
+с раскладкой "один jpg на кроп": время сборки, размер на диске
+и скорость случайного чтения.
+
+    python -m benchmarks.crop_store_benchmark --crops 20000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from src.data.crop_store import PackedCropStore, PackedCropWriter, encode_crop
+
+
+def make_crops(count, seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 255, size=(8, 96, 48, 3), dtype=np.uint8)
+    base = [cv2.GaussianBlur(b, (7, 7), 0) for b in base]
+    return [
+        encode_crop(base[i % len(base)] + np.uint8(i % 7))
+        for i in range(count)
+    ]
+
+
+def disk_usage(root):
+    total = 0
+    for r, dirs, files in os.walk(root):
+        for name in dirs + files:
+            total += os.lstat(os.path.join(r, name)).st_blocks * 512
+    return total
+
+
+def build_folders(root, crops, pids):
+    start = time.perf_counter()
+    paths = []
+    for i, (data, pid) in enumerate(zip(crops, pids)):
+        folder = os.path.join(root, str(pid))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{pid}_c1_{i}.jpg")
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return time.perf_counter() - start, paths
+
+
+def build_packed(root, crops, pids):
+    start = time.perf_counter()
+    with PackedCropWriter(root, "bounding_box_train") as writer:
+        for i, (data, pid) in enumerate(zip(crops, pids)):
+            writer.add(data, pid, 0, i)
+    return time.perf_counter() - start
+
+
+def read_folders(paths, order, decode):
+    start = time.perf_counter()
+    for i in order:
+        if decode:
+            cv2.imread(paths[i])
+        else:
+            with open(paths[i], "rb") as f:
+                f.read()
+    return time.perf_counter() - start
+
+
+def read_packed(root, order, decode):
+    start = time.perf_counter()
+    store = PackedCropStore(root, "bounding_box_train")
+    for i in order:
+        if decode:
+            store.read(i)
+        else:
+            bytes(store.raw(i))
+    store.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--crops", type=int, default=20000)
+    parser.add_argument("--pids", type=int, default=500)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--work-dir", type=str, default="")
+    args = parser.parse_args()
+
+    crops = make_crops(args.crops)
+    pids = np.arange(args.crops) % args.pids
+    order = np.random.default_rng(1).integers(0, args.crops, args.reads)
+
+    work_dir = tempfile.mkdtemp(dir=args.work_dir or None)
+    try:
+        folders = os.path.join(work_dir, "folders")
+        packed = os.path.join(work_dir, "packed")
+        t_folders, paths = build_folders(folders, crops, pids)
+        t_packed = build_packed(packed, crops, pids)
+
+        print(f"{args.crops} crops, {args.reads} random reads "
+              "(page cache warm)")
+        print(f"{'layout':<10}{'build, s':>10}{'disk MB':>10}"
+              f"{'read/s':>12}{'decode/s':>12}")
+        for name, t_build, root, read in (
+            ("folders", t_folders, folders,
+             lambda decode: read_folders(paths, order, decode)),
+            ("packed", t_packed, packed,
+             lambda decode: read_packed(packed, order, decode)),
+        ):
+            t_read = read(False)
+            t_decode = read(True)
+            print(f"{name:<10}{t_build:>10.2f}{disk_usage(root) / 1e6:>10.1f}"
+                  f"{len(order) / t_read:>12.0f}"
+                  f"{len(order) / t_decode:>12.0f}")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
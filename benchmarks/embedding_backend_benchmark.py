@@ -0,0 +1,91 @@
+"""
+Скорость бэкендов инференса ReID (src/models/backends.py), кропов
+в секунду, для нескольких размеров батча:
+
+- torch (чекпоинт torchreid);
+- onnxruntime и openvino (экспорт src/models/export_onnx.py).
+
+Пропускаются бэкенды без установленного рантайма или без файла весов.
+Для onnxruntime и openvino печатается отличие нормированных эмбеддингов
+от torch: максимальная разница элементов и минимальное косинусное сходство.
+
+    python -m benchmarks.embedding_backend_benchmark \
+        --batch-sizes 1 8 32 --threads 4
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import yaml
+
+from src.config import DEFAULT_CONFIG
+from src.models.backends import (
+    DEFAULT_ONNX,
+    available_backends,
+    l2_normalize,
+    load_backend,
+)
+from src.models.predict_model import DEFAULT_CHECKPOINT
+
+
+def measure(backend, batch, repeats):
+    backend(batch)  # прогрев
+    start = time.perf_counter()
+    for _ in range(repeats):
+        backend(batch)
+    return len(batch) * repeats / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--onnx", default=DEFAULT_ONNX)
+    parser.add_argument("--config", default=DEFAULT_CONFIG)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64]
+    )
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = yaml.safe_load(f)
+    width, height = config["data"]["width"], config["data"]["height"]
+
+    backends = {}
+    for name in available_backends():
+        weights = args.checkpoint if name == "torch" else args.onnx
+        if not os.path.exists(weights):
+            print(f"{name}: {weights} not found, skipped")
+            continue
+        backends[name], _ = load_backend(
+            name, args.checkpoint, args.onnx, config, "cpu", args.threads
+        )
+
+    rng = np.random.default_rng(0)
+    batch = rng.standard_normal(
+        (max(args.batch_sizes), 3, height, width), dtype=np.float32
+    )
+    if "torch" in backends:
+        expected = l2_normalize(backends["torch"](batch))
+        for name, backend in backends.items():
+            if name == "torch":
+                continue
+            actual = l2_normalize(backend(batch))
+            diff = np.abs(expected - actual).max()
+            cosine = (expected * actual).sum(axis=1).min()
+            print(
+                f"{name} vs torch: max abs diff {diff:.2e}, "
+                f"min cosine {cosine:.6f}"
+            )
+
+    print(f"input {width}x{height}, {args.threads} threads")
+    for name, backend in backends.items():
+        for batch_size in args.batch_sizes:
+            rate = measure(backend, batch[:batch_size], args.repeats)
+            print(f"{name:>12}, batch {batch_size:>3}: {rate:8.1f} crops/s")
+
+
+if __name__ == "__main__":
+    main()
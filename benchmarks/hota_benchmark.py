@@ -0,0 +1,132 @@
+"""
+Проверка и замер src/metrics/hota.py (аналитические случаи с заранее
+посчитанными значениями - в tests/test_hota.py).
+
+1. Сравнение со ссылочной покадровой реализацией HOTA.eval_sequence из
+   TrackEval (пакет trackeval, если установлен, иначе её построчный
+   перенос ниже) на синтетических последовательностях.
+2. Время на полной синтетической игре.
+
+    python -m benchmarks.hota_benchmark --frames 135000
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from benchmarks.mot_metrics_benchmark import make_sequence
+from src.metrics.hota import ALPHAS, FIELDS, hota
+
+
+def box_ious(a, b):
+    a_max, b_max = a[:, :2] + a[:, 2:], b[:, :2] + b[:, 2:]
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a_max[:, None], b_max[None])
+    inter = np.clip(rb - lt, 0, None).prod(-1)
+    union = a[:, 2:].prod(-1)[:, None] + b[:, 2:].prod(-1)[None] - inter
+    return np.where(inter == 0, 0.0, inter / np.maximum(union, 1e-10))
+
+
+def to_trackeval(gt, t):
+    frames = np.union1d(gt[:, 0], t[:, 0]).astype(int)
+    gt_u, gt_inv = np.unique(gt[:, 1], return_inverse=True)
+    t_u, t_inv = np.unique(t[:, 1], return_inverse=True)
+    data = {
+        "num_gt_ids": len(gt_u), "num_tracker_ids": len(t_u),
+        "num_gt_dets": len(gt), "num_tracker_dets": len(t),
+        "num_timesteps": len(frames),
+        "gt_ids": [], "tracker_ids": [], "similarity_scores": [],
+    }
+    for f in frames:
+        g, tr = gt[:, 0] == f, t[:, 0] == f
+        data["gt_ids"].append(gt_inv[g])
+        data["tracker_ids"].append(t_inv[tr])
+        data["similarity_scores"].append(box_ious(gt[g, 2:6], t[tr, 2:6]))
+    return data
+
+
+def reference_hota(data):
+    """Построчный перенос trackeval.metrics.HOTA.eval_sequence."""
+    try:
+        from trackeval.metrics import HOTA
+
+        return HOTA().eval_sequence(data)
+    except ImportError:
+        pass
+
+    eps = np.finfo("float").eps
+    res = {k: np.zeros(len(ALPHAS)) for k in
+           ["HOTA_TP", "HOTA_FN", "HOTA_FP", "LocA", "AssA", "AssRe", "AssPr"]}
+    pm = np.zeros((data["num_gt_ids"], data["num_tracker_ids"]))
+    gt_c = np.zeros((data["num_gt_ids"], 1))
+    tr_c = np.zeros((1, data["num_tracker_ids"]))
+    for g, tr, s in zip(data["gt_ids"], data["tracker_ids"],
+                        data["similarity_scores"]):
+        den = s.sum(0)[None, :] + s.sum(1)[:, None] - s
+        si = np.zeros_like(s)
+        m = den > eps
+        si[m] = s[m] / den[m]
+        pm[g[:, None], tr[None, :]] += si
+        gt_c[g] += 1
+        tr_c[0, tr] += 1
+    gas = pm / (gt_c + tr_c - pm)
+    mc = [np.zeros_like(pm) for _ in ALPHAS]
+    for g, tr, s in zip(data["gt_ids"], data["tracker_ids"],
+                        data["similarity_scores"]):
+        if len(g) == 0:
+            res["HOTA_FP"] += len(tr)
+            continue
+        if len(tr) == 0:
+            res["HOTA_FN"] += len(g)
+            continue
+        r, c = linear_sum_assignment(-(gas[g[:, None], tr[None, :]] * s))
+        for a, alpha in enumerate(ALPHAS):
+            ok = s[r, c] >= alpha - eps
+            n = ok.sum()
+            res["HOTA_TP"][a] += n
+            res["HOTA_FN"][a] += len(g) - n
+            res["HOTA_FP"][a] += len(tr) - n
+            if n:
+                res["LocA"][a] += s[r[ok], c[ok]].sum()
+                mc[a][g[r[ok]], tr[c[ok]]] += 1
+    for a in range(len(ALPHAS)):
+        tp = np.maximum(1, res["HOTA_TP"][a])
+        res["AssA"][a] = np.sum(mc[a] * mc[a] / np.maximum(
+            1, gt_c + tr_c - mc[a])) / tp
+        res["AssRe"][a] = np.sum(mc[a] * mc[a] / np.maximum(1, gt_c)) / tp
+        res["AssPr"][a] = np.sum(mc[a] * mc[a] / np.maximum(1, tr_c)) / tp
+    res["LocA"] = np.maximum(1e-10, res["LocA"]) / np.maximum(
+        1e-10, res["HOTA_TP"])
+    tp, fn, fp = res["HOTA_TP"], res["HOTA_FN"], res["HOTA_FP"]
+    res["DetRe"] = tp / np.maximum(1, tp + fn)
+    res["DetPr"] = tp / np.maximum(1, tp + fp)
+    res["DetA"] = tp / np.maximum(1, tp + fn + fp)
+    res["HOTA"] = np.sqrt(res["DetA"] * res["AssA"])
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=135000)
+    parser.add_argument("--objects", type=int, default=10)
+    args = parser.parse_args()
+
+    for seed in range(3):
+        gt, t = make_sequence(500, 8, seed=seed)
+        ours, ref = hota(gt, t), reference_hota(to_trackeval(gt, t))
+        for field in FIELDS:
+            assert np.allclose(ours[field], ref[field]), field
+    print("reference HOTA on synthetic sequences: ok")
+
+    gt, t = make_sequence(args.frames, args.objects)
+    start = time.perf_counter()
+    res = hota(gt, t)["mean"]
+    elapsed = time.perf_counter() - start
+    print(f"{args.frames} frames in {elapsed:.1f}s "
+          f"({args.frames / elapsed:.0f} frames/s)")
+    print("  ".join(f"{k} {v:.4f}" for k, v in res.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Микро-бенчмарк фильтра перекрытий labelme_to_crops: исходный путь
+(матрица N x N + словарь по кортежу бокса) против max_iof
+(матрица для разреженных кадров, sort-and-sweep для плотных).
+
+    python -m benchmarks.iof_benchmark --sizes 10 100 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.data.labelme_to_crops import (
+    _iof,
+    _max_iof_dense,
+    _max_iof_sweep,
+    max_iof,
+)
+
+
+def make_boxes(n, width=1280, height=720, seed=0):
+    rng = np.random.default_rng(seed)
+    w = rng.integers(20, 60, n)
+    h = rng.integers(50, 140, n)
+    x = rng.integers(0, width - 60, n)
+    y = rng.integers(0, height - 140, n)
+    return np.stack([x, y, x + w, y + h], axis=1)
+
+
+def baseline(boxes):
+    # calc_max_iof_dict до векторизации
+    max_iof_d = {}
+    iof_matrix = _iof(boxes, boxes)
+    np.fill_diagonal(iof_matrix, 0)
+    for i in range(len(boxes)):
+        x, y, x2, y2 = boxes[i].tolist()
+        max_iof_d[(x, y, x2, y2)] = np.max(iof_matrix[i])
+    return np.array([max_iof_d[tuple(b)] for b in boxes.tolist()])
+
+
+def timeit(fn, boxes, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(boxes)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", type=int,
+                        default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'boxes':>6}{'baseline, us':>15}{'dense, us':>12}"
+          f"{'sweep, us':>12}{'max_iof, us':>13}")
+    for n in args.sizes:
+        boxes = make_boxes(n)
+        fboxes = boxes.astype(np.float64)
+        expected = baseline(boxes)
+        assert np.allclose(max_iof(boxes), expected)
+        assert np.allclose(_max_iof_sweep(fboxes), expected)
+
+        print(f"{n:>6}{timeit(baseline, boxes, args.repeat):>15.0f}"
+              f"{timeit(_max_iof_dense, fboxes, args.repeat):>12.0f}"
+              f"{timeit(_max_iof_sweep, fboxes, args.repeat):>12.0f}"
+              f"{timeit(max_iof, boxes, args.repeat):>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
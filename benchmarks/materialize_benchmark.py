@@ -0,0 +1,95 @@
+"""
+Сравнение режимов размещения кадров (src/data/materialize.py):
+время и количество байт, реально занятых на диске, для каждого режима.
+
+    python -m benchmarks.materialize_benchmark --files 2000 --size 150000
+    python -m benchmarks.materialize_benchmark --source data/raw/NCAA
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from src.data.materialize import MODES, materialize
+
+
+def used_bytes(path):
+    st = os.statvfs(path)
+    return (st.f_blocks - st.f_bfree) * st.f_frsize
+
+
+def make_sources(root, files, size):
+    paths = []
+    for i in range(files):
+        path = os.path.join(root, f"{i:06d}.jpg")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def find_sources(root):
+    return [
+        os.path.join(r, f)
+        for r, _, files in os.walk(root)
+        for f in files
+        if f.endswith(".jpg")
+    ]
+
+
+def run_mode(sources, work_dir, mode):
+    dst_dir = os.path.join(work_dir, mode)
+    os.makedirs(dst_dir)
+    os.sync()
+    before = used_bytes(work_dir)
+
+    used = {}
+    start = time.perf_counter()
+    for i, src in enumerate(sources):
+        m = materialize(src, os.path.join(dst_dir, f"{i:06d}.jpg"), mode)
+        used[m] = used.get(m, 0) + 1
+    os.sync()
+    elapsed = time.perf_counter() - start
+
+    written = used_bytes(work_dir) - before
+    shutil.rmtree(dst_dir)
+    return elapsed, written, used
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", type=str, default="",
+                        help="директория с jpg; по умолчанию синтетические")
+    parser.add_argument("--work-dir", type=str, default="",
+                        help="директория для выходов (та же ФС, что и source)")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=150_000)
+    parser.add_argument("--modes", nargs="+", default=list(MODES),
+                        choices=MODES)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(dir=args.work_dir or None)
+    try:
+        if args.source:
+            sources = find_sources(args.source)
+        else:
+            src_dir = os.path.join(work_dir, "src")
+            os.makedirs(src_dir)
+            sources = make_sources(src_dir, args.files, args.size)
+        total = sum(os.path.getsize(p) for p in sources)
+        print(f"{len(sources)} files, {total / 1e6:.1f} MB")
+
+        print(f"{'mode':<10}{'time, s':>10}{'files/s':>12}"
+              f"{'disk MB':>10}  used")
+        for mode in args.modes:
+            elapsed, written, used = run_mode(sources, work_dir, mode)
+            print(f"{mode:<10}{elapsed:>10.2f}"
+                  f"{len(sources) / max(elapsed, 1e-9):>12.0f}"
+                  f"{written / 1e6:>10.1f}  {used}")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
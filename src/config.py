@@ -0,0 +1,14 @@
+"""
+Paths shared by the scripts of src/data and src/models.
+"""
+import os
+
+# Paths from the repository root, so the scripts work from any directory
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIG = os.path.join(
+    PROJECT_DIR,
+    "data",
+    "processed",
+    "config",
+    "im_osnet_x1_0_softmax_256x128_amsgrad.yaml",
+)
@@ -0,0 +1,133 @@
+"""
+Устойчивые к прерыванию блоки для конвертеров датасетов.
+
+Каждый выходной файл пишется в `<path>.tmp` и переименовывается в
+итоговый путь, так что прерванная сборка не оставляет недописанных
+изображений и разметки. Прогресс дописывается в журнал (одна json-запись
+на строку) по мере завершения работы; повторный запуск читает его и
+пропускает уже сделанное.
+"""
+import contextlib
+import json
+import os
+
+JOURNAL_NAME = ".progress.jsonl"
+TMP_SUFFIX = ".tmp"
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Отдаёт временный путь рядом с `path`. Если блок завершился успешно,
+    временный файл одним переименованием заменяет `path`, иначе
+    удаляется.
+    """
+    tmp_path = path + TMP_SUFFIX
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write(path, data):
+    """Атомарно пишет bytes или str в `path`."""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+
+
+class JournalMismatch(Exception):
+    """Журнал на диске записан сборкой с другим планом."""
+
+
+class Journal:
+    """
+    Журнал прогресса, в который только дописывают. Первая строка - план
+    сборки `plan` (входы и параметры, от которых зависят выходы),
+    следующие - записи, переданные в append. Запись, оборванная падением
+    посреди записи, отбрасывается при чтении журнала.
+
+    Добавленные записи попадают на диск только при flush, поэтому
+    вызывающий код сначала делает долговечными описанные ими выходы
+    (записывает их, сбрасывает файлы shard), а потом сбрасывает журнал.
+    """
+
+    def __init__(self, path, plan=None):
+        self.path = path
+        self.plan = plan
+        self.records = []
+        self._pending = []
+
+        valid_size = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    valid_size += len(line)
+                    self.records.append(record)
+
+        if self.records:
+            header = self.records.pop(0)
+            if header.get("plan") != plan:
+                raise JournalMismatch(
+                    f"{path} belongs to a build with other inputs or options"
+                )
+
+        self._file = open(path, "ab")
+        self._file.truncate(valid_size)
+        if valid_size == 0:
+            self._pending.append({"plan": plan})
+            self.flush()
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        self.records.append(record)
+        self._pending.append(record)
+
+    def flush(self):
+        for record in self._pending:
+            self._file.write(json.dumps(record).encode() + b"\n")
+        self._pending = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def reset(self):
+        """Удаляет все записи, сохраняя план."""
+        self.records = []
+        self._pending = [{"plan": self.plan}]
+        self._file.truncate(0)
+        self.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_partial_output(output_dir, journal_name=JOURNAL_NAME):
+    """
+    True, если в output_dir есть файлы, но нет журнала: её начала не
+    возобновляемая сборка, и продолжать её небезопасно.
+    """
+    if not os.path.isdir(output_dir):
+        return False
+    names = os.listdir(output_dir)
+    return bool(names) and journal_name not in names
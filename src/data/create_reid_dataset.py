@@ -1,166 +1,554 @@
+import csv
+import hashlib
 import json
 import os
-import shutil
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool
 
 import click
-from PIL import Image
+import numpy as np
 from sklearn.model_selection import train_test_split
 from tqdm import tqdm
 
+from src.data.checkpoint import (
+    JOURNAL_NAME,
+    Journal,
+    JournalMismatch,
+    atomic_path,
+    is_partial_output,
+)
+from src.config import DEFAULT_CONFIG
+from src.data.crop_resize import RESIZE_MODES, read_train_size, resize_crop
+from src.data.crop_store import GEOMETRY_FIELDS, PackedCropWriter
+from src.data.crop_writer import FORMATS, CropWriter, encode_params
+from src.data.jpeg_crops import BACKENDS, read_crops
+from src.data.labelme import frame_size
+from src.data.sequence_index import SequenceIndex, load_annotation
+
 # PATH_TO_DATA = "../../data/raw/NCAA_2/third_task"
 # save_dir = "../../data/processed"
 
+PARTS = ("bounding_box_train", "query", "bounding_box_test")
+# JPEG quality PIL used to save the crops with
+DEFAULT_JPEG_QUALITY = 75
+# Frames between two journal checkpoints: at most this many frames are
+# converted again after an interruption
+CHECKPOINT_FRAMES = 256
 
-def copy_files(file_list, root_folder, flag):
-    # Get the name of the folder
-    path, d = os.path.split(root_folder)
-    # print(f"Copying {len(file_list)} files from {d} to {flag} folder")
-    for file in file_list:
-        # Create the folder and its parent directories if they don't exist
-        final_path = os.path.join(path, "market1501", flag)
-        os.makedirs(final_path, exist_ok=True)
-        shutil.move(os.path.join(root_folder, file), final_path)
-        if flag == "query":
-            id, camid, num = file.split("_")
-            new_file = f"{id}_c2_{num}"
-            os.rename(
-                os.path.join(final_path, file),
-                os.path.join(final_path, new_file),
-            )
 
+def split_identity(items):
+    """
+    Splits the crops of one identity into train, query and test parts.
+    """
+    train_data, eval_data = train_test_split(
+        items, test_size=0.1, random_state=42
+    )
+    train_data, test_data = train_test_split(
+        train_data, test_size=0.55, random_state=42
+    )
+    return train_data, eval_data, test_data
+
+
+def frame_path_for(anno_path):
+    """Returns the frame image of a LabelMe annotation, or None."""
+    if "anno" in anno_path:
+        return anno_path.replace("json", "jpg").replace(
+            "anno", "playerTrackingFrames"
+        )
+    if "third_task" in anno_path:
+        return anno_path.replace("json", "jpg").replace(
+            "third_task", "playerTrackingFrames2"
+        )
+    return None
 
-@click.command()
-@click.argument("input_filepath", type=click.Path(exists=True))
-@click.argument("output_filepath", type=click.Path())
-def main(input_filepath, output_filepath):
+
+def annotation_paths(input_filepath, index=None):
+    """LabelMe annotations under input_filepath, or all of the index."""
+    if index is not None:
+        return [index.anno_path(row) for row in range(len(index))]
+
+    anno_pathes = []
+    # Get all json files in subdirectories under input filepath
+    for root, dirs, files in os.walk(input_filepath):
+        for file in files:
+            if file.endswith(".json") & (
+                ("anno" in root) or ("third_task" in root)
+            ):
+                anno_pathes.append(os.path.join(root, file))
+    return anno_pathes
+
+
+def player_boxes(annotation, width, height):
     """
-    The main function of this module is to create a dataset for the training and testing of a neural network.
-    The function takes two arguments:
-        1) input_filepath - The path to the folder containing all the images and annotations.
-        2) output_filepath - The path where you want your new dataset to be saved.
+    (number, box) of the numbered players of an annotation. Boxes that
+    are empty or lie entirely outside the width x height frame are
+    dropped.
+    """
+    boxes = []
+    for shape in annotation.shapes:
+        if not shape.label.isdigit():
+            continue
+        (x1, y1), (x2, y2) = shape.points[:2]
+        x1, x2 = sorted((int(x1), int(x2)))
+        y1, y2 = sorted((int(y1), int(y2)))
 
-    :param input_filepath: Specify the path to the folder containing all of your images
-    :param output_filepath: Specify the path to the directory where you want to save your data
+        if x2 <= max(x1, 0) or y2 <= max(y1, 0):
+            continue
+        if x1 >= width or y1 >= height:
+            continue
+        boxes.append((int(shape.label), (x1, y1, x2, y2)))
+    return boxes
+
+
+def collect_crops(input_filepath, index=None):
     """
+    Reads the annotations only (no pixels) and lists the crops of every
+    frame as (pid, box, crop number). Each annotation folder gets its own
+    block of 13 person ids. With a SequenceIndex the annotations are
+    taken from it instead of walking the tree and parsing every json.
 
-    anno_pathes = []
+    Boxes that are empty or lie entirely outside the frame are dropped
+    here, using the frame size from the annotation (or the image header),
+    so frames are only decoded later if they still have crops.
+
+    :return: list of (frame path, frame number, crops)
+    """
     list_folder = []
 
     class_name = -11
     i = 0
 
-    empty_folder = os.listdir(output_filepath)
-    assert len(empty_folder) == 0, "The output folder is not empty!"
+    frames = []
+    anno_pathes = annotation_paths(input_filepath, index)
+    for frame, anno_path in enumerate(tqdm(anno_pathes)):
+        im_path = frame_path_for(anno_path)
+        if im_path is None:
+            continue
 
-    # Get all json files in subdirectories under input filepath
-    for root, dirs, files in os.walk(input_filepath):
-        if len(files) != 0:
-            for file in files:
-                if file.endswith(".json") & (
-                    ("anno" in root) or ("third_task" in root)
-                ):
-                    anno_pathes.append(os.path.join(root, file))
-
-    for anno_path in tqdm(anno_pathes):
-        if "anno" in anno_path:
-            im_path = anno_path.replace("json", "jpg").replace(
-                "anno", "playerTrackingFrames"
-            )
-        elif "third_task" in anno_path:
-            im_path = anno_path.replace("json", "jpg").replace(
-                "third_task", "playerTrackingFrames2"
-            )
-        else:
+        json_data = load_annotation(anno_path, index)
+        size = frame_size(im_path, json_data)
+        if size is None:
+            continue
+        if not any(shape.label.isdigit() for shape in json_data.shapes):
             continue
 
-        im = Image.open(im_path)
+        folder_name = os.path.split(os.path.split(anno_path)[0])[1]
+        if folder_name not in list_folder:
+            class_name += 13
+            list_folder.append(folder_name)
 
-        # im_w, im_h = im.size
+        crops = []
+        for label, box in player_boxes(json_data, *size):
+            crops.append((label + class_name, box, i))
+            i += 1
+        if crops:
+            frames.append((im_path, frame, crops))
+    return frames
 
-        with open(anno_path, "r") as f:
-            json_data = json.load(f)
 
-        labels = []
-        for shape in json_data["shapes"]:
-            label = shape["label"]
+def assign_parts(frames):
+    """
+    Decides the Market1501 part of every crop before anything is written.
+    Identities with fewer than 10 crops are dropped.
 
-            if label.isdigit():
-                label = int(label)
-                points = shape["points"]
+    :return: dict crop number -> part
+    """
+    by_pid = defaultdict(list)
+    for _, _, crops in frames:
+        for pid, _, i in crops:
+            by_pid[pid].append(i)
+
+    parts = {}
+    for pid, items in by_pid.items():
+        if len(items) < 10:
+            continue
+        for part, data in zip(PARTS, split_identity(items)):
+            for i in data:
+                parts[i] = part
 
-                folder_name = os.path.split(os.path.split(anno_path)[0])[1]
+    identities = sum(len(v) >= 10 for v in by_pid.values())
+    print(f"Number of identities: {identities}")
+    return parts
 
-                if folder_name not in list_folder:
-                    class_name += 13
-                    list_folder.append(folder_name)
 
-                save_path = os.path.join(output_filepath, f"{label + class_name}")
-                if not os.path.exists(save_path):
-                    os.makedirs(save_path)
+def crop_name(pid, i, part, ext=".jpg"):
+    # query crops are treated as the second camera
+    camid = 2 if part == "query" else 1
+    return f"{pid}_c{camid}_{i}{ext}"
 
-                x1, y1 = points[0]
-                x2, y2 = points[1]
 
-                x1 = int(x1)
-                y1 = int(y1)
-                x2 = int(x2)
-                y2 = int(y2)
+def extract_crops(task):
+    """
+    Decodes the crops of one frame (see jpeg_crops: only the blocks under
+    the boxes with turbojpeg, else the whole frame), pads and resizes
+    them. Runs in a pool worker; the crops are encoded and written by the
+    CropWriter of the main process.
 
-                if x1 > x2:
-                    x1, x2 = x2, x1
-                if y1 > y2:
-                    y1, y2 = y2, y1
+    With reduce > 1 the JPEG is decoded at 1/reduce resolution (DCT
+    scaling) and the boxes are scaled to match. resize is the
+    (mode, (width, height)) pair for crop_resize.resize_crop.
 
-                crop_img = im.crop((x1, y1, x2, y2))
-                crop_img.save(
-                    os.path.join(
-                        save_path,
-                        f"{label + class_name}" + "_c1_" + str(i) + ".jpg",
-                    )
-                )
-                i += 1
+    :return: list of (pid, crop number, part, geometry, image)
+    """
+    im_path, frame, crops, reduce, decoder, resize = task
+    mode, size = resize
+    boxes = [
+        (max(x1, 0), max(y1, 0), x2, y2) for _, (x1, y1, x2, y2), _, _ in crops
+    ]
+    images, _ = read_crops(im_path, boxes, reduce, decoder)
+    if images is None:
+        print(f"Cannot read {im_path}, skipped")
+        return []
+
+    results = []
+    for (pid, (x1, y1, x2, y2), i, part), image in zip(crops, images):
+        # As Image.crop: the part of the box outside the frame is black
+        top, left = (max(y1, 0) - y1) // reduce, (max(x1, 0) - x1) // reduce
+        bottom = max((y2 - y1) // reduce - top - image.shape[0], 0)
+        right = max((x2 - x1) // reduce - left - image.shape[1], 0)
+        image = np.pad(image, ((top, bottom), (left, right), (0, 0)))
+        image, content = resize_crop(image, size, mode)
+        results.append((pid, i, part, (x1, y1, x2, y2) + content, image))
+    return results
+
+
+def submit_crops(crop_writer, output_root, frame, results, writers):
+    """
+    Queues the crops of one frame in crop_writer: to the shard of their
+    part in packed mode, else to their Market1501 file.
 
-    root_folder = output_filepath  # Replace with the actual path to your root folder
+    :return: geometry rows of the crop files
+    """
+    geometry_rows = []
+    for pid, i, part, geometry, image in results:
+        if writers:
+            camid = 1 if part == "query" else 0
+            crop_writer.submit(image, on_encoded=partial(
+                writers[part].add, pid=pid, camid=camid, frame=frame,
+                geometry=geometry,
+            ))
+        else:
+            name = crop_name(pid, i, part, crop_writer.ext)
+            crop_writer.submit(image, os.path.join(output_root, part, name))
+            geometry_rows.append((part, name, frame) + geometry)
+    return geometry_rows
 
-    folders = ["train", "test", "valid", "config"]
-    # Get a list of directories within the root folder
-    directories = [
-        name
-        for name in os.listdir(root_folder)
-        if (os.path.isdir(os.path.join(root_folder, name)) & (name not in folders))
-    ]
 
-    # Count the number of directories
-    num_folders = len(directories)
+def build_tasks(frames, parts, reduce, decoder, resize):
+    """
+    extract_crops tasks of the frames that have crops in `parts` (see
+    assign_parts).
+    """
+    tasks = []
+    for im_path, frame, crops in frames:
+        crops = [
+            (pid, box, i, parts[i]) for pid, box, i in crops if i in parts
+        ]
+        if crops:
+            tasks.append((im_path, frame, crops, reduce, decoder, resize))
+    return tasks
 
-    print(f"Number of folders in {root_folder}: {num_folders}")
 
-    os.makedirs(os.path.join(root_folder, "market1501"), exist_ok=True)
-    root_folder = os.path.join(root_folder, "market1501")
+def build_plan(tasks, packed, reduce, decoder, encoding, resize):
+    """
+    Everything that decides the output of a build: the options and a
+    digest of the frames, crop numbers and parts. A journal is only
+    resumed by a build with the same plan.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for im_path, frame, crops, *_ in tasks:
+        digest.update(json.dumps([im_path, frame, crops]).encode())
+    ext, params = encoding
+    return {
+        "packed": packed,
+        "reduce": reduce,
+        "decoder": decoder,
+        "ext": ext,
+        "params": list(params),
+        "resize": [resize[0], list(resize[1] or ())],
+        "tasks": digest.hexdigest(),
+    }
+
+
+def checkpoint(
+    journal, crop_writer, frames, writers, journaled, geometry_rows
+):
+    """
+    Records that the crops of `frames` are written. The queue of
+    crop_writer and the packed shards are flushed first and the new index
+    rows of the shards go into the same record, so a resumed build
+    rebuilds the index from the journal. Without shards
+    the record carries the geometry rows of the crop files instead.
+    """
+    crop_writer.flush()
+    record = {"frames": frames}
+    if not writers:
+        record["geometry"] = geometry_rows
+    else:
+        record["records"] = {}
+        for part, writer in writers.items():
+            writer.flush()
+            record["records"][part] = writer.records(journaled[part])
+            journaled[part] = len(writer)
+    journal.append(record)
+    journal.flush()
+
+
+def open_journal(output_root, packed, plan):
+    """
+    Creates the output folders and opens their journal; a journal of
+    another plan is a click error.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    if not packed:
+        for part in PARTS:
+            os.makedirs(os.path.join(output_root, part), exist_ok=True)
+    try:
+        return Journal(os.path.join(output_root, JOURNAL_NAME), plan)
+    except JournalMismatch as e:
+        raise click.ClickException(f"{e}, remove {output_root} to rebuild it")
 
-    print("Create a dataset structure!")
-    for d in tqdm(directories):
-        path = os.path.split(root_folder)[0]
-        curent_folder = os.path.join(path, d)
-        list_pathes = os.listdir(curent_folder)
 
-        if len(list_pathes) < 10:
-            shutil.rmtree(curent_folder)
-            continue
+def resume(journal, tasks):
+    """
+    Frames finished by an interrupted run are skipped; their crops (and
+    in packed mode the index rows) are already on disk.
 
-        train_data, eval_data = train_test_split(
-            list_pathes, test_size=0.1, random_state=42
+    :return: (tasks left, dict part -> journaled index rows)
+    """
+    done = set()
+    records = defaultdict(list)
+    for record in journal.records:
+        done.update(record["frames"])
+        for part, rows in record.get("records", {}).items():
+            records[part].extend(rows)
+    if done:
+        print(f"Resuming: {len(done)} of {len(tasks)} frames already done")
+    return [task for task in tasks if task[1] not in done], records
+
+
+def write_crops(tasks, workers, crop_writer, journal, output_root, writers):
+    """
+    Runs extract_crops on the tasks in a pool of `workers` processes and
+    queues the crops in crop_writer, checkpointing the journal every
+    CHECKPOINT_FRAMES frames.
+    """
+    journaled = {part: len(writer) for part, writer in writers.items()}
+    finished = []
+    finished_geometry = []
+    with Pool(workers) as pool:
+        results = pool.imap(
+            extract_crops,
+            tasks,
+            chunksize=max(1, len(tasks) // (workers * 16)),
         )
-        train_data, test_data = train_test_split(
-            train_data, test_size=0.55, random_state=42
+        for task, frame_crops in zip(tasks, tqdm(results, total=len(tasks))):
+            finished_geometry.extend(submit_crops(
+                crop_writer, output_root, task[1], frame_crops, writers
+            ))
+            finished.append(task[1])
+            if len(finished) == CHECKPOINT_FRAMES:
+                checkpoint(
+                    journal, crop_writer, finished, writers, journaled,
+                    finished_geometry,
+                )
+                finished = []
+                finished_geometry = []
+    checkpoint(
+        journal, crop_writer, finished, writers, journaled, finished_geometry
+    )
+
+
+def write_geometry(path, journal):
+    """
+    Writes the geometry of every crop file recorded in the journal to a
+    csv: part, name, frame and GEOMETRY_FIELDS (see crop_store).
+    """
+    with atomic_path(path) as tmp_path, open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("part", "name", "frame") + GEOMETRY_FIELDS)
+        for record in journal.records:
+            writer.writerows(record["geometry"])
+
+
+@click.command()
+@click.argument("input_filepath", type=click.Path(exists=True))
+@click.argument("output_filepath", type=click.Path())
+@click.option(
+    "--packed",
+    is_flag=True,
+    help="Write each split as one packed shard instead of jpg folders.",
+)
+@click.option(
+    "--workers",
+    default=os.cpu_count(),
+    type=int,
+    help="Number of processes decoding frames.",
+)
+@click.option(
+    "--encode-workers",
+    default=4,
+    type=int,
+    help="Threads encoding and writing crops.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    default=None,
+    type=click.Path(exists=True),
+    help="Annotation index built by sequence_index.py.",
+)
+@click.option(
+    "--reduce",
+    default="1",
+    type=click.Choice(["1", "2", "4", "8"]),
+    help="Decode frames at 1/N resolution, for crops resized down later.",
+)
+@click.option(
+    "--decoder",
+    default="auto",
+    type=click.Choice(BACKENDS),
+    help="turbojpeg decodes only the blocks under the crops; "
+    "auto falls back to a full decode.",
+)
+@click.option(
+    "--format",
+    "fmt",
+    default="jpg",
+    type=click.Choice(sorted(FORMATS)),
+    help="Crop image format. torchreid's market1501 reader expects jpg.",
+)
+@click.option(
+    "--quality",
+    default=None,
+    type=int,
+    help="jpg/webp quality (webp 101 is lossless) or png compression 0-9. "
+    f"Defaults to {DEFAULT_JPEG_QUALITY} for jpg, "
+    "the encoder default otherwise.",
+)
+@click.option(
+    "--resize",
+    default="none",
+    type=click.Choice(RESIZE_MODES),
+    help="Resize (stretch) or letterbox the crops to the input size of the "
+    "training config, so the loader does not resize them every epoch.",
+)
+@click.option(
+    "--config",
+    "config_path",
+    default=DEFAULT_CONFIG,
+    type=click.Path(exists=True),
+    help="Training config with data.height and data.width for --resize.",
+)
+def main(
+    input_filepath,
+    output_filepath,
+    packed,
+    workers,
+    encode_workers,
+    index_path,
+    reduce,
+    decoder,
+    fmt,
+    quality,
+    resize,
+    config_path,
+):
+    """
+    The main function of this module is to create a dataset for the
+    training and testing of a neural network.
+    The function takes two arguments:
+        1) input_filepath - The path to the folder containing all the
+           images and annotations.
+        2) output_filepath - The path where you want your new dataset to
+           be saved.
+
+    The split of every crop is decided from the annotations first, then a
+    pool of workers decodes each frame once and a CropWriter encodes and
+    writes its crops directly to
+    market1501/{bounding_box_train,query,bounding_box_test}.
+
+    With --packed the crops are written to
+    market1501_packed/{bounding_box_train,query,bounding_box_test}.bin
+    with an index of offset, length, pid, camid, frame and crop geometry
+    (see crop_store). The jpg folders get the geometry in
+    market1501/geometry.csv.
+
+    With --resize every crop is stored at the height/width of the
+    training config (stretched or letterboxed), so resizing happens once
+    here instead of in the loader every epoch.
+
+    Progress is journaled in .progress.jsonl of the output folder: if the
+    build is interrupted, rerunning the same command continues after the
+    last checkpointed frame. Every crop is written to a temporary file
+    and renamed, so no truncated image is left behind.
+
+    :param input_filepath: Specify the path to the folder containing all
+        of your images
+    :param output_filepath: Specify the path to the directory where you
+        want to save your data
+    :param packed: Write packed shards instead of the Market1501 folder layout
+    :param workers: Number of processes decoding frames
+    :param encode_workers: Number of threads encoding and writing crops
+    :param index_path: Read annotations from this sequence index
+    :param reduce: Decode frames at 1/reduce resolution
+    :param decoder: Crop decoding backend (see jpeg_crops)
+    :param fmt: Crop image format (jpg, png or webp)
+    :param quality: Encoder quality, see crop_writer.FORMATS
+    :param resize: none, stretch or letterbox to the training input size
+    :param config_path: Training config the input size is read from
+    """
+
+    if packed:
+        output_root = os.path.join(output_filepath, "market1501_packed")
+    else:
+        output_root = os.path.join(output_filepath, "market1501")
+    if is_partial_output(output_root):
+        raise click.ClickException(
+            f"{output_root} is not empty and has no {JOURNAL_NAME}, "
+            "so it was not written by a resumable build"
         )
 
-        copy_files(train_data, curent_folder, "bounding_box_train")
-        copy_files(eval_data, curent_folder, "query")
-        copy_files(test_data, curent_folder, "bounding_box_test")
+    index = SequenceIndex.load(index_path) if index_path else None
+    frames = collect_crops(input_filepath, index)
+
+    if fmt == "jpg" and quality is None:
+        quality = DEFAULT_JPEG_QUALITY
+    encoding = encode_params(fmt, quality)
+    size = read_train_size(config_path) if resize != "none" else None
+
+    tasks = build_tasks(
+        frames, assign_parts(frames), int(reduce), decoder, (resize, size)
+    )
+
+    journal = open_journal(
+        output_root,
+        packed,
+        build_plan(
+            tasks, packed, int(reduce), decoder, encoding, (resize, size)
+        ),
+    )
+    tasks, records = resume(journal, tasks)
+
+    writers = {}
+    if packed:
+        writers = {
+            part: PackedCropWriter(output_root, part, records[part])
+            for part in PARTS
+        }
 
-        # os.removedirs(curent_folder)
-        shutil.rmtree(curent_folder)
+    print("Create a dataset structure!")
+    crop_writer = CropWriter(fmt, quality, encode_workers)
+    write_crops(tasks, workers, crop_writer, journal, output_root, writers)
+    crop_writer.close()
+    journal.close()
+    print(f"{fmt}: {crop_writer.stats.report()}")
+
+    for writer in writers.values():
+        writer.close()
+    if not packed:
+        write_geometry(os.path.join(output_root, "geometry.csv"), journal)
 
     print("Done!")
 
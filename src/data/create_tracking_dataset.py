@@ -1,22 +1,78 @@
-import json
 import os
 import shutil
 import click
 import numpy as np
 from tqdm import tqdm
 
+from src.data.checkpoint import (
+    JOURNAL_NAME,
+    Journal,
+    JournalMismatch,
+    atomic_path,
+    atomic_write,
+    is_partial_output,
+)
+from src.data.sequence_index import SequenceIndex, load_annotation
+
+TEST_ROOT = "yolo_tracking\\examples\\val_utils\\data\\ncaa_dataset\\test"
+
+
+def copy_frame(src, dst):
+    """
+    Копирует кадр через временный файл. Кадр, уже скопированный
+    прерванным запуском (тот же размер), не копируется повторно.
+    """
+    if os.path.exists(dst) and os.path.getsize(dst) == os.path.getsize(src):
+        return
+    with atomic_path(dst) as tmp_path:
+        shutil.copy(src, tmp_path)
+
 
 @click.command()
 @click.argument("folder_path", type=click.Path(exists=True))
-def create_test_dataset(folder_path):
+@click.option(
+    "--index",
+    "index_path",
+    default=None,
+    type=click.Path(exists=True),
+    help="Индекс аннотаций (sequence_index) вместо чтения json.",
+)
+def create_test_dataset(folder_path, index_path):
+    """
+    Копирует кадры каждой папки folder_path в последовательность
+    ncaa_dataset-0N и пишет для неё gt.txt и seqinfo.ini. Завершённые
+    папки отмечаются в журнале, повторный запуск после прерывания
+    продолжает с первой незавершённой.
+    """
     num = 1
+    index = SequenceIndex.load(index_path) if index_path else None
 
     folders_list = os.listdir(folder_path)
     folders_list.sort()
 
+    # Папка старого запуска без журнала: продолжить её нельзя, новые
+    # последовательности смешались бы со старыми
+    if is_partial_output(TEST_ROOT):
+        raise click.ClickException(
+            f"{TEST_ROOT} is not empty and has no {JOURNAL_NAME}, "
+            "so it was not written by a resumable run"
+        )
+    os.makedirs(TEST_ROOT, exist_ok=True)
+    plan = {"input": os.path.abspath(folder_path), "folders": folders_list}
+    try:
+        journal = Journal(os.path.join(TEST_ROOT, JOURNAL_NAME), plan)
+    except JournalMismatch as e:
+        raise click.ClickException(str(e))
+    done = {record["folder"] for record in journal.records}
+
     for folder in folders_list:
+        if folder in done:
+            print(f"Папка {folder} уже скопирована")
+            num += 1
+            continue
+
         print(f"Копирование папки {folder}")
-        store_path_img = f"yolo_tracking\\examples\\val_utils\\data\\ncaa_dataset\\test\\ncaa_dataset-0{num}\\img1"
+        store_path_img = f"{TEST_ROOT}\\ncaa_dataset-0{num}\\img1"
         os.makedirs(store_path_img, exist_ok=True)
 
         # store_path_annos = f"data\\ncaa_dataset\\annos"
@@ -29,20 +85,25 @@ def create_test_dataset(folder_path):
 
         for img in tqdm(img_list):
             img_path = os.path.join(full_folder_path, img)
-            shutil.copy(img_path, os.path.join(store_path_img, img))
+            copy_frame(img_path, os.path.join(store_path_img, img))
             """
             anno = img.replace("jpg", "json")
             anno_file = folder + '_' + anno
             anno_path = os.path.join(full_anno_folder_path, anno)
 
             if os.path.exists(anno_path):
-                shutil.copy(anno_path, os.path.join(store_path_annos, anno_file))
+                shutil.copy(
+                    anno_path, os.path.join(store_path_annos, anno_file)
+                )
             """
-        create_gt_file(full_folder_path, num)
+        create_gt_file(full_folder_path, num, index)
+        journal.append({"folder": folder})
+        journal.flush()
         num += 1
+    journal.close()
 
 
-def create_gt_file(full_folder_path, num):
+def create_gt_file(full_folder_path, num, index=None):
     imgs_paths = full_folder_path
 
     list_images = os.listdir(imgs_paths)
@@ -50,17 +111,16 @@ def create_gt_file(full_folder_path, num):
     print()
     print("Создаем gt_file")
 
-    path_to_gt = f"yolo_tracking\\examples\\val_utils\\data\\ncaa_dataset\\test\\ncaa_dataset-0{num}\\gt"
+    path_to_gt = f"{TEST_ROOT}\\ncaa_dataset-0{num}\\gt"
     os.makedirs(path_to_gt, exist_ok=True)
     path_to_gt = os.path.join(path_to_gt, "gt.txt")
 
-    path_to_ini = f"yolo_tracking\\examples\\val_utils\\data\\ncaa_dataset\\test\\ncaa_dataset-0{num}\\seqinfo.ini"
+    path_to_ini = f"{TEST_ROOT}\\ncaa_dataset-0{num}\\seqinfo.ini"
 
-    with open(path_to_ini, "w") as f:
-        f.write("[Sequence]\n")
-        f.write(f"seqLength={len(list_images)}")
+    atomic_write(path_to_ini, f"[Sequence]\nseqLength={len(list_images)}")
 
-    with open(path_to_gt, "w") as output_file:
+    with atomic_path(path_to_gt) as tmp_path, \
+            open(tmp_path, "w") as output_file:
         for i, img in enumerate(tqdm(list_images), start=1):
             anno = img.replace("jpg", "json")
             anno_path = os.path.join(full_folder_path, anno)
@@ -69,23 +129,25 @@ def create_gt_file(full_folder_path, num):
             if not os.path.exists(anno_path):
                 continue
 
-            with open(anno_path, "r") as f:
-                data = json.load(f)
+            data = load_annotation(anno_path, index)
 
-            for shape in data["shapes"]:
-                label = shape["label"]
+            for shape in data.shapes:
+                label = shape.label
                 if label.isdigit():
                     label_str = str(np.abs(int(label)))
                     # Извлечение координат прямоугольника
-                    x1, y1 = shape["points"][0]
-                    x2, y2 = shape["points"][1]
+                    x1, y1 = shape.points[0]
+                    x2, y2 = shape.points[1]
 
                     x1 = int(x1)
                     y1 = int(y1)
                     width = int(np.abs((x2 - x1)))
                     height = int(np.abs((y2 - y1)))
 
-                    line = f"{i} {label_str} {x1:.0f} {y1:.0f} {width:.0f} {height:.0f} 0 1 0 0\n"
+                    line = (
+                        f"{i} {label_str} {x1:.0f} {y1:.0f} "
+                        f"{width:.0f} {height:.0f} 0 1 0 0\n"
+                    )
 
                     output_file.write(line)
 
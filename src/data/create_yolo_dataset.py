@@ -1,341 +1,307 @@
 # -*- coding: utf-8 -*-
-import json
+import itertools
 import os
-import shutil
-from tqdm import tqdm
-import numpy as np
+import time
+from multiprocessing import Pool
 
-# import click
 import click
-import logging
-from pathlib import Path
+import numpy as np
+from tqdm import tqdm
 
-import pandas as pd
-from sklearn.model_selection import train_test_split
-#from dotenv import find_dotenv, load_dotenv
+from src.data.checkpoint import atomic_write
+from src.data.labelme import read_annotation
+from src.data.manifest import Manifest, file_signature, is_unchanged
+from src.data.materialize import MODES, materialize
+from src.data.sequence_index import SequenceIndex
+from src.data.split_dataset import SPLITS, iter_splits, write_splits
 
-@click.command()
-@click.argument('input_filepath', type=click.Path(exists=True))
-def make_pathes_list_jpg(input_filepath):
+# Через сколько кадров записи манифеста сбрасываются на диск: при
+# прерывании теряется не больше стольких уже сконвертированных кадров
+CHECKPOINT_FRAMES = 256
+
+# Разбиение по играм, пишется рядом с манифестом в корне датасета
+SPLITS_NAME = "ncaa_splits.csv"
+
+
+def anno_path_for(frame_path):
+    """Возвращает путь к LabelMe-аннотации для кадра."""
+    path, file_name = os.path.split(frame_path)
+
+    if "playerTrackingFrames2" in path:
+        path = path.replace("playerTrackingFrames2", "third_task")
+    elif "playerTrackingFrames" in path:
+        path = path.replace("playerTrackingFrames", "anno")
+
+    return os.path.join(path, file_name.replace("jpg", "json"))
+
+
+def output_name(frame_path, input_dir):
     """
-    Функция создает список путей к файлам формата jpg в заданных директориях input_filepath
-    и записывает их в txt-файлы в директории 'sport/data/interim'.
+    Имя кадра в выходной папке: путь относительно input_dir через "-",
+    например <игра>-playerTrackingFrames-<файл>. Имена уникальны, поэтому
+    одноимённые кадры разных игр не перезаписывают друг друга.
+    """
+    return os.path.relpath(frame_path, input_dir).replace(os.sep, "-")
 
-    Аргументы:
-    :param input_filepath (list): список путей к директориям с изображениями в формате jpg.
+
+def labelme_to_yolo(data):
+    """
+    Переводит прямоугольники игроков из labelme.Annotation в строки
+    разметки YOLO.
+    Каждый номер игрока учитывается в кадре один раз.
+    """
+    annotations = []
+    labels = []
+    for shape in data.shapes:
+        label = shape.label
+        if not label.isdigit() or label in labels:
+            continue
+        labels.append(label)
+
+        # Извлечение координат прямоугольника
+        x1, y1 = shape.points[0]
+        x2, y2 = shape.points[1]
+        # Вычисление центра объекта и его размеров
+        x_center = np.abs((x1 + x2) / 2 / data.image_width)
+        y_center = np.abs((y1 + y2) / 2 / data.image_height)
+        width = np.abs((x2 - x1) / data.image_width)
+        height = np.abs((y2 - y1) / data.image_height)
+
+        annotations.append(f"0 {x_center} {y_center} {width} {height}")
+    return annotations
+
+
+def convert_frame(task):
+    """
+    Размещает кадр в <split>/images (копией или ссылкой, см. materialize)
+    и пишет разметку в <split>/labels. data - аннотация из индекса
+    (см. sequence_index) или None, тогда json читается с диска.
+    Выполняется в процессе пула, возвращает ключ манифеста и запись для
+    кадра. Если кадр не удалось разместить, запись помечается failed и
+    кадр конвертируется заново при следующем запуске.
     """
-    anno_pathes_jpg = []
-    
-    for root, dirs, files in os.walk(input_filepath):
-            for file in files:
-                # проверяем, есть ли расширение файла в списке файлов текущей папки
-                if ("jpg" in file) & (('playerTrackingFrames' in root) or ('playerTrackingFrames1' in root)):
-                    # если есть, то добавляем путь в список
-                    anno_pathes_jpg.append(os.path.join(root, file))
-
-    df = pd.DataFrame(anno_pathes_jpg)
-    train_df, test_df = train_test_split(df, test_size=0.2)
-    train_df, eval_df = train_test_split(train_df, test_size=0.2)
-    train_df.to_csv(
-        os.path.join(
-            "data", "ncaa_train.csv"
-        ),
-        header=False,
-        index=False,
+    key, frame_path, file_name, split, output_dir, mode, data = task
+    image_out = os.path.join(split, "images", file_name)
+    label_out = os.path.join(split, "labels", file_name.replace("jpg", "txt"))
+    entry = {"split": split, "mode": mode, "outputs": [image_out]}
+
+    try:
+        entry["materialized"] = materialize(
+            frame_path, os.path.join(output_dir, image_out), mode
+        )
+    except Exception as e:
+        print(f"Ошибка при копировании файла {frame_path}: {e}")
+        entry["failed"] = True
+        return key, entry
+    entry["frame"] = file_signature(frame_path)
+
+    anno_path = anno_path_for(frame_path)
+    entry["anno"] = file_signature(anno_path)
+    if entry["anno"] is None:
+        if os.path.exists(os.path.join(output_dir, label_out)):
+            os.remove(os.path.join(output_dir, label_out))
+        return key, entry
+
+    if data is None:
+        data = read_annotation(anno_path)
+
+    atomic_write(
+        os.path.join(output_dir, label_out), "\n".join(labelme_to_yolo(data))
     )
-    eval_df.to_csv(
-        os.path.join(
-            "data", "ncaa_valid.csv"
-        ),
-        header=False,
-        index=False,
+    entry["outputs"].append(label_out)
+    return key, entry
+
+
+def is_up_to_date(entry, frame_path, split, mode):
+    """
+    Проверяет, что кадр и его аннотация не менялись с прошлой сборки,
+    а кадр лежит в той же выборке и был размещён в том же режиме.
+    Кадры, которые не удалось разместить, всегда устаревшие.
+    """
+    return (
+        entry is not None
+        and not entry.get("failed", False)
+        and entry["split"] == split
+        and entry.get("mode", "copy") == mode
+        and is_unchanged(entry["frame"], frame_path)
+        and is_unchanged(entry["anno"], anno_path_for(frame_path))
     )
-    test_df.to_csv(
-        os.path.join(
-            "data", "ncaa_test.csv"
-        ),
-        header=False,
-        index=False,
+
+
+def convert_dataset(tasks, workers, manifest, mode):
+    """
+    Конвертирует кадры всех выборок за один проход пулом из `workers`
+    процессов и записывает результаты в манифест. Каждые
+    CHECKPOINT_FRAMES кадров манифест сбрасывается в журнал, так что
+    повторный запуск после прерывания продолжает с этого места.
+
+    :param tasks (list): аргументы convert_frame для каждого кадра.
+    :param workers (int): количество процессов.
+    :param manifest (Manifest): манифест сборки.
+    :param mode (str): способ размещения кадров, один из MODES.
+    :return: (количество кадров, откатившихся на копирование,
+        количество кадров, которые не удалось разместить).
+    """
+    fallbacks = 0
+    failures = 0
+
+    if tasks:
+        with Pool(workers) as pool:
+            results = pool.imap_unordered(
+                convert_frame,
+                tasks,
+                chunksize=max(1, len(tasks) // (workers * 16)),
+            )
+            for done, (key, entry) in enumerate(
+                tqdm(results, total=len(tasks)), start=1
+            ):
+                manifest.update(key, entry)
+                if entry.get("failed", False):
+                    failures += 1
+                else:
+                    fallbacks += entry.get("materialized", mode) != mode
+                if done % CHECKPOINT_FRAMES == 0:
+                    manifest.checkpoint()
+    return fallbacks, failures
+
+
+def plan_frames(rows, manifest, index, output_dir, mode):
+    """
+    Сверяет кадры из rows (кадр, игра, выборка, input_dir) с манифестом:
+    выходы изменённых кадров удаляются, для них и для новых кадров
+    создаются задачи convert_frame.
+
+    :return: (ключи всех кадров источника, задачи)
+    """
+    seen = set()
+    tasks = []
+    for frame_path, _, split, input_dir in rows:
+        # Ключ манифеста не зависит от того, указан input_dir относительным
+        # или абсолютным путём
+        key = os.path.relpath(frame_path, input_dir)
+        seen.add(key)
+        entry = manifest.get(key)
+        if is_up_to_date(entry, frame_path, split, mode):
+            continue
+        if entry is not None:
+            manifest.remove_outputs(entry)
+
+        data = None
+        if index is not None:
+            row = index.find(anno_path_for(frame_path))
+            if row is not None:
+                data = index.annotation(row)
+        tasks.append(
+            (key, frame_path, output_name(frame_path, input_dir), split,
+             output_dir, mode, data)
+        )
+    return seen, tasks
+
+
+def print_report(
+    converted, total, elapsed, workers, mode, fallbacks, failures
+):
+    """Печатает скорость конвертации и число кадров с откатом и ошибками."""
+    print(
+        f"Converted {converted} frames ({total - converted} up to date) "
+        f"in {elapsed:.1f}s: {converted / max(elapsed, 1e-9):.1f} frames/s "
+        f"with {workers} workers"
     )
+    if fallbacks:
+        print(f"{fallbacks} frames fell back from {mode} to copy")
+    if failures:
+        print(f"{failures} frames failed and will be retried on the next run")
 
-    copy_jpg_fiels()
-    create_annotations()
-
-
-def copy_jpg_fiels():
-    input_dir = "data"
-    output_dir = "data\\processed"
-
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if "train" in file:
-                print("Create train folder with images!")
-                train_name = "train\\images"
-
-                if not os.path.exists(os.path.join(output_dir, train_name)):
-                    if not os.path.exists(os.path.join(output_dir, "train")):
-                        os.makedirs(os.path.join(output_dir, "train"))
-                    os.makedirs(os.path.join(output_dir, train_name))
-
-                csv_path = os.path.join(input_dir, file)
-                dataframe = pd.read_csv(csv_path, header=None)
 
-                for _, row in tqdm(dataframe.iterrows(), total=dataframe.shape[0]):
-                    path, file_name = os.path.split(row[0])
-                    _, folder = os.path.split(path)
-                    file_name = folder + "-" + file_name
-
-                    try:
-                        shutil.copyfile(
-                            row[0], os.path.join(output_dir, train_name, file_name)
-                        )
-                    except Exception as e:
-                        print(f"Ошибка при копировании файла {row}: {e}")
-                print()
-
-            elif "valid" in file:
-                print("Create valid folder with images!")
-                eval_name = "valid\\images"
-
-                if not os.path.exists(os.path.join(output_dir, eval_name)):
-                    os.makedirs(os.path.join(output_dir, "valid"))
-                    os.makedirs(os.path.join(output_dir, eval_name))
-
-                csv_path = os.path.join(input_dir, file)
-                dataframe = pd.read_csv(csv_path, header=None)
-
-                for _, row in tqdm(dataframe.iterrows(), total=dataframe.shape[0]):
-                    path, file_name = os.path.split(row[0])
-                    _, folder = os.path.split(path)
-                    file_name = folder + "-" + file_name
-
-                    try:
-                        shutil.copyfile(
-                            row[0], os.path.join(output_dir, eval_name, file_name)
-                        )
-                    except Exception as e:
-                        print(f"Ошибка при копировании файла {row}: {e}")
-                print()
-
-            elif "test" in file:
-                print("Create test folder with images!")
-                test_name = "test\\images"
-
-                if not os.path.exists(os.path.join(output_dir, test_name)):
-                    os.makedirs(os.path.join(output_dir, "test"))
-                    os.makedirs(os.path.join(output_dir, test_name))
-
-                csv_path = os.path.join(input_dir, file)
-                dataframe = pd.read_csv(csv_path, header=None)
-
-                for _, row in tqdm(dataframe.iterrows(), total=dataframe.shape[0]):
-                    path, file_name = os.path.split(row[0])
-                    _, folder = os.path.split(path)
-                    file_name = folder + "-" + file_name
-
-                    try:
-                        shutil.copyfile(
-                            row[0], os.path.join(output_dir, test_name, file_name)
-                        )
-                    except Exception as e:
-                        print(f"Ошибка при копировании файла {row}: {e}")
-                print()
-
-
-def create_annotations():
-    input_dir = "data"
-    output_dir = "data\\processed"
-
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if "train" in file:
-                print("Create train folder with annotations!")
-                train_name = "train\\labels"
-
-                if not os.path.exists(os.path.join(output_dir, train_name)):
-                    if not os.path.exists(os.path.join(output_dir, "train")):
-                        os.makedirs(os.path.join(output_dir, "train"))
-                    os.makedirs(os.path.join(output_dir, train_name))
-
-                csv_path = os.path.join(input_dir, file)
-                dataframe = pd.read_csv(csv_path, header=None)
-
-                for _, row in tqdm(dataframe.iterrows(), total=dataframe.shape[0]):
-                    path, file_name = os.path.split(row[0])
-
-                    if "playerTrackingFrames2" in path:
-                        path = path.replace("playerTrackingFrames2", "third_task")
-                    elif "playerTrackingFrames" in path:
-                        path = path.replace("playerTrackingFrames", "anno")
-
-                    _, folder = os.path.split(path)
-                    file_name_long = folder + "-" + file_name
-                    file_name = file_name.replace("jpg", "json")
-
-                    anno_path = os.path.join(path, file_name)
-
-                    if not os.path.exists(anno_path):
-                        continue
-
-                    with open(anno_path, "r") as f:
-                        data = json.load(f)
-
-                    # Создание списка строк с аннотациями для каждого изображения
-                    annotations = []
-                    labels = []
-                    for shape in data["shapes"]:
-                        label = shape['label']
-                        if label.isdigit():
-                            # Извлечение координат прямоугольника
-                            x1, y1 = shape["points"][0]
-                            x2, y2 = shape["points"][1]
-                            # Вычисление центра объекта и его размеров
-                            x_center = np.abs((x1 + x2) / 2 / data["imageWidth"])
-                            y_center = np.abs((y1 + y2) / 2 / data["imageHeight"])
-                            width = np.abs((x2 - x1) / data["imageWidth"])
-                            height = np.abs((y2 - y1) / data["imageHeight"])
-
-                            if label not in labels:
-                                labels.append(label)
-                                # Добавление строки аннотации в список
-                                annotations.append(
-                                    f"0 {x_center} {y_center} {width} {height}"
-                                )
-
-                    file_name_long = file_name_long.replace("jpg", "txt")
-                    # Запись аннотаций в файл
-                    with open(
-                        os.path.join(output_dir, train_name, file_name_long), "w"
-                    ) as f:
-                        f.write("\n".join(annotations))
-
-                print()
-
-            elif "valid" in file:
-                print("Create eval folder with annotations!")
-                eval_name = "valid\\labels"
-
-                if not os.path.exists(os.path.join(output_dir, eval_name)):
-                    if not os.path.exists(os.path.join(output_dir, "valid")):
-                        os.makedirs(os.path.join(output_dir, "valid"))
-                    os.makedirs(os.path.join(output_dir, eval_name))
-
-                csv_path = os.path.join(input_dir, file)
-                dataframe = pd.read_csv(csv_path, header=None)
-
-                for _, row in tqdm(dataframe.iterrows(), total=dataframe.shape[0]):
-                    path, file_name = os.path.split(row[0])
-
-                    if "playerTrackingFrames2" in path:
-                        path = path.replace("playerTrackingFrames2", "third_task")
-                    elif "playerTrackingFrames" in path:
-                        path = path.replace("playerTrackingFrames", "anno")
-
-                    _, folder = os.path.split(path)
-                    file_name_long = folder + "-" + file_name
-                    file_name = file_name.replace("jpg", "json")
-
-                    anno_path = os.path.join(path, file_name)
-
-                    if not os.path.exists(anno_path):
-                        continue
-
-                    with open(anno_path, "r") as f:
-                        data = json.load(f)
-
-                    # Создание списка строк с аннотациями для каждого изображения
-                    annotations = []
-                    labels = []
-                    for shape in data["shapes"]:
-                        label = shape['label']
-                        if label.isdigit():
-                            # Извлечение координат прямоугольника
-                            x1, y1 = shape["points"][0]
-                            x2, y2 = shape["points"][1]
-                            # Вычисление центра объекта и его размеров
-                            x_center = np.abs((x1 + x2) / 2 / data["imageWidth"])
-                            y_center = np.abs((y1 + y2) / 2 / data["imageHeight"])
-                            width = np.abs((x2 - x1) / data["imageWidth"])
-                            height = np.abs((y2 - y1) / data["imageHeight"])
-
-                            if label not in labels:
-                                labels.append(label)
-                                # Добавление строки аннотации в список
-                                annotations.append(
-                                    f"0 {x_center} {y_center} {width} {height}"
-                                )
-
-                    file_name_long = file_name_long.replace("jpg", "txt")
-                    # Запись аннотаций в файл
-                    with open(
-                        os.path.join(output_dir, eval_name, file_name_long), "w"
-                    ) as f:
-                        f.write("\n".join(annotations))
-                print()
-
-            elif "test" in file:
-                print("Create test folder with annotations!")
-                test_name = "test\\labels"
-
-                if not os.path.exists(os.path.join(output_dir, test_name)):
-                    if not os.path.exists(os.path.join(output_dir, "test")):
-                        os.makedirs(os.path.join(output_dir, "test"))
-                    os.makedirs(os.path.join(output_dir, test_name))
-
-                csv_path = os.path.join(input_dir, file)
-                dataframe = pd.read_csv(csv_path, header=None)
-
-                for _, row in tqdm(dataframe.iterrows(), total=dataframe.shape[0]):
-                    path, file_name = os.path.split(row[0])
-
-                    if "playerTrackingFrames2" in path:
-                        path = path.replace("playerTrackingFrames2", "third_task")
-                    elif "playerTrackingFrames" in path:
-                        path = path.replace("playerTrackingFrames", "anno")
-
-                    _, folder = os.path.split(path)
-                    file_name_long = folder + "-" + file_name
-                    file_name = file_name.replace("jpg", "json")
-
-                    anno_path = os.path.join(path, file_name)
-
-                    if not os.path.exists(anno_path):
-                        continue
-
-                    with open(anno_path, "r") as f:
-                        data = json.load(f)
-
-                    # Создание списка строк с аннотациями для каждого изображения
-                    annotations = []
-                    labels = []
-                    for shape in data["shapes"]:
-                        label = shape['label']
-                        if label.isdigit():
-                            # Извлечение координат прямоугольника
-                            x1, y1 = shape["points"][0]
-                            x2, y2 = shape["points"][1]
-                            # Вычисление центра объекта и его размеров
-                            x_center = np.abs((x1 + x2) / 2 / data["imageWidth"])
-                            y_center = np.abs((y1 + y2) / 2 / data["imageHeight"])
-                            width = np.abs((x2 - x1) / data["imageWidth"])
-                            height = np.abs((y2 - y1) / data["imageHeight"])
-
-                            if label not in labels:
-                                labels.append(label)
-                                # Добавление строки аннотации в список
-                                annotations.append(
-                                    f"0 {x_center} {y_center} {width} {height}"
-                                )
-
-                    file_name_long = file_name_long.replace("jpg", "txt")
-                    # Запись аннотаций в файл
-                    with open(
-                        os.path.join(output_dir, test_name, file_name_long), "w"
-                    ) as f:
-                        f.write("\n".join(annotations))
-                print()
+def build_dataset(
+    input_dirs, output_dir, workers, mode="copy", seed=0, index_path=None
+):
+    """
+    Инкрементально строит датасет YOLO из директорий input_dirs:
+    конвертируются только новые и изменённые кадры, а выходы кадров,
+    исчезнувших из источника, удаляются.
+
+    Кадры делятся на выборки по играм детерминированным хэшем
+    (см. split_dataset), разбиение пишется в output_dir/ncaa_splits.csv
+    в том же проходе по дереву. Кадры размещаются способом mode
+    (copy/hardlink/symlink/reflink). С index_path аннотации берутся из
+    индекса sequence_index; json читается только для файлов, изменённых
+    после построения индекса.
+    """
+    for split in SPLITS:
+        for sub in ("images", "labels"):
+            os.makedirs(os.path.join(output_dir, split, sub), exist_ok=True)
+
+    start = time.perf_counter()
+    index = SequenceIndex.load(index_path) if index_path else None
+    manifest = Manifest(output_dir)
+    rows = itertools.chain.from_iterable(
+        (row + (d,) for row in iter_splits(d, seed)) for d in input_dirs
+    )
+    rows = write_splits(rows, os.path.join(output_dir, SPLITS_NAME))
+    seen, tasks = plan_frames(rows, manifest, index, output_dir, mode)
 
+    removed = manifest.remove_missing(seen)
+    if removed:
+        print(f"Removed outputs of {removed} deleted frames")
 
-if __name__ == "__main__":
+    try:
+        fallbacks, failures = convert_dataset(tasks, workers, manifest, mode)
+    finally:
+        manifest.save()
+    elapsed = time.perf_counter() - start
+
+    print_report(
+        len(tasks), len(seen), elapsed, workers, mode, fallbacks, failures
+    )
+
+
+@click.command()
+@click.argument("input_filepath", type=click.Path(exists=True))
+@click.option(
+    "--output-dir",
+    default=os.path.join("data", "processed"),
+    type=click.Path(),
+    help="Корень выходного датасета YOLO.",
+)
+@click.option(
+    "--workers",
+    default=os.cpu_count(),
+    type=int,
+    help="Количество процессов конвертации.",
+)
+@click.option(
+    "--materialize",
+    "mode",
+    default="copy",
+    type=click.Choice(MODES),
+    help="Способ размещения кадров; при отсутствии поддержки - копия.",
+)
+@click.option("--seed", default=0, type=int, help="Соль хэша разбиения.")
+@click.option(
+    "--index",
+    "index_path",
+    default=None,
+    type=click.Path(exists=True),
+    help="Индекс аннотаций (sequence_index) вместо чтения json.",
+)
+def make_pathes_list_jpg(
+    input_filepath, output_dir, workers, mode, seed, index_path
+):
+    """
+    Функция находит кадры формата jpg в заданной директории input_filepath,
+    делит их на train/valid/test по играм и строит датасет YOLO в
+    output_dir; разбиение записывается в output_dir/ncaa_splits.csv.
+    Повторный запуск обновляет только изменившиеся кадры.
 
-    make_pathes_list_jpg()
\ No newline at end of file
+    Аргументы:
+    :param input_filepath (str): путь к директории с изображениями
+        в формате jpg.
+    """
+    build_dataset(
+        [input_filepath], output_dir, workers, mode, seed, index_path
+    )
+
+
+if __name__ == "__main__":
+    make_pathes_list_jpg()
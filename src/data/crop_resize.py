@@ -0,0 +1,63 @@
+"""
+Приведение кропов ReID к размеру входа сети при сборке датасета, чтобы
+DataLoader не масштабировал каждый кроп в каждой эпохе: torchreid
+Resize для кропа уже нужного размера ничего не пересчитывает.
+"""
+import cv2
+import numpy as np
+import yaml
+
+RESIZE_MODES = ("none", "stretch", "letterbox")
+
+
+def read_train_size(config_path):
+    """
+    (ширина, высота) входа сети из data.width/data.height конфига
+    обучения.
+    """
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    return int(config["data"]["width"]), int(config["data"]["height"])
+
+
+def fit_rect(width, height, size=None, mode="none"):
+    """
+    Куда попадает кроп width x height в выходном кропе:
+    (left, top, ширина, высота) содержимого и размер выходного кропа.
+    stretch растягивает кроп на весь size, letterbox вписывает с
+    сохранением пропорций и полями по краям.
+    """
+    if mode == "none" or size is None:
+        return (0, 0, width, height), (width, height)
+
+    out_w, out_h = size
+    if mode == "stretch":
+        return (0, 0, out_w, out_h), size
+
+    scale = min(out_w / width, out_h / height)
+    w = min(max(round(width * scale), 1), out_w)
+    h = min(max(round(height * scale), 1), out_h)
+    return ((out_w - w) // 2, (out_h - h) // 2, w, h), size
+
+
+def resize_crop(image, size=None, mode="none"):
+    """
+    Масштабирует кроп (numpy HxWxC) по fit_rect: INTER_AREA при
+    уменьшении, INTER_LINEAR при увеличении; поля letterbox чёрные.
+
+    :return: (кроп, (left, top, ширина, высота) содержимого)
+    """
+    height, width = image.shape[:2]
+    (left, top, w, h), (out_w, out_h) = fit_rect(width, height, size, mode)
+    if (w, h) == (width, height) and (out_w, out_h) == (w, h):
+        return image, (left, top, w, h)
+
+    shrink = w * h < width * height
+    interpolation = cv2.INTER_AREA if shrink else cv2.INTER_LINEAR
+    resized = cv2.resize(image, (w, h), interpolation=interpolation)
+    if (out_w, out_h) == (w, h):
+        return resized, (left, top, w, h)
+
+    canvas = np.zeros((out_h, out_w) + image.shape[2:], dtype=image.dtype)
+    canvas[top:top + h, left:left + w] = resized
+    return canvas, (left, top, w, h)
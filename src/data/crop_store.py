@@ -0,0 +1,180 @@
+"""
+Упакованное хранилище кропов для ReID: вместо миллионов маленьких jpg
+каждая выборка хранится одним бинарным файлом <split>.bin с закодированными
+кропами подряд и индексом <split>.idx.npy (offset, length, pid, camid, frame
+и геометрия кропа, см. GEOMETRY_FIELDS).
+
+Чтение идёт через mmap: кроп отдаётся как срез memoryview без копирования
+и декодируется прямо из отображённой памяти.
+"""
+import mmap
+import os
+
+import cv2
+import numpy as np
+
+from src.data.checkpoint import atomic_path
+
+# Геометрия кропа: бокс x1, y1, x2, y2 в пикселях исходного кадра и
+# прямоугольник left, top, width, height, который он занимает в
+# сохранённом кропе (после уменьшения при декодировании, растяжения или
+# letterbox). Точка кропа (u, v) соответствует точке кадра
+# x1 + (u - left) * (x2 - x1) / width, y1 + (v - top) * (y2 - y1) / height.
+# -1, если геометрия неизвестна.
+GEOMETRY_FIELDS = ("x1", "y1", "x2", "y2", "left", "top", "width", "height")
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("offset", "<u8"),
+        ("length", "<u4"),
+        ("pid", "<i4"),
+        ("camid", "<i4"),
+        ("frame", "<i8"),
+    ]
+    + [(field, "<i4") for field in GEOMETRY_FIELDS]
+)
+
+NO_GEOMETRY = (-1,) * len(GEOMETRY_FIELDS)
+
+
+def shard_paths(root, split):
+    return (
+        os.path.join(root, f"{split}.bin"),
+        os.path.join(root, f"{split}.idx.npy"),
+    )
+
+
+class PackedCropWriter:
+    """
+    Последовательно дописывает закодированные кропы в <split>.bin,
+    индекс сохраняется при закрытии.
+
+    records - строки индекса (INDEX_DTYPE) кропов,
+    уже записанных прерванной сборкой (из её журнала): <split>.bin
+    обрезается по последнему из них и дописывается дальше.
+    """
+
+    def __init__(self, root, split, records=()):
+        os.makedirs(root, exist_ok=True)
+        self.bin_path, self.idx_path = shard_paths(root, split)
+        self._records = [tuple(record) for record in records]
+        self._offset = sum(record[1] for record in self._records)
+        if not self._records:
+            self._file = open(self.bin_path, "wb")
+            return
+
+        self._file = open(self.bin_path, "r+b")
+        if os.fstat(self._file.fileno()).st_size < self._offset:
+            self._file.close()
+            raise ValueError(f"{self.bin_path} is shorter than its journal")
+        self._file.truncate(self._offset)
+        self._file.seek(self._offset)
+
+    def add(self, data, pid, camid, frame=-1, geometry=NO_GEOMETRY):
+        """
+        Добавляет закодированный кроп (bytes) с геометрией (GEOMETRY_FIELDS),
+        возвращает его номер.
+        """
+        self._file.write(data)
+        self._records.append(
+            (self._offset, len(data), pid, camid, frame) + tuple(geometry)
+        )
+        self._offset += len(data)
+        return len(self._records) - 1
+
+    def __len__(self):
+        return len(self._records)
+
+    def records(self, start=0):
+        """Строки индекса кропов, начиная с номера start."""
+        return self._records[start:]
+
+    def flush(self):
+        """Сбрасывает записанные кропы на диск, например перед журналом."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        with atomic_path(self.idx_path) as tmp_path, open(tmp_path, "wb") as f:
+            np.save(f, np.array(self._records, dtype=INDEX_DTYPE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackedCropStore:
+    """
+    Чтение кропов выборки через mmap. Индекс тоже отображается в память,
+    поэтому открытие хранилища не зависит от количества кропов.
+    Объект можно передавать в процессы DataLoader: отображение
+    открывается заново в каждом процессе при первом обращении.
+    """
+
+    def __init__(self, root, split):
+        self.root = root
+        self.split = split
+        self.bin_path, self.idx_path = shard_paths(root, split)
+        self.index = np.load(self.idx_path, mmap_mode="r")
+        self._mmap = None
+        self._view = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def _open(self):
+        with open(self.bin_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                self._view = memoryview(b"")
+                return
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def raw(self, i):
+        """Закодированный кроп i как memoryview на отображённый файл."""
+        if self._view is None:
+            self._open()
+        record = self.index[i]
+        offset = int(record["offset"])
+        return self._view[offset:offset + int(record["length"])]
+
+    def read(self, i):
+        """Декодированный кроп i в BGR, как cv2.imread."""
+        buf = np.frombuffer(self.raw(i), dtype=np.uint8)
+        return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+    def __getitem__(self, i):
+        record = self.index[i]
+        return self.read(i), int(record["pid"]), int(record["camid"])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_mmap"] = None
+        state["_view"] = None
+        state["index"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.index = np.load(self.idx_path, mmap_mode="r")
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def encode_crop(crop, ext=".jpg", params=()):
+    """Кодирует кроп (numpy BGR) в bytes для записи в хранилище."""
+    ok, buf = cv2.imencode(ext, crop, list(params))
+    if not ok:
+        raise ValueError("Failed to encode crop")
+    return buf.tobytes()
@@ -0,0 +1,113 @@
+"""
+Фоновое кодирование и запись кропов: пул потоков кодирует кропы
+(cv2.imencode отпускает GIL) и пишет файлы, пока основной поток
+декодирует следующие кадры. Очередь ограничена, так что память не
+растёт, если кодирование не успевает за декодированием.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from src.data.checkpoint import atomic_write
+from src.data.crop_store import encode_crop
+
+# Формат -> (расширение, параметр качества cv2). Для png качество - это
+# степень сжатия 0-9 (без потерь); webp с качеством 101 - без потерь
+FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def encode_params(fmt, quality=None):
+    """Расширение и параметры cv2.imencode для формата и качества."""
+    ext, flag = FORMATS[fmt]
+    return ext, () if quality is None else (flag, int(quality))
+
+
+class EncodeStats:
+    """Суммарное время кодирования и размер закодированных кропов."""
+
+    def __init__(self):
+        self.crops = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def add(self, seconds, nbytes, crops=1):
+        self.crops += crops
+        self.seconds += seconds
+        self.bytes += nbytes
+
+    def report(self):
+        n = max(self.crops, 1)
+        return (
+            f"{self.crops} crops, "
+            f"encode {self.seconds / n * 1e3:.2f} ms/crop, "
+            f"{self.bytes / n / 1024:.1f} KB/crop"
+        )
+
+
+def timed_encode(crop, ext, params):
+    """encode_crop с замером времени: (bytes, секунды)."""
+    start = time.perf_counter()
+    data = encode_crop(crop, ext, params)
+    return data, time.perf_counter() - start
+
+
+def _encode_and_write(crop, ext, params, path):
+    data, seconds = timed_encode(crop, ext, params)
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, data)
+    return data, seconds
+
+
+class CropWriter:
+    """
+    Кодирует кропы в `workers` потоках. submit возвращается сразу, пока
+    в очереди меньше `max_pending` кропов, иначе ждёт самый старый.
+
+    Кроп с path пишется в файл в фоновом потоке; для кропа без path
+    закодированные bytes передаются в on_encoded в основном потоке в
+    порядке submit (например, в PackedCropWriter.add).
+    """
+
+    def __init__(self, fmt="jpg", quality=None, workers=4, max_pending=256):
+        self.ext, self.params = encode_params(fmt, quality)
+        self.stats = EncodeStats()
+        self._pool = ThreadPoolExecutor(workers)
+        self._pending = deque()
+        self._max_pending = max_pending
+
+    def submit(self, crop, path=None, on_encoded=None):
+        self._drain(self._max_pending - 1)
+        future = self._pool.submit(
+            _encode_and_write, crop, self.ext, self.params, path
+        )
+        self._pending.append((future, on_encoded))
+
+    def _drain(self, limit):
+        while len(self._pending) > limit:
+            future, on_encoded = self._pending.popleft()
+            data, seconds = future.result()
+            self.stats.add(seconds, len(data))
+            if on_encoded is not None:
+                on_encoded(data)
+
+    def flush(self):
+        """Дожидается, пока все кропы из очереди закодированы и записаны."""
+        self._drain(0)
+
+    def close(self):
+        self.flush()
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+
+try:
+    from turbojpeg import TJPF_BGR, TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+BACKENDS = ("auto", "turbojpeg", "full")
+
+# Размер MCU (ширина, высота) по субдискретизации TJSAMP_*:
+# 444, 422, 420, GRAY, 440, 411, 441
+MCU_SIZES = [(8, 8), (16, 8), (16, 16), (8, 8), (8, 16), (32, 8), (8, 32)]
+
+REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# Экземпляр TurboJPEG на процесс; False - библиотека недоступна
+_turbo = None
+
+
+def turbo():
+    """TurboJPEG этого процесса или None, если libturbojpeg не найдена."""
+    global _turbo
+    if _turbo is None:
+        try:
+            _turbo = TurboJPEG() if TurboJPEG is not None else False
+        except (OSError, RuntimeError):
+            _turbo = False
+    return _turbo or None
+
+
+def decode_full(data, reduce=1):
+    """Декодирует весь кадр (BGR) в 1/reduce разрешения, None при ошибке."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    return cv2.imdecode(buf, REDUCED_FLAGS[reduce])
+
+
+def _crops_turbo(jpeg, data, boxes, reduce):
+    width, height, subsample, _ = jpeg.decode_header(data)
+    mcu_w, mcu_h = MCU_SIZES[subsample]
+
+    regions = []
+    for x1, y1, x2, y2 in boxes:
+        x0, y0 = x1 - x1 % mcu_w, y1 - y1 % mcu_h
+        regions.append((x0, y0, min(x2, width) - x0, min(y2, height) - y0))
+
+    crops = []
+    scaling = (1, reduce) if reduce > 1 else None
+    for (x1, y1, x2, y2), (x0, y0, _, _), part in zip(
+        boxes, regions, jpeg.crop_multiple(data, regions, copynone=True)
+    ):
+        region = jpeg.decode(
+            part, pixel_format=TJPF_BGR, scaling_factor=scaling
+        )
+        crops.append(
+            region[(y1 - y0) // reduce:(y2 - y0) // reduce,
+                   (x1 - x0) // reduce:(x2 - x0) // reduce]
+        )
+    return crops
+
+
+def decode_crops(data, boxes, reduce=1, backend="auto"):
+    """
+    Кропы (BGR) боксов x1, y1, x2, y2 одного JPEG-кадра, такие же, как
+    frame[y1 // reduce:y2 // reduce, x1 // reduce:x2 // reduce] после
+    полного декодирования в 1/reduce разрешения.
+
+    turbojpeg: без потерь вырезаются области, выровненные по MCU и
+    покрывающие боксы (crop_multiple, один проход энтропийного декодера),
+    и декодируются только они. Пиксели на краях области могут отличаться
+    от полного декодирования на единицы из-за сглаживающего
+    масштабирования цветности. Если libturbojpeg нет, кадр не JPEG или
+    боксы выходят за кадр, кадр декодируется целиком.
+
+    :return: (список кропов или None, если кадр не читается, бэкенд)
+    """
+    jpeg = turbo() if backend != "full" else None
+    if backend == "turbojpeg" and jpeg is None:
+        raise RuntimeError("libturbojpeg is not available")
+
+    boxes = [tuple(int(v) for v in box) for box in boxes]
+    inside = all(x1 >= 0 and y1 >= 0 and x2 > x1 and y2 > y1
+                 for x1, y1, x2, y2 in boxes)
+    if jpeg is not None and boxes and inside and data[:2] == b"\xff\xd8":
+        try:
+            return _crops_turbo(jpeg, data, boxes, reduce), "turbojpeg"
+        except (OSError, ValueError):
+            pass
+
+    frame = decode_full(data, reduce)
+    if frame is None:
+        return None, "full"
+    r = reduce
+    return [frame[y1 // r:y2 // r, x1 // r:x2 // r]
+            for x1, y1, x2, y2 in boxes], "full"
+
+
+def read_crops(path, boxes, reduce=1, backend="auto"):
+    """decode_crops для файла кадра; (None, бэкенд), если файла нет."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, "full"
+    return decode_crops(data, boxes, reduce, backend)
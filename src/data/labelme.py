@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import json
+from typing import List, NamedTuple, Optional
+
+from PIL import Image
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_IMAGE_DATA = b'"imageData"'
+
+if msgspec is not None:
+    BACKEND = "msgspec"
+
+    class Shape(msgspec.Struct):
+        label: str
+        points: List[List[float]]
+
+    class Annotation(msgspec.Struct, rename="camel"):
+        """
+        Нужные поля LabelMe-аннотации. msgspec пропускает остальные поля,
+        не создавая для них Python-объектов. null в imageWidth/imageHeight
+        становится 0, как при разборе orjson/json.
+        """
+
+        shapes: List[Shape]
+        image_width: Optional[int] = None
+        image_height: Optional[int] = None
+
+        def __post_init__(self):
+            self.image_width = self.image_width or 0
+            self.image_height = self.image_height or 0
+
+    _decoder = msgspec.json.Decoder(Annotation)
+
+else:
+    BACKEND = "orjson" if orjson is not None else "json"
+
+    class Shape(NamedTuple):
+        label: str
+        points: List[List[float]]
+
+    class Annotation(NamedTuple):
+        """Нужные поля LabelMe-аннотации."""
+
+        shapes: List[Shape]
+        image_width: int = 0
+        image_height: int = 0
+
+
+def strip_image_data(raw):
+    """
+    Вырезает значение imageData (base64 кадра, обычно большая часть
+    файла) из байтов json до разбора. Границы строки ищутся через
+    bytes.find: в base64 нет кавычек и обратных слэшей.
+    """
+    key = raw.find(_IMAGE_DATA)
+    if key < 0:
+        return raw
+    start = raw.find(b'"', key + len(_IMAGE_DATA))
+    if start < 0 or raw[key + len(_IMAGE_DATA):start].strip() != b":":
+        return raw
+    stop = raw.find(b'"', start + 1)
+    if stop < 0:
+        return raw
+    return raw[:start] + b"null" + raw[stop + 1:]
+
+
+def decode_annotation(raw):
+    """
+    Разбирает байты LabelMe json в Annotation самым быстрым доступным
+    парсером (BACKEND): msgspec, orjson или стандартный json. imageData
+    не разбирается.
+    """
+    raw = strip_image_data(raw)
+    if msgspec is not None:
+        return _decoder.decode(raw)
+
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    return Annotation(
+        [Shape(s["label"], s["points"]) for s in data["shapes"]],
+        data.get("imageWidth") or 0,
+        data.get("imageHeight") or 0,
+    )
+
+
+def read_annotation(path):
+    """Читает LabelMe-аннотацию path в Annotation (shapes, размер кадра)."""
+    with open(path, "rb") as f:
+        return decode_annotation(f.read())
+
+
+def frame_size(image_path, annotation=None):
+    """
+    (ширина, высота) кадра без декодирования пикселей: из imageWidth/
+    imageHeight аннотации, а если их нет - из заголовка изображения
+    (PIL читает только заголовок). None, если кадр не читается.
+    """
+    if (
+        annotation is not None
+        and annotation.image_width > 0
+        and annotation.image_height > 0
+    ):
+        return annotation.image_width, annotation.image_height
+    try:
+        with Image.open(image_path) as im:
+            return im.size
+    except (FileNotFoundError, OSError):
+        return None
@@ -1,17 +1,40 @@
 import argparse
 import glob
-import json
+import hashlib
+import itertools
 import os
+from collections import Counter
+from functools import partial
 
-import cv2
 import numpy as np
 from tqdm import tqdm
 
-ROJECT_ROOT = '~/Projects/track_sport'
+from src.data.checkpoint import (JOURNAL_NAME, Journal, JournalMismatch,
+                                 atomic_write, is_partial_output)
+from src.data.crop_store import PackedCropWriter
+from src.data.crop_writer import FORMATS, CropWriter
+from src.data.jpeg_crops import BACKENDS, REDUCED_FLAGS, read_crops
+from src.data.labelme import frame_size
+from src.data.sequence_index import SequenceIndex, load_annotation
+
+PROJECT_ROOT = os.path.expanduser('~/Projects/track_sport')
+
+# Кадры, в которых боксов больше этого числа, считаются плотными:
+# для них пересечения ищутся заметанием по x вместо полной матрицы N x N
+DENSE_BOXES = 32
+
+# Через сколько кадров состояние сохраняется в журнал: после прерывания
+# заново обрабатывается не больше стольких кадров
+CHECKPOINT_FRAMES = 256
+
+BOX_DTYPE = np.dtype([('track_id', '<i4'), ('x1', '<i4'), ('y1', '<i4'),
+                      ('x2', '<i4'), ('y2', '<i4')])
+
 
 def box_area(boxes):
     return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
 
+
 def _iof(boxes1, boxes2):
     area1 = box_area(boxes1)
 
@@ -24,14 +47,17 @@ def _iof(boxes1, boxes2):
     return inter / area1[:, None]
 
 
-def calc_max_iof_dict(labelme_dict, args):
-    boxes = []
-    max_iof_d = {}
-    for obj in labelme_dict['shapes']:
-        track_id = obj['label']
-        pts = obj['points']
+def parse_boxes(annotation, mode):
+    """
+    Один проход по shapes labelme.Annotation: возвращает структурированный
+    массив BOX_DTYPE
+    с боксами игроков кадра (track_id, x1, y1, x2, y2).
+    """
+    rows = []
+    for obj in annotation.shapes:
+        track_id = obj.label
 
-        if args.mode == 'ncaa':
+        if mode == 'ncaa':
             if not track_id.isdigit():
                 continue
             track_id = int(track_id)
@@ -40,32 +66,158 @@ def calc_max_iof_dict(labelme_dict, args):
         else:
             if 'j_' in track_id:
                 continue
+            track_id = int(track_id.split('_')[0])
+
+        (x, y), (x2, y2) = obj.points
+        rows.append((track_id, int(x), int(y), int(x2), int(y2)))
+    return np.array(rows, dtype=BOX_DTYPE)
+
+
+def _max_iof_dense(boxes):
+    iof_matrix = _iof(boxes, boxes)
+    np.fill_diagonal(iof_matrix, 0)
+    return iof_matrix.max(axis=1)
+
+
+def _max_iof_sweep(boxes):
+    """
+    Sort-and-sweep по x: пары, пересекающиеся по x, находятся через
+    searchsorted, и IoF считается только для них, так что стоимость
+    растёт с числом пересекающихся пар, а не с N^2.
+    """
+    n = len(boxes)
+    order = np.argsort(boxes[:, 0], kind='stable')
+    xs = boxes[order, 0]
+    # Для бокса i (в порядке сортировки) кандидаты - боксы j > i,
+    # которые начинаются раньше, чем заканчивается i
+    ends = np.searchsorted(xs, boxes[order, 2], side='left')
+    counts = np.maximum(ends - np.arange(1, n + 1), 0)
+
+    first = np.repeat(np.arange(n), counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    second = first + 1 + np.arange(counts.sum()) - starts
+    first, second = order[first], order[second]
+
+    b1, b2 = boxes[first], boxes[second]
+    wh = np.minimum(b1[:, 2:], b2[:, 2:]) - np.maximum(b1[:, :2], b2[:, :2])
+    inter = np.clip(wh, 0, None).prod(axis=1)
 
-        xy1, xy2 = pts
-        x, y = xy1
-        x2, y2 = xy2
-        x, y = int(x), int(y)
-        x2, y2 = int(x2), int(y2)
-
-        crop = frame[y:y2, x:x2]
-        boxes.append([x, y, x2, y2])
-
-    boxes = np.asarray(boxes)
-    if len(boxes) == 0:
-        return {}
-    if len(boxes) == 1:
-        x, y, x2, y2 = boxes[0].tolist()
-        max_iof_d[(x, y, x2, y2)] = 0.
+    area = box_area(boxes)
+    max_iof = np.zeros(n)
+    np.maximum.at(max_iof, first, inter / area[first])
+    np.maximum.at(max_iof, second, inter / area[second])
+    return max_iof
+
+
+def max_iof(boxes, dense_boxes=DENSE_BOXES):
+    """
+    Максимальная доля площади каждого бокса (N x 4, x1 y1 x2 y2),
+    закрытая другим боксом кадра. Боксы с неположительной площадью
+    ни с чем не пересекаются.
+    """
+    result = np.zeros(len(boxes))
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    if valid.sum() < 2:
+        return result
+
+    boxes = boxes[valid].astype(np.float64)
+    if len(boxes) <= dense_boxes:
+        result[valid] = _max_iof_dense(boxes)
     else:
-        iof_matrix = _iof(boxes, boxes)
-        np.fill_diagonal(iof_matrix, 0)
-        for i in range(len(boxes)):
-            x, y, x2, y2 = boxes[i].tolist()
-            max_iof_d[(x, y, x2, y2)] = np.max(iof_matrix[i])
-    return max_iof_d
+        result[valid] = _max_iof_sweep(boxes)
+    return result
 
 
-if __name__ == '__main__':
+def _slice_len(start, stop, size):
+    # Длина среза frame[start:stop] по правилам numpy, включая
+    # отрицательные индексы
+    start = np.where(start < 0, np.maximum(start + size, 0),
+                     np.minimum(start, size))
+    stop = np.where(stop < 0, np.maximum(stop + size, 0),
+                    np.minimum(stop, size))
+    return np.maximum(stop - start, 0)
+
+
+def select_boxes(boxes, img_width, img_height, max_iof_thr):
+    """
+    Маска боксов, дающих кроп не меньше 2x2 пикселей и перекрытых
+    другими боксами не больше чем на max_iof_thr.
+    """
+    xyxy = np.stack([boxes['x1'], boxes['y1'], boxes['x2'], boxes['y2']],
+                    axis=1)
+    h = _slice_len(boxes['y1'], boxes['y2'], img_height)
+    w = _slice_len(boxes['x1'], boxes['x2'], img_width)
+    return (h >= 2) & (w >= 2) & (max_iof(xyxy) <= max_iof_thr)
+
+
+class CropTracks:
+    """
+    Состояние запуска, которое сохраняется в журнал: номер следующего
+    кадра и кропа, папки треков (видео, трек) -> номер, пути записанных
+    кропов и строки индекса shard.
+    """
+
+    def __init__(self, start_track_id=0):
+        self.next_frame = 0
+        self.crop_id = 0
+        self.track_id_counter = start_track_id
+        self.track_id_mapping = {}
+        self.glob_crop_paths = []
+        self.packed_records = []
+        self._journaled = {'tracks': 0, 'paths': 0, 'records': 0}
+
+    def restore(self, records):
+        """
+        Состояние прерванного запуска с тем же планом: обработка
+        продолжается с первого кадра после последней контрольной точки.
+        """
+        for record in records:
+            self.next_frame = record['next_frame']
+            self.crop_id = record['crop_id']
+            self.track_id_counter = record['track_id_counter']
+            for video_dir, track_id, folder_id in record['tracks']:
+                self.track_id_mapping[(video_dir, track_id)] = folder_id
+            self.glob_crop_paths.extend(record['paths'])
+            self.packed_records.extend(record.get('records', []))
+        self._journaled = {'tracks': len(self.track_id_mapping),
+                           'paths': len(self.glob_crop_paths),
+                           'records': len(self.packed_records)}
+
+    def folder_id(self, video_dir, track_id):
+        """Номер папки трека; новый трек получает следующий номер."""
+        key = (video_dir, track_id)
+        if key not in self.track_id_mapping:
+            self.track_id_mapping[key] = self.track_id_counter
+            self.track_id_counter += 1
+        return self.track_id_mapping[key]
+
+    def checkpoint(self, journal, next_frame, crop_writer, writer):
+        """
+        Дожидается записи кропов из очереди и пишет в журнал состояние
+        после кадров до next_frame: счётчики, треки и пути кропов (или
+        строки индекса shard), добавленные с прошлой контрольной точки.
+        """
+        crop_writer.flush()
+        journaled = self._journaled
+        tracks = itertools.islice(self.track_id_mapping.items(),
+                                  journaled['tracks'], None)
+        record = {'next_frame': next_frame,
+                  'crop_id': self.crop_id,
+                  'track_id_counter': self.track_id_counter,
+                  'tracks': [[video_dir, track_id, folder_id]
+                             for (video_dir, track_id), folder_id in tracks],
+                  'paths': self.glob_crop_paths[journaled['paths']:]}
+        if writer is not None:
+            writer.flush()
+            record['records'] = writer.records(journaled['records'])
+            journaled['records'] = len(writer)
+        journaled['tracks'] = len(self.track_id_mapping)
+        journaled['paths'] = len(self.glob_crop_paths)
+        journal.append(record)
+        journal.flush()
+
+
+def parse_args():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--jsons-dir',
@@ -88,72 +240,195 @@ if __name__ == '__main__':
                         type=str,
                         default='data/NCAA/track_crops/',
                         help='path to output dir')
-    args = parser.parse_args()
+    parser.add_argument('--packed',
+                        action='store_true',
+                        help='write crops into one packed shard (crops.bin '
+                             '+ crops.idx.npy) instead of jpg folders')
+    parser.add_argument('--reduce',
+                        type=int,
+                        default=1,
+                        choices=sorted(REDUCED_FLAGS),
+                        help='decode frames at 1/N resolution, for crops '
+                             'that are downscaled later anyway')
+    parser.add_argument('--decoder',
+                        type=str,
+                        default='auto',
+                        choices=BACKENDS,
+                        help='turbojpeg decodes only the MCU blocks under '
+                             'the crops; auto falls back to a full decode')
+    parser.add_argument('--format',
+                        type=str,
+                        default='jpg',
+                        choices=sorted(FORMATS),
+                        help='crop image format')
+    parser.add_argument('--quality',
+                        type=int,
+                        default=None,
+                        help='jpg/webp quality (webp 101 is lossless) or '
+                             'png compression 0-9; encoder default if unset')
+    parser.add_argument('--encode-workers',
+                        type=int,
+                        default=4,
+                        help='threads encoding and writing crops')
+    parser.add_argument('--max-pending',
+                        type=int,
+                        default=256,
+                        help='crops waiting for the encoder before decoding '
+                             'blocks')
+    parser.add_argument('--index',
+                        type=str,
+                        default='',
+                        help='annotation index built by sequence_index.py, '
+                             'read instead of the jsons')
+    return parser, parser.parse_args()
+
+
+def find_jsons(jsons_root, index_path):
+    """
+    Аннотации под jsons_root: из индекса, если он задан, иначе поиском
+    по папкам.
+
+    :return: (SequenceIndex или None, отсортированные абсолютные пути)
+    """
+
+    # Оба способа дают одни и те же абсолютные пути в одном порядке, так
+    # что кропы и треки получают одинаковые номера
+    index = None
+    if index_path:
+        index = SequenceIndex.load(index_path)
+        json_paths = [os.path.abspath(index.anno_path(i))
+                      for i in range(len(index))]
+        json_paths = [p for p in json_paths
+                      if p.startswith(os.path.join(jsons_root, ''))]
+    else:
+        json_paths = glob.glob(os.path.join(jsons_root, '**', '*.json'),
+                               recursive=True)
+    json_paths.sort()
+    return index, json_paths
+
+
+def open_journal(parser, out_root, args, json_paths):
+    """Журнал запуска; журнал с другим планом - ошибка parser."""
+    # Папка старого запуска без журнала: продолжить её нельзя, новые
+    # кропы смешались бы со старыми
+    if is_partial_output(out_root):
+        parser.error(f'{out_root} is not empty and has no {JOURNAL_NAME}, '
+                     'so it was not written by a resumable run')
+    os.makedirs(out_root, exist_ok=True)
+    plan = {key: getattr(args, key) for key in (
+        'start_track_id', 'max_iof_thr', 'mode', 'packed', 'reduce',
+        'decoder', 'format', 'quality')}
+    plan['jsons'] = hashlib.blake2b('\n'.join(json_paths).encode(),
+                                    digest_size=16).hexdigest()
+    try:
+        return Journal(os.path.join(out_root, JOURNAL_NAME), plan)
+    except JournalMismatch as e:
+        parser.error(f'{e}, remove {out_root} to rebuild it')
+
+
+def read_frame_crops(json_p, index, args):
+    """
+    Кропы игроков одного кадра.
+
+    :return: (строки track_id, x1, y1, x2, y2 выбранных боксов, кропы,
+        бэкенд декодирования) или None, если кропов нет
+    """
+    frame_path = (json_p.replace('/anno/', '/frames/')
+                  .replace('.json', '.jpg'))
+    if not os.path.exists(frame_path):
+        frame_path = frame_path.replace('.jpg', '.jpeg')
+
+    annotation = load_annotation(json_p, index)
 
-    json_paths = glob.glob(os.path.join(PROJECT_ROOT, args.jsons_dir) + '/**/*.json'.replace('//', '/'), recursive=True)
+    # Кропы выбираются по разметке и размеру кадра из аннотации или
+    # заголовка; кадр без кропов не декодируется
+    size = frame_size(frame_path, annotation)
+    if size is None:
+        return None
 
-    track_id_counter = args.start_track_id
-    track_id_mapping = {}
-    glob_crop_paths = []
-    crop_id = 0
+    img_width, img_height = size
+    boxes = parse_boxes(annotation, args.mode)
+    keep = select_boxes(boxes, img_width, img_height, args.max_iof_thr)
+    if not keep.any():
+        return None
 
-    for json_p in tqdm(json_paths):
-        frame_path = json_p.replace('/anno/', '/frames/').replace('.json', '.jpg')
-        if not os.path.exists(frame_path):
-            frame_path = frame_path.replace('.jpg', '.jpeg')
+    xyxy = boxes[keep][['x1', 'y1', 'x2', 'y2']].tolist()
+    crops, backend = read_crops(frame_path, xyxy, args.reduce, args.decoder)
+    if crops is None:
+        return None
+    return boxes[keep].tolist(), crops, backend
 
-        frame = cv2.imread(frame_path)
 
-        if frame is None:
+def submit_crops(state, video_dir, frame_id, rows, crops, crop_writer,
+                 writer, out_root):
+    """Ставит кропы кадра в очередь crop_writer: в shard или в папки."""
+    for (track_id, *box), crop in zip(rows, crops):
+        folder_id = state.folder_id(video_dir, track_id)
+        if writer is not None:
+            geometry = (*box, 0, 0, crop.shape[1], crop.shape[0])
+            crop_writer.submit(crop, on_encoded=partial(
+                writer.add, pid=folder_id, camid=0, frame=frame_id,
+                geometry=geometry))
+            state.crop_id += 1
             continue
 
-        img_height, img_width = frame.shape[:2]
+        crop_path = os.path.join(out_root, str(folder_id),
+                                 f'crop_{state.crop_id}{crop_writer.ext}')
+        state.glob_crop_paths.append(crop_path)
+        crop_writer.submit(crop, crop_path)
+        state.crop_id += 1
 
-        video_dir = os.path.dirname(json_p.replace(PROJECT_ROOT, '').replace(args.jsons_dir, '')).replace('anno/', '')
-        if video_dir[0] == '/':
-            video_dir = video_dir[1:]
 
-        with open(json_p, 'r') as fp:
-            labelme_dict = json.load(fp)
+def main():
+    parser, args = parse_args()
 
-        max_iof_dict = calc_max_iof_dict(labelme_dict, args)
+    jsons_root = os.path.abspath(os.path.join(PROJECT_ROOT, args.jsons_dir))
+    index, json_paths = find_jsons(jsons_root, args.index)
+    out_root = os.path.join(PROJECT_ROOT, args.out_dir)
+    journal = open_journal(parser, out_root, args, json_paths)
 
-        for obj in labelme_dict['shapes']:
-            track_id = obj['label']
-            pts = obj['points']
+    state = CropTracks(args.start_track_id)
+    state.restore(journal.records)
+    start_frame = state.next_frame
+    if start_frame:
+        print(f'Resuming from frame {start_frame} of {len(json_paths)}')
 
-            if args.mode == 'ncaa':
-                if not track_id.isdigit():
-                    continue
-                track_id = int(track_id)
-                if track_id not in range(1, 13):
-                    continue
-            else:
-                if 'j_' in track_id:
-                    continue
-                track_id = int(track_id.split('_')[0])
+    writer = None
+    if args.packed:
+        writer = PackedCropWriter(out_root, 'crops', state.packed_records)
+    crop_writer = CropWriter(args.format, args.quality, args.encode_workers,
+                             args.max_pending)
+    decoded = Counter()
 
-            xy1, xy2 = pts
-            x, y = xy1
-            x2, y2 = xy2
-            x, y = int(x), int(y)
-            x2, y2 = int(x2), int(y2)
+    for frame_id, json_p in enumerate(tqdm(json_paths[start_frame:]),
+                                      start=start_frame):
+        if frame_id > start_frame and frame_id % CHECKPOINT_FRAMES == 0:
+            state.checkpoint(journal, frame_id, crop_writer, writer)
 
-            crop = frame[y:y2, x:x2]
-            if crop.shape[0] < 2 or crop.shape[1] < 2 or max_iof_dict[(x, y, x2, y2)] > args.max_iof_thr:
-                continue
+        found = read_frame_crops(json_p, index, args)
+        if found is None:
+            continue
+        rows, crops, backend = found
+        decoded[backend] += 1
+
+        video_dir = os.path.relpath(os.path.dirname(json_p),
+                                    jsons_root).replace('anno/', '')
+        submit_crops(state, video_dir, frame_id, rows, crops, crop_writer,
+                     writer, out_root)
 
-            if (video_dir, track_id) not in track_id_mapping:
-                track_id_mapping[(video_dir, track_id)] = track_id_counter
-                track_id_counter += 1
+    state.checkpoint(journal, len(json_paths), crop_writer, writer)
+    journal.close()
+    crop_writer.close()
+    print('decoded frames: '
+          + ', '.join(f'{k} {v}' for k, v in decoded.items()))
+    print(f'{args.format}: {crop_writer.stats.report()}')
+
+    if writer is not None:
+        writer.close()
+    else:
+        atomic_write(os.path.join(out_root, 'dataset.txt'),
+                     ''.join('%s\n' % item for item in state.glob_crop_paths))
 
-            folder_id = track_id_mapping[(video_dir, track_id)]
-            crop_path = os.path.join(PROJECT_ROOT, args.out_dir, str(folder_id), f'crop_{crop_id}.jpg')
-            glob_crop_paths.append(crop_path)
-            os.makedirs(os.path.dirname(crop_path), exist_ok=True)
-            cv2.imwrite(crop_path, crop)
-            crop_id += 1
 
-    with open(os.path.join(PROJECT_ROOT, args.out_dir, 'dataset.txt'), 'w') as f:
-        for item in glob_crop_paths:
-            f.write('%s\n' % item)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+
+from src.data.checkpoint import Journal, atomic_write
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Hex-дайджест blake2b содержимого файла."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path, with_hash=True):
+    """
+    mtime, размер и (по желанию) хэш файла; None, если файла нет.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    signature = {"mtime": st.st_mtime_ns, "size": st.st_size}
+    if with_hash:
+        signature["hash"] = file_hash(path)
+    return signature
+
+
+def is_unchanged(signature, path):
+    """
+    Совпадает ли файл `path` с сохранённой сигнатурой. Пока mtime и
+    размер совпадают, хватает stat(); файл хэшируется, только если
+    изменилось mtime, так что тронутый, но неизменённый файл не
+    пересобирается.
+    """
+    current = file_signature(path, with_hash=False)
+    if signature is None or current is None:
+        return signature is None and current is None
+    if current["size"] != signature["size"]:
+        return False
+    if current["mtime"] == signature["mtime"]:
+        return True
+    if file_hash(path) != signature["hash"]:
+        return False
+
+    signature["mtime"] = current["mtime"]
+    return True
+
+
+class Manifest:
+    """
+    Сохраняемая запись того, из каких источников собран каждый выход
+    сборки датасета. Ключи - источники (create_yolo_dataset использует
+    пути относительно входной директории), значения - словари, в которых
+    есть как минимум список `outputs` созданных файлов относительно
+    выходной директории.
+
+    Изменения дописываются в журнал рядом с манифестом: checkpoint()
+    сбрасывает его на диск, save() переносит записи в манифест. Поэтому
+    прерванная сборка сохраняет все кадры до последней контрольной
+    точки, и повторный запуск конвертирует только остальные.
+    """
+
+    def __init__(self, output_dir, name=MANIFEST_NAME):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, name)
+        self.entries = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.journal = Journal(self.path + ".journal")
+        for record in self.journal.records:
+            self.entries[record["key"]] = record["entry"]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def update(self, key, entry):
+        self.entries[key] = entry
+        self.journal.append({"key": key, "entry": entry})
+
+    def checkpoint(self):
+        """Делает изменения долговечными, не переписывая манифест."""
+        self.journal.flush()
+
+    def remove_missing(self, keys):
+        """
+        Удаляет выходы и сами записи, источников которых нет в `keys`.
+        Возвращает число удалённых записей.
+        """
+        stale = [key for key in self.entries if key not in keys]
+        for key in stale:
+            self.remove_outputs(self.entries.pop(key))
+        return len(stale)
+
+    def remove_outputs(self, entry):
+        for output in entry.get("outputs", []):
+            try:
+                os.remove(os.path.join(self.output_dir, output))
+            except FileNotFoundError:
+                pass
+
+    def save(self):
+        atomic_write(self.path, json.dumps(self.entries))
+        self.journal.reset()
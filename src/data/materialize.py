@@ -0,0 +1,85 @@
+import errno
+import os
+import shutil
+
+from src.data.checkpoint import atomic_path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MODES = ("copy", "hardlink", "symlink", "reflink")
+
+# ioctl FICLONE из linux/fs.h: клонирование файла на CoW-файловых системах
+# (btrfs, xfs с reflink=1, bcachefs)
+FICLONE = 0x40049409
+
+# Ошибки, при которых режим не поддерживается файловой системой
+# и нужно откатиться на обычное копирование
+_FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.EMLINK,
+    errno.ENOSYS,
+}
+
+# Режимы, которые уже не сработали в этом процессе, чтобы не повторять
+# заведомо неудачный системный вызов для каждого кадра
+_unsupported = set()
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported", dst)
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+def _link(src, dst, mode):
+    if mode == "hardlink":
+        os.link(src, dst)
+    elif mode == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+    elif mode == "reflink":
+        _reflink(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+
+
+def materialize(src, dst, mode="copy"):
+    """
+    Размещает файл src по пути dst копией, жёсткой ссылкой, символической
+    ссылкой или reflink-клоном. Если файловая система не поддерживает
+    выбранный режим, файл копируется.
+
+    :param src (str): исходный файл.
+    :param dst (str): путь к выходному файлу, существующий файл заменяется.
+    :param mode (str): один из MODES.
+    :return: режим, которым файл был фактически размещён.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown materialize mode: {mode}")
+
+    # Файл создаётся рядом под временным именем и переименовывается в dst,
+    # так что прерванная сборка не оставляет недописанных кадров
+    with atomic_path(dst) as tmp_path:
+        if mode != "copy" and mode not in _unsupported:
+            try:
+                _link(src, tmp_path, mode)
+                return mode
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+                _unsupported.add(mode)
+
+        shutil.copyfile(src, tmp_path)
+    return "copy"
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+import os
+from multiprocessing import Pool
+
+import click
+import numpy as np
+from tqdm import tqdm
+
+from src.data.labelme import Annotation, Shape, read_annotation
+
+INDEX_PATH = os.path.join("data", "interim", "sequence_index.npz")
+
+# Папки с аннотациями и варианты папок с кадрами для них, в порядке
+# проверки: NCAA (playerTrackingFrames*), labelme_to_crops (frames),
+# create_tracking_dataset (images)
+IMAGE_DIRS = {
+    "anno": ("playerTrackingFrames", "frames", "images"),
+    "third_task": ("playerTrackingFrames2",),
+}
+IMAGE_EXTS = (".jpg", ".jpeg")
+
+
+def find_annotations(input_filepath):
+    """Пути ко всем LabelMe json в папках anno/third_task, по порядку."""
+    paths = []
+    for root, dirs, files in os.walk(input_filepath):
+        dirs.sort()
+        parts = root.split(os.sep)
+        if not any(name in parts for name in IMAGE_DIRS):
+            continue
+        paths.extend(
+            os.path.join(root, file) for file in sorted(files)
+            if file.endswith(".json")
+        )
+    return paths
+
+
+def image_path_for(anno_path):
+    """
+    Кадр аннотации: папка anno/third_task заменяется на папку кадров
+    (см. IMAGE_DIRS), берётся первый существующий вариант. Если кадра
+    нет, возвращается первый вариант.
+    """
+    parts = anno_path.split(os.sep)
+    pos = max(i for i, name in enumerate(parts[:-1]) if name in IMAGE_DIRS)
+    stem = os.path.splitext(parts[-1])[0]
+
+    candidates = []
+    for image_dir in IMAGE_DIRS[parts[pos]]:
+        folder = os.sep.join(parts[:pos] + [image_dir] + parts[pos + 1:-1])
+        candidates.extend(
+            os.path.join(folder, stem + ext) for ext in IMAGE_EXTS
+        )
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return candidates[0]
+
+
+def parse_annotation(anno_path):
+    """
+    Разбирает одну аннотацию. Выполняется в процессе пула.
+
+    :return: (mtime_ns, size, ширина, высота, [(label, x1, y1, x2, y2)])
+    """
+    st = os.stat(anno_path)
+    data = read_annotation(anno_path)
+
+    shapes = []
+    for shape in data.shapes:
+        if len(shape.points) < 2:
+            continue
+        (x1, y1), (x2, y2) = shape.points[0], shape.points[1]
+        shapes.append((shape.label, x1, y1, x2, y2))
+    return (
+        st.st_mtime_ns,
+        st.st_size,
+        data.image_width,
+        data.image_height,
+        shapes,
+    )
+
+
+def build_index(input_filepath, index_path=INDEX_PATH, workers=None):
+    """
+    Один раз разбирает все LabelMe-аннотации input_filepath в колоночную
+    таблицу и сохраняет её в index_path (.npz, без pickle).
+
+    Таблица кадров: путь к аннотации и кадру, последовательность (папка
+    с кадрами относительно input_filepath), номер кадра (позиция в
+    отсортированной папке, с 1), размер изображения из аннотации,
+    mtime/размер json. Таблица объектов: номер кадра в таблице, label и
+    точки прямоугольника x1, y1, x2, y2 как в аннотации; объекты кадра i
+    лежат в строках shape_offsets[i]:shape_offsets[i + 1].
+    """
+    anno_paths = find_annotations(input_filepath)
+    image_paths = [image_path_for(p) for p in anno_paths]
+
+    listings = {}
+    frame_numbers = []
+    for image_path in image_paths:
+        folder, name = os.path.split(image_path)
+        if folder not in listings:
+            files = os.listdir(folder) if os.path.isdir(folder) else []
+            images = sorted(f for f in files if f.endswith(IMAGE_EXTS))
+            listings[folder] = {f: i for i, f in enumerate(images, start=1)}
+        frame_numbers.append(listings[folder].get(name, 0))
+
+    with Pool(workers) as pool:
+        parsed = list(
+            tqdm(
+                pool.imap(parse_annotation, anno_paths, chunksize=64),
+                total=len(anno_paths),
+            )
+        )
+
+    shapes = [shape for *_, frame_shapes in parsed for shape in frame_shapes]
+    counts = [len(frame_shapes) for *_, frame_shapes in parsed]
+    columns = {
+        "root": np.array(os.path.abspath(input_filepath)),
+        "anno_path": np.array(
+            [os.path.relpath(p, input_filepath) for p in anno_paths], dtype=str
+        ),
+        "image_path": np.array(
+            [os.path.relpath(p, input_filepath) for p in image_paths],
+            dtype=str,
+        ),
+        "sequence": np.array(
+            [os.path.relpath(os.path.dirname(p), input_filepath)
+             for p in image_paths],
+            dtype=str,
+        ),
+        "frame": np.array(frame_numbers, dtype=np.int64),
+        "mtime": np.array([p[0] for p in parsed], dtype=np.int64),
+        "size": np.array([p[1] for p in parsed], dtype=np.int64),
+        "image_width": np.array([p[2] for p in parsed], dtype=np.int32),
+        "image_height": np.array([p[3] for p in parsed], dtype=np.int32),
+        "shape_offsets": np.concatenate(([0], np.cumsum(counts))).astype(
+            np.int64
+        ),
+        "shape_frame": np.repeat(np.arange(len(parsed)), counts).astype(
+            np.int64
+        ),
+        "label": np.array([s[0] for s in shapes], dtype=str),
+        "points": np.array(
+            [s[1:] for s in shapes], dtype=np.float64
+        ).reshape(-1, 4),
+    }
+
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(tmp_path, index_path)
+    return SequenceIndex(columns)
+
+
+class SequenceIndex:
+    """
+    Таблица кадров и объектов, построенная build_index. Пути
+    возвращаются полными (root + относительный путь).
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.root = str(columns["root"])
+        self._rows = None
+
+    @classmethod
+    def load(cls, index_path=INDEX_PATH):
+        with np.load(index_path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def __len__(self):
+        return len(self.columns["anno_path"])
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def anno_path(self, i):
+        return os.path.join(self.root, self.columns["anno_path"][i])
+
+    def image_path(self, i):
+        return os.path.join(self.root, self.columns["image_path"][i])
+
+    def shapes(self, i):
+        """label и точки (N x 4) объектов кадра i."""
+        lo, hi = self.columns["shape_offsets"][i:i + 2]
+        return self.columns["label"][lo:hi], self.columns["points"][lo:hi]
+
+    def annotation(self, i):
+        """
+        Кадр i как labelme.Annotation - то же, что read_annotation
+        возвращает для json-файла.
+        """
+        labels, points = self.shapes(i)
+        return Annotation(
+            [
+                Shape(str(label), [[x1, y1], [x2, y2]])
+                for label, (x1, y1, x2, y2) in zip(labels, points.tolist())
+            ],
+            int(self.columns["image_width"][i]),
+            int(self.columns["image_height"][i]),
+        )
+
+    def find(self, anno_path):
+        """
+        Строка аннотации anno_path или None, если её нет в индексе или
+        файл изменился после построения индекса (mtime/размер).
+        """
+        if self._rows is None:
+            self._rows = {
+                os.path.normpath(self.anno_path(i)): i
+                for i in range(len(self))
+            }
+        i = self._rows.get(os.path.normpath(os.path.abspath(anno_path)))
+        if i is None:
+            return None
+        try:
+            st = os.stat(anno_path)
+        except FileNotFoundError:
+            return None
+        if (st.st_mtime_ns, st.st_size) != (
+            self.columns["mtime"][i], self.columns["size"][i]
+        ):
+            return None
+        return i
+
+    def load_annotation(self, anno_path):
+        """annotation() из индекса, а для изменённых файлов - чтение json."""
+        i = self.find(anno_path)
+        if i is not None:
+            return self.annotation(i)
+        return read_annotation(anno_path)
+
+
+def load_annotation(anno_path, index=None):
+    """LabelMe-аннотация из индекса, если он задан, иначе из файла."""
+    if index is not None:
+        return index.load_annotation(anno_path)
+    return read_annotation(anno_path)
+
+
+@click.command()
+@click.argument("input_filepath", type=click.Path(exists=True))
+@click.option(
+    "--index",
+    "index_path",
+    default=INDEX_PATH,
+    type=click.Path(),
+    help="Куда сохранить индекс (.npz).",
+)
+@click.option(
+    "--workers",
+    default=os.cpu_count(),
+    type=int,
+    help="Количество процессов разбора json.",
+)
+def main(input_filepath, index_path, workers):
+    """
+    Строит индекс LabelMe-аннотаций input_filepath. create_yolo_dataset,
+    create_reid_dataset, create_tracking_dataset и labelme_to_crops с
+    опцией --index читают его вместо повторного разбора json.
+    """
+    index = build_index(input_filepath, index_path, workers)
+    print(
+        f"Indexed {len(index)} frames, {len(index['label'])} shapes "
+        f"into {index_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
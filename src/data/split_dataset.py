@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Разбиение кадров на train/valid/test по играм.
+
+Выборка игры определяется только хэшем (seed, игра), независимо от
+других игр, поэтому доли FRACTIONS выдерживаются лишь в среднем. Игра
+не попадает в valid с вероятностью 0.84, так что valid пуста с
+вероятностью 0.84^N для N игр: нужно не меньше MIN_SEQUENCES = 20 игр
+(valid пуста в ~3% случаев, test - в ~1%). Если выборка всё же осталась
+без игр, write_splits печатает предупреждение; тогда стоит сменить
+--seed.
+"""
+import csv
+import hashlib
+import os
+
+import click
+
+from src.data.checkpoint import atomic_path
+
+SPLITS = ("train", "valid", "test")
+# Доли train/valid/test: 20% в test, затем 20% оставшегося в valid
+FRACTIONS = (0.64, 0.16, 0.2)
+# Рекомендуемый минимум игр, см. докстринг модуля
+MIN_SEQUENCES = 20
+
+
+def find_frames(input_filepath):
+    """
+    Генератор путей к кадрам формата jpg из папок playerTrackingFrames*.
+    Дерево обходится потоково через os.scandir, список путей не хранится.
+    """
+    stack = [input_filepath]
+    while stack:
+        root = stack.pop()
+        with os.scandir(root) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            if entry.is_dir():
+                stack.append(entry.path)
+            elif "playerTrackingFrames" in root and "jpg" in entry.name:
+                yield entry.path
+
+
+def sequence_key(frame_path, input_filepath):
+    """
+    Ключ группы кадра - папка игры относительно input_filepath
+    (родитель папки playerTrackingFrames*). Все кадры одной игры
+    попадают в одну выборку, поэтому соседние почти одинаковые кадры
+    не оказываются одновременно в train и test.
+    """
+    frames_dir = os.path.dirname(os.path.relpath(frame_path, input_filepath))
+    return os.path.dirname(frames_dir) or frames_dir
+
+
+def split_for(key, seed=0, fractions=FRACTIONS):
+    """
+    Детерминированно выбирает выборку для группы по хэшу (seed, key):
+    результат не зависит от порядка обхода и от других групп.
+    """
+    digest = hashlib.blake2b(f"{seed}:{key}".encode(), digest_size=8).digest()
+    u = int.from_bytes(digest, "big") / 2**64
+
+    bound = 0.0
+    for split, fraction in zip(SPLITS, fractions):
+        bound += fraction
+        if u < bound:
+            return split
+    return SPLITS[-1]
+
+
+def iter_splits(input_filepath, seed=0, fractions=FRACTIONS):
+    """
+    Генератор (путь к кадру, группа, выборка) за один проход по дереву.
+    Память зависит только от количества групп, а не кадров.
+    """
+    cache = {}
+    for frame_path in find_frames(input_filepath):
+        key = sequence_key(frame_path, input_filepath)
+        if key not in cache:
+            cache[key] = split_for(key, seed, fractions)
+        yield frame_path, key, cache[key]
+
+
+def write_splits(rows, csv_path):
+    """
+    Записывает строки split,sequence,path в csv_path по мере их получения
+    и отдаёт их дальше, так что разбиение сохраняется в том же проходе.
+    Файл заменяется целиком, только когда все строки записаны.
+    Строки начинаются с (путь к кадру, группа, выборка), остальные поля
+    передаются дальше без изменений.
+    В конце предупреждает о выборках, в которые не попало ни одной игры.
+    """
+    sequences = {split: set() for split in SPLITS}
+    with atomic_path(csv_path) as tmp_path, \
+            open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("split", "sequence", "path"))
+        for row in rows:
+            frame_path, key, split = row[:3]
+            writer.writerow((split, key, frame_path))
+            sequences[split].add(key)
+            yield row
+    warn_empty_splits(sequences)
+
+
+def warn_empty_splits(sequences):
+    """Печатает предупреждение, если в какой-то выборке нет игр."""
+    total = len(set().union(*sequences.values()))
+    empty = [split for split in SPLITS if not sequences[split]]
+    if total and empty:
+        print(
+            f"Warning: no sequences in {', '.join(empty)} "
+            f"({total} sequences in total, at least {MIN_SEQUENCES} "
+            "recommended); try another --seed"
+        )
+
+
+@click.command()
+@click.argument("input_filepath", type=click.Path(exists=True))
+@click.argument("output_filepath", type=click.Path())
+@click.option("--seed", default=0, type=int, help="Соль хэша разбиения.")
+def main(input_filepath, output_filepath, seed):
+    """
+    Делит кадры input_filepath на train/valid/test по играм и записывает
+    разбиение в csv-файл output_filepath за один проход.
+    """
+    frames = {split: 0 for split in SPLITS}
+    sequences = {split: set() for split in SPLITS}
+    rows = write_splits(iter_splits(input_filepath, seed), output_filepath)
+    for _, key, split in rows:
+        frames[split] += 1
+        sequences[split].add(key)
+
+    for split in SPLITS:
+        print(f"{split}: {frames[split]} frames, "
+              f"{len(sequences[split])} sequences")
+
+
+if __name__ == "__main__":
+    main()
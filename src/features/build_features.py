@@ -0,0 +1,216 @@
+"""
+Disk-backed cache of ReID embeddings in sqlite.
+
+An entry is keyed by the hash of the encoded crop bytes and by the model
+fingerprint (hash of the checkpoint weights and the input size), so a
+retrained model or another input size never reads stale embeddings.
+Lookups and inserts are batched; when the embeddings exceed the size
+budget the least recently used ones are evicted.
+
+    python -m src.features.build_features data/interim/embeddings.sqlite \\
+        --max-size-mb 512
+"""
+import hashlib
+import sqlite3
+import time
+
+import click
+import numpy as np
+
+from src.data.manifest import file_hash
+
+# Parameters per IN (...) query, below SQLITE_MAX_VARIABLE_NUMBER
+QUERY_CHUNK = 500
+# Eviction trims the cache to this share of the budget, so the next
+# puts do not evict again right away
+EVICT_TO = 0.9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    crop BLOB NOT NULL,
+    dtype TEXT NOT NULL,
+    data BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, crop)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used);
+"""
+
+
+def crop_hash(data):
+    """Hash of an encoded crop (bytes or memoryview)."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def model_fingerprint(checkpoint, size):
+    """
+    Identifies the embeddings of a checkpoint at an input size
+    (width, height).
+    """
+    width, height = size
+    return f"{file_hash(checkpoint)}-{width}x{height}"
+
+
+class EmbeddingCache:
+    """
+    Embeddings of one model (see model_fingerprint) in a sqlite file
+    shared by all models. max_bytes is the budget for the embedding
+    bytes of all models; None disables eviction.
+    """
+
+    def __init__(self, path, model, max_bytes=None):
+        self.path = path
+        self.model = model
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.bytes = self._total_bytes()
+
+    def _total_bytes(self):
+        return self._db.execute(
+            "SELECT total(length(data)) FROM embeddings"
+        ).fetchone()[0]
+
+    def __len__(self):
+        return self._db.execute(
+            "SELECT count(*) FROM embeddings WHERE model = ?", (self.model,)
+        ).fetchone()[0]
+
+    def get_many(self, hashes):
+        """
+        Embeddings of the crops with these hashes that are in the cache,
+        as a dict hash -> 1-D array. Found entries become most recently used.
+        """
+        found = {}
+        hashes = list(hashes)
+        for start in range(0, len(hashes), QUERY_CHUNK):
+            chunk = hashes[start:start + QUERY_CHUNK]
+            rows = self._db.execute(
+                "SELECT crop, dtype, data FROM embeddings "
+                f"WHERE model = ? AND crop IN ({', '.join('?' * len(chunk))})",
+                [self.model, *chunk],
+            )
+            for crop, dtype, data in rows:
+                found[crop] = np.frombuffer(data, dtype=dtype)
+
+        if found:
+            now = time.time()
+            with self._db:
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? "
+                    "WHERE model = ? AND crop = ?",
+                    [(now, self.model, crop) for crop in found],
+                )
+        hits = sum(crop in found for crop in hashes)
+        self.hits += hits
+        self.misses += len(hashes) - hits
+        return found
+
+    def put_many(self, items):
+        """
+        Stores (hash, embedding) pairs, then evicts down to the budget.
+        Crops already in the cache keep their embedding.
+        """
+        now = time.time()
+        rows = []
+        for crop, embedding in items:
+            embedding = np.ascontiguousarray(embedding)
+            rows.append((
+                self.model,
+                crop,
+                embedding.dtype.str,
+                embedding.tobytes(),
+                now,
+            ))
+        if not rows:
+            return
+
+        with self._db:
+            inserted = self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows
+            ).rowcount
+        if inserted == len(rows):
+            self.bytes += sum(len(row[3]) for row in rows)
+        else:
+            self.bytes = self._total_bytes()
+        self.evict()
+
+    def evict(self, max_bytes=None):
+        """
+        Deletes least recently used embeddings (of any model) until they
+        fit into EVICT_TO of the budget. Returns the number deleted.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None or self.bytes <= max_bytes:
+            return 0
+
+        excess = self.bytes - max_bytes * EVICT_TO
+        victims = []
+        rows = self._db.execute(
+            "SELECT model, crop, length(data) FROM embeddings "
+            "ORDER BY last_used"
+        )
+        for model, crop, size in rows:
+            if excess <= 0:
+                break
+            victims.append((model, crop))
+            excess -= size
+        rows.close()
+
+        with self._db:
+            self._db.executemany(
+                "DELETE FROM embeddings WHERE model = ? AND crop = ?", victims
+            )
+        self.bytes = self._total_bytes()
+        return len(victims)
+
+    def models(self):
+        """(model, number of embeddings, bytes) of every model in the cache."""
+        return self._db.execute(
+            "SELECT model, count(*), total(length(data)) FROM embeddings "
+            "GROUP BY model"
+        ).fetchall()
+
+    def report(self):
+        lookups = max(self.hits + self.misses, 1)
+        return (
+            f"cache {self.hits} hits, {self.misses} misses "
+            f"({self.hits / lookups:.0%}), {self.bytes / 2 ** 20:.1f} MB"
+        )
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@click.command()
+@click.argument("cache_path", type=click.Path(exists=True))
+@click.option(
+    "--max-size-mb",
+    default=None,
+    type=float,
+    help="Evict least recently used embeddings down to this size.",
+)
+def main(cache_path, max_size_mb):
+    """Prints the embeddings per model in the cache and optionally trims it."""
+    with EmbeddingCache(cache_path, model=None) as cache:
+        if max_size_mb is not None:
+            evicted = cache.evict(max_size_mb * 2 ** 20)
+            print(f"Evicted {evicted} embeddings")
+        for model, count, size in cache.models():
+            print(f"{model}: {count} embeddings, {size / 2 ** 20:.1f} MB")
+        print(f"Total {cache.bytes / 2 ** 20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
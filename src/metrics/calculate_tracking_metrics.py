@@ -3,64 +3,160 @@ import motmetrics as mm
 import numpy as np
 import argparse
 
+from src.metrics.mot_io import cache_dir_from_env, load_mot
+
+METRICS = ["num_frames", "idf1", "recall", "precision", "mota", "motp"]
+NAMEMAP = {
+    "idf1": "IDF1",
+    "recall": "Rcll",
+    "precision": "Prcn",
+    "mota": "MOTA",
+    "motp": "MOTP",
+}
+
+
+def index_frames(data):
+    """
+    Sorts MOT rows by frame once so every frame is a contiguous slice.
+
+    Returns the sorted rows, the frame numbers present and the offset of
+    each frame's first row (plus a final offset equal to the row count).
+    """
+    data = data[np.argsort(data[:, 0], kind="stable")]
+    frames, starts = np.unique(data[:, 0].astype(int), return_index=True)
+    return data, frames, np.append(starts, len(data))
+
+
+def frame_bounds(index, frames):
+    """Start/stop rows of `frames` in an index; absent frames are empty."""
+    _, present, offsets = index
+    if len(present) == 0:
+        return np.zeros(len(frames), int), np.zeros(len(frames), int)
+    pos = np.searchsorted(present, frames)
+    pos_clipped = np.minimum(pos, len(present) - 1)
+    found = (pos < len(present)) & (present[pos_clipped] == frames)
+    start = np.where(found, offsets[pos_clipped], 0)
+    stop = np.where(found, offsets[np.minimum(pos + 1, len(offsets) - 1)], 0)
+    return start, stop
+
+
+def iou_distances(gt_boxes, t_boxes, gt_bounds, t_bounds, max_iou=0.5):
+    """
+    IoU distance matrices of many frames at once, computed as one flat
+    vector of gt x tracker pairs. Same formula as
+    mm.distances.iou_matrix: 1 - IoU, NaN where it exceeds max_iou.
+
+    Returns the flat distances and the offset of each frame's matrix
+    (row-major, gt rows by tracker columns).
+    """
+    gt_start, gt_stop = gt_bounds
+    t_start, t_stop = t_bounds
+    n_gt = gt_stop - gt_start
+    n_t = t_stop - t_start
+    sizes = n_gt * n_t
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+
+    pair_frame = np.repeat(np.arange(len(sizes)), sizes)
+    k = np.arange(offsets[-1]) - offsets[pair_frame]
+    gi = gt_start[pair_frame] + k // np.maximum(n_t[pair_frame], 1)
+    ti = t_start[pair_frame] + k % np.maximum(n_t[pair_frame], 1)
+
+    a_min, b_min = gt_boxes[gi, :2], t_boxes[ti, :2]
+    a_max, b_max = a_min + gt_boxes[gi, 2:], b_min + t_boxes[ti, 2:]
+    i_vol = np.prod(
+        np.maximum(np.minimum(a_max, b_max) - np.maximum(a_min, b_min), 0),
+        axis=-1,
+    )
+    a_vol = np.prod(np.maximum(a_max - a_min, 0), axis=-1)
+    b_vol = np.prod(np.maximum(b_max - b_min, 0), axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(i_vol == 0, 0.0, i_vol / (a_vol + b_vol - i_vol))
 
-def motMetricsEnhancedCalculator(gtSource, tSource):
-    # load ground truth
-    gt = np.loadtxt(gtSource, delimiter=" ")
+    dist = 1 - iou
+    return np.where(dist > max_iou, np.nan, dist), offsets
 
-    # load tracking output
-    t = np.loadtxt(tSource, delimiter=" ")
 
-    # Create an accumulator that will be updated during each frame
+def accumulate(gt, t, max_iou=0.5, chunk_frames=4096, gt_index=None):
+    """
+    Builds a MOTAccumulator for one sequence.
+
+    Both arrays are sorted by frame once and each frame is a slice given
+    by offsets, instead of masking the whole array per frame. IoU
+    matrices are computed for `chunk_frames` frames in one vectorized
+    batch. Frames run up to the last frame of either file, so tracker
+    output past the last GT frame is counted as false positives.
+
+    gt_index is a ready index_frames(gt), for scoring many tracker
+    outputs against one GT; gt is then not used.
+    """
     acc = mm.MOTAccumulator(auto_id=True)
+    if gt_index is None:
+        gt_index = index_frames(gt)
+    t_index = index_frames(t)
+    gt, t = gt_index[0], t_index[0]
+
+    last_frame = int(max(gt[:, 0].max(initial=0), t[:, 0].max(initial=0)))
+    frames = np.arange(1, last_frame + 1)  # frame numbers begin at 1
+
+    gt_boxes, t_boxes = gt[:, 2:6], t[:, 2:6]
+    gt_ids, t_ids = gt[:, 1].astype("int"), t[:, 1].astype("int")
+
+    for chunk in range(0, len(frames), chunk_frames):
+        chunk = frames[chunk:chunk + chunk_frames]
+        gt_start, gt_stop = frame_bounds(gt_index, chunk)
+        t_start, t_stop = frame_bounds(t_index, chunk)
+        dists, offsets = iou_distances(
+            gt_boxes, t_boxes, (gt_start, gt_stop), (t_start, t_stop), max_iou
+        )
 
-    # Max frame number maybe different for gt and t files
-    for frame in range(int(gt[:, 0].max())):
-        frame += 1  # detection and frame numbers begin at 1
+        for f in range(len(chunk)):
+            n_gt = gt_stop[f] - gt_start[f]
+            n_t = t_stop[f] - t_start[f]
+            # Call update once for per frame.
+            # format: gt object ids, t object ids, distance
+            acc.update(
+                gt_ids[gt_start[f]:gt_stop[f]].tolist(),
+                t_ids[t_start[f]:t_stop[f]].tolist(),
+                dists[offsets[f]:offsets[f + 1]].reshape(n_gt, n_t),
+            )
+    return acc
 
-        # select id, x, y, width, height for current frame
-        # required format for distance calculation is X, Y, Width, Height \
-        # We already have this format
-        gt_dets = gt[gt[:, 0] == frame, 1:6]  # select all detections in gt
-        t_dets = t[t[:, 0] == frame, 1:6]  # select all detections in t
 
-        C = mm.distances.iou_matrix(
-            gt_dets[:, 1:], t_dets[:, 1:], max_iou=0.5
-        )  # format: gt, t
+def motMetricsEnhancedCalculator(gtSource, tSource):
+    # load ground truth
+    gt = load_mot(gtSource, cache_dir_from_env())
 
-        # Call update once for per frame.
-        # format: gt object ids, t object ids, distance
-        acc.update(
-            gt_dets[:, 0].astype("int").tolist(), t_dets[:, 0].astype("int").tolist(), C
-        )
+    # load tracking output
+    t = load_mot(tSource)
+
+    # Create an accumulator updated frame by frame from the batched
+    # IoU distances
+    acc = accumulate(gt, t)
 
     mh = mm.metrics.create()
 
     summary = mh.compute(
         acc,
-        metrics=["num_frames", "idf1", "recall", "precision", "mota", "motp"],
+        metrics=METRICS,
         name="acc",
     )
 
     strsummary = mm.io.render_summary(
         summary,
         # formatters={'mota' : '{:.2%}'.format},
-        namemap={
-            "idf1": "IDF1",
-            "recall": "Rcll",
-            "precision": "Prcn",
-            "mota": "MOTA",
-            "motp": "MOTP",
-        },
+        namemap=NAMEMAP,
     )
     print(strsummary)
+    return summary
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
-    parser.add_argument("--gtSource", type=str, help="Enter your name")
-    parser.add_argument("--tSource", type=str, help="Enter your age", default=0)
+    parser.add_argument("--gtSource", type=str, help="Path to the gt.txt file")
+    parser.add_argument(
+        "--tSource", type=str, help="Path to the tracker output"
+    )
 
     args = parser.parse_args()
 
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import motmetrics as mm
+
+from src.metrics.calculate_tracking_metrics import (
+    METRICS,
+    NAMEMAP,
+    accumulate,
+)
+from src.metrics.mot_io import cache_dir_from_env, load_mot
+
+
+def find_sequences(gt_root):
+    """
+    Finds MOTChallenge-style sequences (<seq>/gt/gt.txt), as written by
+    create_tracking_dataset.py, under gt_root. Returns {name: gt path}.
+    """
+    sequences = {}
+    for root, dirs, files in os.walk(gt_root):
+        if os.path.basename(root) == "gt" and "gt.txt" in files:
+            seq_dir = os.path.dirname(root)
+            sequences[os.path.basename(seq_dir)] = os.path.join(root, "gt.txt")
+    return dict(sorted(sequences.items()))
+
+
+def evaluate_sequence(task):
+    """Builds the accumulator of one sequence, runs in a pool worker."""
+    name, gt_path, t_path = task
+    gt = load_mot(gt_path, cache_dir_from_env())
+    return name, accumulate(gt, load_mot(t_path))
+
+
+def evaluate_sequences(gt_root, tracker_dir, workers=None):
+    """
+    Scores every sequence under gt_root against <tracker_dir>/<seq>.txt in
+    a process pool. The OVERALL row is computed by motmetrics from the
+    merged events of all sequences, not by averaging per-sequence scores.
+    """
+    tasks = []
+    for name, gt_path in find_sequences(gt_root).items():
+        t_path = os.path.join(tracker_dir, f"{name}.txt")
+        if not os.path.exists(t_path):
+            print(f"No tracker output for {name}, skipped")
+            continue
+        tasks.append((name, gt_path, t_path))
+
+    if not tasks:
+        raise FileNotFoundError(f"No sequences to evaluate in {gt_root}")
+
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(evaluate_sequence, tasks))
+
+    names = [name for name, _ in results]
+    accs = [acc for _, acc in results]
+
+    mh = mm.metrics.create()
+    return mh.compute_many(
+        accs, names=names, metrics=METRICS, generate_overall=True
+    )
+
+
+def write_report(summary, output):
+    """Writes the summary as CSV or JSON depending on the extension."""
+    if output.endswith(".json"):
+        with open(output, "w") as f:
+            json.dump(json.loads(summary.to_json(orient="index")), f, indent=2)
+    else:
+        summary.to_csv(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--gtRoot", type=str, help="Folder with ncaa_dataset-0N/gt/gt.txt"
+    )
+    parser.add_argument(
+        "--trackerDir", type=str, help="Folder with <sequence>.txt outputs"
+    )
+    parser.add_argument(
+        "--output", type=str, default="", help="Report path (.json or .csv)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of processes"
+    )
+
+    args = parser.parse_args()
+
+    summary = evaluate_sequences(args.gtRoot, args.trackerDir, args.workers)
+    print(mm.io.render_summary(summary, namemap=NAMEMAP))
+    if args.output:
+        write_report(summary, args.output)
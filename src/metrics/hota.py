@@ -0,0 +1,179 @@
+import argparse
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from src.metrics.calculate_tracking_metrics import (
+    frame_bounds,
+    index_frames,
+    iou_distances,
+)
+from src.metrics.mot_io import cache_dir_from_env, load_mot
+
+# Localization thresholds alpha, as in TrackEval
+ALPHAS = np.arange(0.05, 0.99, 0.05)
+EPS = np.finfo("float").eps
+
+FIELDS = ["HOTA", "DetA", "AssA", "LocA", "DetRe", "DetPr", "AssRe", "AssPr"]
+
+
+def _similarities(gt, t):
+    """
+    IoU of every gt x tracker pair within each frame, in one vectorized
+    pass.
+
+    Returns the gt and tracker arrays sorted by frame, the pair offsets of
+    each frame, and for every pair its gt row, tracker row and IoU.
+    """
+    gt_index = index_frames(gt)
+    t_index = index_frames(t)
+    frames = np.union1d(gt_index[1], t_index[1])
+
+    gt_start, gt_stop = frame_bounds(gt_index, frames)
+    t_start, t_stop = frame_bounds(t_index, frames)
+    dist, offsets = iou_distances(
+        gt_index[0][:, 2:6], t_index[0][:, 2:6],
+        (gt_start, gt_stop), (t_start, t_stop), max_iou=1.0,
+    )
+
+    n_t = t_stop - t_start
+    sizes = np.diff(offsets)
+    pair_frame = np.repeat(np.arange(len(frames)), sizes)
+    k = np.arange(offsets[-1]) - offsets[pair_frame]
+    gi = gt_start[pair_frame] + k // np.maximum(n_t[pair_frame], 1)
+    ti = t_start[pair_frame] + k % np.maximum(n_t[pair_frame], 1)
+    return gt_index[0], t_index[0], offsets, gi, ti, 1 - dist
+
+
+def _remap_ids(ids):
+    # id -> 0..n-1, as TrackEval does for each sequence
+    unique, inverse = np.unique(ids.astype(int), return_inverse=True)
+    return inverse, len(unique)
+
+
+def _final_fields(res):
+    tp = res["HOTA_TP"]
+    res["DetRe"] = tp / np.maximum(1, tp + res["HOTA_FN"])
+    res["DetPr"] = tp / np.maximum(1, tp + res["HOTA_FP"])
+    res["DetA"] = res["HOTA_TP"] / np.maximum(
+        1, res["HOTA_TP"] + res["HOTA_FN"] + res["HOTA_FP"]
+    )
+    res["HOTA"] = np.sqrt(res["DetA"] * res["AssA"])
+    res["RHOTA"] = np.sqrt(res["DetRe"] * res["AssA"])
+    return res
+
+
+def hota(gt, t):
+    """
+    HOTA, DetA, AssA, LocA (and DetRe/DetPr/AssRe/AssPr) of one sequence,
+    following the TrackEval algorithm: box IoU as similarity, a global
+    id alignment, then a Hungarian matching in every frame, counted for
+    all alpha thresholds at once.
+
+    gt rows are not filtered by the MOTChallenge flags (conf/class/
+    visibility): create_tracking_dataset.py writes zeros to those columns.
+
+    :param gt: MOT array (frame, id, x, y, w, h, ...)
+    :param t: MOT array of the tracker output
+    :return: dict field -> array over ALPHAS; the scalars (mean over
+        alpha) are under the same names in the "mean" key
+    """
+    n_alpha = len(ALPHAS)
+    res = {
+        key: np.zeros(n_alpha)
+        for key in ["HOTA_TP", "HOTA_FN", "HOTA_FP", "LocA", "AssA",
+                    "AssRe", "AssPr"]
+    }
+    num_gt, num_t = len(gt), len(t)
+
+    if num_t == 0 or num_gt == 0:
+        res["HOTA_FN"][:] = num_gt
+        res["HOTA_FP"][:] = num_t
+        res["LocA"][:] = 1.0
+        return _summarize(_final_fields(res))
+
+    gt, t, offsets, gi, ti, sim = _similarities(gt, t)
+    gt_ids, n_gt_ids = _remap_ids(gt[:, 1])
+    t_ids, n_t_ids = _remap_ids(t[:, 1])
+
+    # First pass: expected matches of every id pair over the sequence
+    row_sum = np.bincount(gi, weights=sim, minlength=num_gt)
+    col_sum = np.bincount(ti, weights=sim, minlength=num_t)
+    denom = row_sum[gi] + col_sum[ti] - sim
+    sim_iou = np.zeros_like(sim)
+    mask = denom > EPS
+    sim_iou[mask] = sim[mask] / denom[mask]
+
+    pair_ids = gt_ids[gi] * n_t_ids + t_ids[ti]
+    potential_matches = np.bincount(
+        pair_ids, weights=sim_iou, minlength=n_gt_ids * n_t_ids
+    ).reshape(n_gt_ids, n_t_ids)
+    gt_id_count = np.bincount(gt_ids, minlength=n_gt_ids)[:, None]
+    t_id_count = np.bincount(t_ids, minlength=n_t_ids)[None, :]
+    global_alignment = potential_matches / (
+        gt_id_count + t_id_count - potential_matches
+    )
+
+    # Second pass: Hungarian matching in every frame
+    score = global_alignment[gt_ids[gi], t_ids[ti]] * sim
+    match_gt, match_t, match_sim = [], [], []
+    for f in np.flatnonzero(np.diff(offsets)):
+        lo, hi = offsets[f], offsets[f + 1]
+        g0, t0 = gi[lo], ti[lo]
+        shape = (gi[hi - 1] - g0 + 1, ti[hi - 1] - t0 + 1)
+        rows, cols = linear_sum_assignment(-score[lo:hi].reshape(shape))
+        match_gt.append(rows + g0)
+        match_t.append(cols + t0)
+        match_sim.append(sim[lo:hi].reshape(shape)[rows, cols])
+
+    match_gt = np.concatenate(match_gt)
+    match_t = np.concatenate(match_t)
+    match_sim = np.concatenate(match_sim)
+
+    # All alpha thresholds as one alpha x match array
+    matched = match_sim[None, :] >= ALPHAS[:, None] - EPS
+    res["HOTA_TP"] = matched.sum(axis=1).astype(float)
+    res["HOTA_FN"] = num_gt - res["HOTA_TP"]
+    res["HOTA_FP"] = num_t - res["HOTA_TP"]
+    res["LocA"] = (matched * match_sim).sum(axis=1)
+
+    match_pairs = gt_ids[match_gt] * n_t_ids + t_ids[match_t]
+    for a in range(n_alpha):
+        matches_count = np.bincount(
+            match_pairs[matched[a]], minlength=n_gt_ids * n_t_ids
+        ).reshape(n_gt_ids, n_t_ids)
+        tp = np.maximum(1, res["HOTA_TP"][a])
+        ass_a = matches_count / np.maximum(
+            1, gt_id_count + t_id_count - matches_count
+        )
+        res["AssA"][a] = np.sum(matches_count * ass_a) / tp
+        ass_re = matches_count / np.maximum(1, gt_id_count)
+        res["AssRe"][a] = np.sum(matches_count * ass_re) / tp
+        ass_pr = matches_count / np.maximum(1, t_id_count)
+        res["AssPr"][a] = np.sum(matches_count * ass_pr) / tp
+
+    res["LocA"] = np.maximum(1e-10, res["LocA"]) / np.maximum(
+        1e-10, res["HOTA_TP"]
+    )
+    return _summarize(_final_fields(res))
+
+
+def _summarize(res):
+    res["mean"] = {field: float(np.mean(res[field])) for field in FIELDS}
+    return res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--gtSource", type=str, help="Path to the gt.txt file")
+    parser.add_argument(
+        "--tSource", type=str, help="Path to the tracker output"
+    )
+
+    args = parser.parse_args()
+
+    gt = load_mot(args.gtSource, cache_dir_from_env())
+    result = hota(gt, load_mot(args.tSource))
+    for field, value in result["mean"].items():
+        print(f"{field:>6}: {value:.4f}")
@@ -0,0 +1,105 @@
+"""
+Loading of MOT txt files for the metric scripts.
+
+Parsed GT files can be cached as .npy, so re-scoring the same gt.txt
+against many tracker runs skips parsing. The cache is off unless the
+MOT_CACHE_DIR environment variable names its folder; tracker outputs,
+usually scored once, are never cached.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+CACHE_ENV = "MOT_CACHE_DIR"
+CHUNK_SIZE = 16 << 20
+CHUNK_ROWS = 1 << 20
+
+
+def source_hash(path, chunk_size=CHUNK_SIZE):
+    """blake2b digest of the file contents, the key of the parsed cache."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_dir_from_env():
+    """Absolute cache folder from MOT_CACHE_DIR, None when it is not set."""
+    cache_dir = os.environ.get(CACHE_ENV)
+    return os.path.abspath(cache_dir) if cache_dir else None
+
+
+def count_lines(path, chunk_size=CHUNK_SIZE):
+    """Number of lines, counting a last line without a newline."""
+    lines, last = 0, b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    return lines + (last != b"\n")
+
+
+def sniff_delimiter(path):
+    """MOT files from our tools are either comma or space delimited."""
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                return "," if "," in line else r"\s+"
+    return r"\s+"
+
+
+def parse_mot(path, chunk_rows=CHUNK_ROWS):
+    """
+    Parses a MOT txt file (space or comma delimited) with the pandas C
+    parser, `chunk_rows` rows at a time, so no intermediate Python
+    objects are built per line. The chunks are copied into one array
+    allocated up front from the line count, so peak memory stays at the
+    result plus one chunk. Returns a 2D float array.
+    """
+    if os.path.getsize(path) == 0:
+        return np.empty((0, 10))
+    max_rows = count_lines(path)
+
+    reader = pd.read_csv(
+        path,
+        sep=sniff_delimiter(path),
+        header=None,
+        dtype=np.float64,
+        engine="c",
+        chunksize=chunk_rows,
+    )
+    data, rows = None, 0
+    with reader:
+        for chunk in reader:
+            if data is None:
+                data = np.empty((max_rows, chunk.shape[1]), dtype=np.float64)
+            data[rows:rows + len(chunk)] = chunk.to_numpy(np.float64)
+            rows += len(chunk)
+    # Blank lines are counted but not parsed
+    return np.empty((0, 10)) if data is None else data[:rows]
+
+
+def load_mot(path, cache_dir=None):
+    """
+    Loads a MOT txt file as a 2D float array.
+
+    With cache_dir, the parsed array is cached as
+    <cache_dir>/<source hash>.npy and later loads of a file with the
+    same contents are memory-mapped from the cache without parsing.
+    """
+    if cache_dir is None:
+        return parse_mot(path)
+
+    cache_path = os.path.join(cache_dir, f"{source_hash(path)}.npy")
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode="r")
+
+    data = parse_mot(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, data)
+    os.replace(tmp_path, cache_path)
+    return data
@@ -0,0 +1,273 @@
+import argparse
+import sys
+import time
+from collections import defaultdict
+
+import motmetrics as mm
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from src.metrics.calculate_tracking_metrics import (
+    frame_bounds,
+    index_frames,
+    iou_distances,
+)
+from src.metrics.mot_io import cache_dir_from_env, load_mot
+
+
+class OnlineMOTAccumulator:
+    """
+    Scores a tracker frame by frame while it runs.
+
+    Matching per frame follows motmetrics.MOTAccumulator.update: matches
+    kept from earlier frames first, Hungarian assignment for the rest,
+    and an id switch when a GT object is matched to another tracker id
+    than last time. Instead of storing events, only counters are kept:
+    CLEAR MOT totals, the last match of every GT id and, for IDF1, the
+    number of frames each (GT id, tracker id) pair overlapped. Memory is
+    bounded by the number of ids, not by the length of the game, and
+    IDF1 from these counts equals the motmetrics value.
+    """
+
+    def __init__(self, gt, max_iou=0.5):
+        self.gt_index = index_frames(gt)
+        self.gt_last_frame = int(self.gt_index[1][-1]) if len(gt) else 0
+        self.max_iou = max_iou
+
+        self.last_frame = 0
+        self.num_frames = 0
+        self.num_gt = 0
+        self.num_t = 0
+        self.matches = 0
+        self.misses = 0
+        self.false_positives = 0
+        self.switches = 0
+        self.dist_sum = 0.0
+
+        self.last_match = {}
+        self.pair_overlaps = defaultdict(int)
+
+    def update(self, frame, t_dets):
+        """
+        Adds one tracker frame. t_dets holds rows of (id, x, y, w, h).
+        Frames must arrive in increasing order; skipped frames are
+        scored with no tracker output.
+        """
+        frame = int(frame)
+        if frame <= self.last_frame:
+            raise ValueError(
+                f"Frame {frame} arrived after frame {self.last_frame}"
+            )
+        empty = np.empty((0, 5))
+        for skipped in range(self.last_frame + 1, frame):
+            self._update_frame(skipped, empty)
+        self._update_frame(frame, np.asarray(t_dets, dtype=float))
+
+    def finalize(self):
+        """Scores the GT frames after the last tracker frame."""
+        empty = np.empty((0, 5))
+        for frame in range(self.last_frame + 1, self.gt_last_frame + 1):
+            self._update_frame(frame, empty)
+
+    def _update_frame(self, frame, t_dets):
+        self.last_frame = frame
+        start, stop = frame_bounds(self.gt_index, np.array([frame]))
+        gt_dets = self.gt_index[0][start[0]:stop[0], 1:6]
+        n_gt, n_t = len(gt_dets), len(t_dets)
+        # Empty frames count too, as in accumulate()
+        self.num_frames += 1
+        if n_gt == 0 and n_t == 0:
+            return
+
+        dists, _ = iou_distances(
+            gt_dets[:, 1:], t_dets[:, 1:],
+            (np.array([0]), np.array([n_gt])),
+            (np.array([0]), np.array([n_t])),
+            self.max_iou,
+        )
+        dists = dists.reshape(n_gt, n_t)
+        gt_ids = gt_dets[:, 0].astype(int).tolist()
+        t_ids = t_dets[:, 0].astype(int).tolist()
+
+        self.num_gt += n_gt
+        self.num_t += n_t
+
+        valid = ~np.isnan(dists)
+        for r, c in zip(*np.nonzero(valid)):
+            self.pair_overlaps[(gt_ids[r], t_ids[c])] += 1
+
+        # Matches carried over from the previous frames
+        free_gt = np.ones(n_gt, bool)
+        free_t = np.ones(n_t, bool)
+        t_col = {t_id: c for c, t_id in enumerate(t_ids)}
+        for r, gt_id in enumerate(gt_ids):
+            c = t_col.get(self.last_match.get(gt_id))
+            if c is not None and free_t[c] and valid[r, c]:
+                free_gt[r] = free_t[c] = False
+                self.matches += 1
+                self.dist_sum += dists[r, c]
+
+        # Hungarian assignment for the remaining objects, with the
+        # solver of motmetrics: invalid pairs get a cost no set of valid
+        # matches can outweigh, and are dropped from the result
+        rows, cols = np.flatnonzero(free_gt), np.flatnonzero(free_t)
+        if len(rows) and len(cols):
+            sub = dists[np.ix_(rows, cols)]
+            if not np.isnan(sub).all():
+                for i, j in zip(*mm.lap.linear_sum_assignment(sub)):
+                    r, c = rows[i], cols[j]
+                    free_gt[r] = free_t[c] = False
+                    gt_id = gt_ids[r]
+                    previous = self.last_match.get(gt_id)
+                    if previous is not None and previous != t_ids[c]:
+                        self.switches += 1
+                    self.last_match[gt_id] = t_ids[c]
+                    self.matches += 1
+                    self.dist_sum += dists[r, c]
+
+        self.misses += int(free_gt.sum())
+        self.false_positives += int(free_t.sum())
+
+    def idtp(self):
+        """
+        IDTP of the global id assignment: a maximum-weight matching of GT
+        ids to tracker ids by the number of frames they overlapped.
+        """
+        if not self.pair_overlaps:
+            return 0
+        gt_ids = sorted({o for o, _ in self.pair_overlaps})
+        t_ids = sorted({h for _, h in self.pair_overlaps})
+        rows = {o: i for i, o in enumerate(gt_ids)}
+        cols = {h: j for j, h in enumerate(t_ids)}
+        overlaps = np.zeros((len(gt_ids), len(t_ids)))
+        for (o, h), count in self.pair_overlaps.items():
+            overlaps[rows[o], cols[h]] = count
+        r, c = linear_sum_assignment(-overlaps)
+        return int(overlaps[r, c].sum())
+
+    def summary(self):
+        """Metrics over the frames seen so far, as in METRICS."""
+        idtp = self.idtp()
+        return {
+            "num_frames": self.num_frames,
+            "idf1": 2 * idtp / max(1, self.num_gt + self.num_t),
+            "recall": self.matches / max(1, self.num_gt),
+            "precision": self.matches
+            / max(1, self.matches + self.false_positives),
+            "mota": 1 - (self.misses + self.false_positives + self.switches)
+            / max(1, self.num_gt),
+            "motp": self.dist_sum / max(1, self.matches),
+            "num_switches": self.switches,
+        }
+
+
+def follow(path, poll=1.0, idle_timeout=30.0):
+    """
+    Yields lines of a file that is still being written, like tail -f.
+    Stops after `idle_timeout` seconds without new data. "-" reads stdin.
+    """
+    if path == "-":
+        yield from sys.stdin
+        return
+
+    with open(path, "r") as f:
+        buffer = ""
+        idle = 0.0
+        while True:
+            line = f.readline()
+            if not line:
+                if idle >= idle_timeout:
+                    break
+                time.sleep(poll)
+                idle += poll
+                continue
+            idle = 0.0
+            buffer += line
+            if buffer.endswith("\n"):
+                yield buffer
+                buffer = ""
+        if buffer:
+            yield buffer
+
+
+def iter_frames(lines):
+    """
+    Groups MOT lines (space or comma delimited) by frame number and
+    yields (frame, rows of id, x, y, w, h) once the next frame starts.
+    """
+    frame, rows = None, []
+    for line in lines:
+        values = line.replace(",", " ").split()
+        if not values:
+            continue
+        row_frame = int(float(values[0]))
+        if frame is not None and row_frame != frame:
+            yield frame, np.array(rows)
+            rows = []
+        frame = row_frame
+        rows.append([float(v) for v in values[1:6]])
+    if frame is not None:
+        yield frame, np.array(rows)
+
+
+def evaluate_online(acc, frames, every=500, min_frames=0, abort_mota=None):
+    """
+    Feeds (frame, detections) pairs into the accumulator and prints the
+    rolling metrics every `every` frames. Returns False if the run was
+    aborted because MOTA fell below `abort_mota` after `min_frames`.
+    """
+    for frame, t_dets in frames:
+        acc.update(frame, t_dets)
+        if every and acc.last_frame % every == 0:
+            s = acc.summary()
+            print(
+                f"frame {acc.last_frame}: IDF1 {s['idf1']:.3f} "
+                f"MOTA {s['mota']:.3f} MOTP {s['motp']:.3f} "
+                f"IDSW {s['num_switches']}"
+            )
+            if (
+                abort_mota is not None
+                and acc.last_frame >= min_frames
+                and s["mota"] < abort_mota
+            ):
+                print(f"MOTA below {abort_mota}, aborting")
+                return False
+    acc.finalize()
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--gtSource", type=str, help="Path to the gt.txt file")
+    parser.add_argument(
+        "--tSource", type=str,
+        help="Tracker output being written, or - for stdin",
+    )
+    parser.add_argument(
+        "--every", type=int, default=500, help="Report every N frames"
+    )
+    parser.add_argument(
+        "--idleTimeout", type=float, default=30.0,
+        help="Stop when the tracker output has not grown for N seconds",
+    )
+    parser.add_argument(
+        "--abortMota", type=float, default=None,
+        help="Exit with code 1 when rolling MOTA falls below this value",
+    )
+    parser.add_argument(
+        "--minFrames", type=int, default=1000,
+        help="Frames to see before --abortMota applies",
+    )
+
+    args = parser.parse_args()
+
+    gt = load_mot(args.gtSource, cache_dir_from_env())
+    acc = OnlineMOTAccumulator(gt)
+    lines = follow(args.tSource, idle_timeout=args.idleTimeout)
+    finished = evaluate_online(
+        acc, iter_frames(lines), args.every, args.minFrames, args.abortMota
+    )
+    for name, value in acc.summary().items():
+        print(f"{name:>12}: {value}")
+    sys.exit(0 if finished else 1)
@@ -0,0 +1,120 @@
+import argparse
+import glob
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import motmetrics as mm
+import numpy as np
+import pandas as pd
+
+from src.metrics.calculate_tracking_metrics import (
+    METRICS,
+    NAMEMAP,
+    accumulate,
+    index_frames,
+)
+from src.metrics.evaluate_sequences import write_report
+from src.metrics.mot_io import cache_dir_from_env, load_mot
+
+SWEEP_METRICS = METRICS + ["num_switches"]
+SWEEP_NAMEMAP = {**NAMEMAP, "num_switches": "IDs"}
+
+# GT index of a worker process, set by _init_worker
+_gt_index = None
+
+
+def find_candidates(pattern):
+    """
+    Tracker outputs to score: every .txt in a folder, or the files
+    matching a glob. Returns {name: path}, name is the path relative to
+    the common folder without the extension, so runs/*/out.txt gives
+    distinct names.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.txt")
+    paths = sorted(p for p in glob.glob(pattern) if os.path.isfile(p))
+    if not paths:
+        return {}
+    root = os.path.commonpath(
+        [os.path.dirname(os.path.abspath(p)) for p in paths]
+    )
+    return {
+        os.path.splitext(os.path.relpath(os.path.abspath(p), root))[0]: p
+        for p in paths
+    }
+
+
+def _init_worker(rows_path, frames, offsets):
+    # The GT rows are memory-mapped: the file pages are shared by all
+    # workers, so GT is not copied into every process
+    global _gt_index
+    _gt_index = (np.load(rows_path, mmap_mode="r"), frames, offsets)
+
+
+def score_candidate(task):
+    """Scores one tracker output against the shared GT index."""
+    name, t_path = task
+    acc = accumulate(None, load_mot(t_path), gt_index=_gt_index)
+    mh = mm.metrics.create()
+    return mh.compute(acc, metrics=SWEEP_METRICS, name=name)
+
+
+def sweep(gt_path, candidates, workers=None):
+    """
+    Scores many tracker outputs against one GT.
+
+    The GT is parsed and sorted by frame once; the sorted rows are saved
+    as .npy and memory-mapped read-only by every worker. Workers return
+    only their summary row, not the accumulator events. Rows are sorted
+    by IDF1, then MOTA.
+    """
+    if not candidates:
+        raise FileNotFoundError("No tracker outputs to score")
+
+    gt = load_mot(gt_path, cache_dir_from_env())
+    rows, frames, offsets = index_frames(gt)
+    with tempfile.TemporaryDirectory() as tmp:
+        rows_path = os.path.join(tmp, "gt_rows.npy")
+        np.save(rows_path, rows)
+        del rows
+
+        with ProcessPoolExecutor(
+            workers,
+            initializer=_init_worker,
+            initargs=(rows_path, frames, offsets),
+        ) as pool:
+            summaries = list(pool.map(score_candidate, candidates.items()))
+
+    return pd.concat(summaries).sort_values(["idf1", "mota"], ascending=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--gtSource", type=str, help="Path to the gt.txt file")
+    parser.add_argument(
+        "--trackers", type=str,
+        help="Folder with tracker outputs (*.txt) or a glob, "
+        "e.g. 'runs/*/out.txt'",
+    )
+    parser.add_argument(
+        "--output", type=str, default="",
+        help="Leaderboard path (.json or .csv)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of processes"
+    )
+    parser.add_argument(
+        "--top", type=int, default=0, help="Print only the N best outputs"
+    )
+
+    args = parser.parse_args()
+
+    leaderboard = sweep(
+        args.gtSource, find_candidates(args.trackers), args.workers
+    )
+    shown = leaderboard.head(args.top) if args.top else leaderboard
+    print(mm.io.render_summary(shown, namemap=SWEEP_NAMEMAP))
+    if args.output:
+        write_report(leaderboard, args.output)
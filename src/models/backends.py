@@ -0,0 +1,138 @@
+"""
+Inference backends for the ReID model. A backend is called with a
+float32 NCHW batch (see predict_model.preprocess) and returns the
+features (N, feature_dim) as a float32 numpy array, not normalized.
+
+- torch: the torchreid checkpoint (any device, see train_model.select_device);
+- onnxruntime: the ONNX export (export_onnx.py) on CPU;
+- openvino: the same ONNX file compiled by OpenVINO for CPU.
+
+torch and torchreid are imported only by the torch backend, so the
+ONNX backends also run on hosts without them.
+"""
+import importlib.util
+
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    import openvino
+except ImportError:
+    openvino = None
+
+BACKENDS = ("torch", "onnxruntime", "openvino")
+
+DEFAULT_ONNX = "models/osnet-1.0-softmax-custom/osnet_x1_0.onnx"
+
+
+def load_model(checkpoint, config, device):
+    """
+    Builds the model of the training config and loads the checkpoint
+    (the classifier, sized for the training identities, is skipped).
+    """
+    import torchreid
+
+    model = torchreid.models.build_model(
+        name=config["model"]["name"],
+        num_classes=1,
+        loss="softmax",
+        pretrained=False,
+    )
+    torchreid.utils.load_pretrained_weights(model, checkpoint)
+    return model.to(device).eval()
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, checkpoint, config, device="cpu", threads=None):
+        import torch
+
+        from src.models.train_model import select_device
+
+        self.torch = torch
+        if threads:
+            torch.set_num_threads(threads)
+        self.device = select_device(device)
+        self.model = load_model(checkpoint, config, self.device)
+        self.feature_dim = self.model.feature_dim
+
+    def __call__(self, batch):
+        with self.torch.inference_mode():
+            x = self.torch.from_numpy(batch).to(self.device)
+            return self.model(x).float().cpu().numpy()
+
+
+class OnnxRuntimeBackend:
+    name = "onnxruntime"
+
+    def __init__(self, model_path, threads=None):
+        if onnxruntime is None:
+            raise RuntimeError("onnxruntime is not installed")
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.feature_dim = self.session.get_outputs()[0].shape[1]
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoBackend:
+    name = "openvino"
+
+    def __init__(self, model_path, threads=None):
+        if openvino is None:
+            raise RuntimeError("openvino is not installed")
+        config = {"INFERENCE_NUM_THREADS": threads} if threads else {}
+        self.model = openvino.Core().compile_model(model_path, "CPU", config)
+        shape = self.model.outputs[0].get_partial_shape()
+        self.feature_dim = shape[1].get_length()
+
+    def __call__(self, batch):
+        return np.asarray(self.model(batch)[0], dtype=np.float32)
+
+
+def available_backends():
+    """Backends whose runtime is installed."""
+    installed = (
+        importlib.util.find_spec("torch") is not None,
+        onnxruntime is not None,
+        openvino is not None,
+    )
+    return tuple(name for name, ok in zip(BACKENDS, installed) if ok)
+
+
+def load_backend(
+    name, checkpoint, onnx_path, config, device="cpu", threads=None
+):
+    """
+    Creates a backend by name: torch runs `checkpoint`, onnxruntime and
+    openvino run `onnx_path` on CPU.
+
+    :return: (backend, path of the weights it runs)
+    """
+    if name == "torch":
+        return TorchBackend(checkpoint, config, device, threads), checkpoint
+    if name == "onnxruntime":
+        return OnnxRuntimeBackend(onnx_path, threads), onnx_path
+    if name == "openvino":
+        return OpenVinoBackend(onnx_path, threads), onnx_path
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def l2_normalize(features, eps=1e-12):
+    """Rows scaled to unit length, as torch.nn.functional.normalize."""
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.maximum(norms, eps)
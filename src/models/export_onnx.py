@@ -0,0 +1,119 @@
+"""
+Exports the trained OSNet checkpoint to ONNX for the onnxruntime and
+openvino backends of predict_model (see backends.py).
+
+The graph takes a float32 batch "input" (N, 3, height, width) with a
+dynamic batch axis and returns the features "features" (N, feature_dim)
+before L2 normalization. Before the file replaces --output, onnxruntime
+runs it on random batches and its normalized features are compared to
+the torch model: the export fails if any element differs by more than
+--atol.
+
+    python -m src.models.export_onnx \\
+        --output models/osnet-1.0-softmax-custom/osnet_x1_0.onnx
+"""
+import click
+import numpy as np
+import torch
+import yaml
+
+from src.config import DEFAULT_CONFIG
+from src.data.checkpoint import atomic_path
+from src.models.backends import (
+    DEFAULT_ONNX,
+    OnnxRuntimeBackend,
+    l2_normalize,
+    load_model,
+)
+from src.models.predict_model import DEFAULT_CHECKPOINT
+
+PARITY_BATCHES = (1, 4, 16)
+
+
+def parity(model, session, size, batch_sizes=PARITY_BATCHES, seed=0):
+    """
+    Largest absolute difference and smallest cosine similarity between
+    the normalized features of the torch model and of the onnxruntime
+    session on random batches.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    max_diff, min_cosine = 0.0, 1.0
+    for batch_size in batch_sizes:
+        batch = rng.standard_normal(
+            (batch_size, 3, height, width), dtype=np.float32
+        )
+        with torch.inference_mode():
+            expected = l2_normalize(model(torch.from_numpy(batch)).numpy())
+        actual = l2_normalize(session(batch))
+        max_diff = max(max_diff, float(np.abs(expected - actual).max()))
+        cosine = (expected * actual).sum(axis=1).min()
+        min_cosine = min(min_cosine, float(cosine))
+    return max_diff, min_cosine
+
+
+@click.command()
+@click.option(
+    "--checkpoint",
+    default=DEFAULT_CHECKPOINT,
+    type=click.Path(exists=True),
+    help="Trained OSNet weights (torchreid checkpoint).",
+)
+@click.option(
+    "--config",
+    "config_path",
+    default=DEFAULT_CONFIG,
+    type=click.Path(exists=True),
+    help="Training config with the model name and input size.",
+)
+@click.option(
+    "--output", default=DEFAULT_ONNX, type=click.Path(), help="ONNX file."
+)
+@click.option("--opset", default=17, type=int, help="ONNX opset version.")
+@click.option(
+    "--atol",
+    default=1e-4,
+    type=float,
+    help="Largest allowed difference of normalized features from torch.",
+)
+def main(checkpoint, config_path, output, opset, atol):
+    """Exports the checkpoint to ONNX and checks it against torch."""
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    size = (config["data"]["width"], config["data"]["height"])
+    model = load_model(checkpoint, config, "cpu")
+
+    width, height = size
+    dummy = torch.zeros(1, 3, height, width)
+    with atomic_path(output) as tmp_path:
+        torch.onnx.export(
+            model,
+            dummy,
+            tmp_path,
+            input_names=["input"],
+            output_names=["features"],
+            dynamic_axes={"input": {0: "batch"}, "features": {0: "batch"}},
+            opset_version=opset,
+        )
+        try:
+            session = OnnxRuntimeBackend(tmp_path)
+        except RuntimeError as e:
+            raise click.ClickException(f"{e}, cannot check the export")
+
+        max_diff, min_cosine = parity(model, session, size)
+        print(
+            f"onnxruntime vs torch: max abs diff {max_diff:.2e}, "
+            f"min cosine {min_cosine:.6f}"
+        )
+        if max_diff > atol:
+            raise click.ClickException(
+                f"Export differs from torch by {max_diff:.2e} > {atol:.0e}"
+            )
+    print(
+        f"Exported {output} ({session.feature_dim}-d features, "
+        f"opset {opset})"
+    )
+
+
+if __name__ == "__main__":
+    main()
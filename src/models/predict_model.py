@@ -0,0 +1,584 @@
+"""
+ReID embeddings for player crops from the trained OSNet checkpoint.
+
+The model is loaded once into one of the backends (torch, onnxruntime
+or openvino, see backends.py). Crops come from a folder of crop images,
+a packed crop shard (crop_store) or a stream of crop paths on stdin. A
+pool of threads decodes and normalizes them, and a dynamic batcher
+groups them into batches of up to --batch-size, waiting at most
+--max-wait-ms for a batch to fill. L2-normalized embeddings are written
+row by row to a memory-mapped .npy matrix; the crop of every row is
+listed in <output>.keys.txt.
+
+With --cache, embeddings are looked up by crop hash in the embedding
+cache (see build_features) first; only missing crops are decoded and
+run through the model, so a rerun over unchanged crops does no forward
+pass at all.
+
+    python -m src.models.predict_model data/interim/market1501/query \\
+        data/processed/query_embeddings.npy --threads 8
+"""
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import click
+import cv2
+import numpy as np
+import yaml
+
+from src.config import DEFAULT_CONFIG
+from src.data.checkpoint import TMP_SUFFIX
+from src.data.crop_store import PackedCropStore
+from src.data.crop_writer import FORMATS
+from src.features.build_features import (
+    EmbeddingCache,
+    crop_hash,
+    model_fingerprint,
+)
+from src.models.backends import (
+    BACKENDS,
+    DEFAULT_ONNX,
+    l2_normalize,
+    load_backend,
+)
+
+DEFAULT_CHECKPOINT = "models/osnet-1.0-softmax-custom/model/model.pth.tar-150"
+
+CROP_EXTS = tuple(ext for ext, _ in FORMATS.values())
+
+# Normalization of the training transforms (see train_model)
+NORM_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+NORM_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# .npy header with a fixed size, so the shape can be rewritten in place
+# while the matrix grows
+NPY_HEADER_SIZE = 128
+
+
+def decode(data):
+    """Encoded crop bytes -> BGR crop, None if it cannot be decoded."""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def read_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def preprocess(image, size):
+    """
+    BGR crop -> normalized CHW float32, as the test transforms of
+    torchreid. Crops already stored at `size` (create_reid_dataset
+    --resize) are not resized again.
+    """
+    width, height = size
+    if image.shape[:2] != (height, width):
+        image = cv2.resize(
+            image, (width, height), interpolation=cv2.INTER_LINEAR
+        )
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32) / 255
+    return ((image - NORM_MEAN) / NORM_STD).transpose(2, 0, 1)
+
+
+def open_source(source):
+    """
+    Crops of a folder, a packed shard (<root>/<split>.idx.npy) or "-"
+    (crop paths read from stdin as they arrive).
+
+    :return: (number of crops or None for a stream, iterator of keys,
+        function reading the encoded crop of a key or None,
+        function naming a key)
+    """
+    if source == "-":
+        keys = (line.strip() for line in sys.stdin if line.strip())
+        return None, keys, read_file, str
+
+    if source.endswith(".idx.npy"):
+        root, name = os.path.split(source)
+        split = name[: -len(".idx.npy")]
+        store = PackedCropStore(root, split)
+        name = f"{split}/{{}}".format
+        return len(store), iter(range(len(store))), store.raw, name
+
+    paths = []
+    for folder, _, files in os.walk(source):
+        paths.extend(
+            os.path.relpath(os.path.join(folder, f), source)
+            for f in files
+            if f.lower().endswith(CROP_EXTS)
+        )
+    paths.sort()
+
+    def read(path):
+        return read_file(os.path.join(source, path))
+
+    return len(paths), iter(paths), read, str
+
+
+def bounded_map(pool, fn, items, limit):
+    """
+    pool.map that keeps at most `limit` items in flight, for endless
+    streams.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class DynamicBatcher:
+    """
+    Runs fn on batches of submitted items in a background thread. A
+    batch is closed when it has batch_size items or max_wait seconds
+    after its first item arrived, so a slow stream is not held back
+    waiting for a full batch. fn maps a list of items to a sequence of
+    results; submit returns a Future of one result.
+
+    latencies holds the seconds from submit to result of every item,
+    batch_sizes the size of every batch run.
+    """
+
+    def __init__(self, fn, batch_size=64, max_wait=0.005):
+        self.fn = fn
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.latencies = []
+        self.batch_sizes = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    request = self._queue.get(
+                        timeout=max(deadline - time.perf_counter(), 0)
+                    )
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._process(batch)
+                    return
+                batch.append(request)
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            results = self.fn([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        done = time.perf_counter()
+        self.batch_sizes.append(len(batch))
+        for (_, future, submitted), result in zip(batch, results):
+            self.latencies.append(done - submitted)
+            future.set_result(result)
+
+    def close(self):
+        """Runs the remaining items and stops the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EmbeddingWriter:
+    """
+    Writes embedding rows to a memory-mapped .npy matrix of `dtype`.
+    Without `capacity` (a stream) the file grows by doubling. The matrix
+    is written to <path>.tmp and renamed on close, trimmed to the rows
+    written, so np.load(path, mmap_mode="r") reads it without a copy.
+    """
+
+    def __init__(self, path, dim, dtype=np.float16, capacity=None):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._tmp_path = path + TMP_SUFFIX
+        self._file = open(self._tmp_path, "w+b")
+        self._matrix = None
+        self._resize(capacity or 1024)
+
+    def _write_header(self, rows):
+        header = repr(
+            {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": (rows, self.dim),
+            }
+        )
+        header = header.ljust(NPY_HEADER_SIZE - 11) + "\n"
+        self._file.seek(0)
+        self._file.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)))
+        self._file.write(header.encode("latin1"))
+
+    def _resize(self, capacity):
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        self._write_header(capacity)
+        self._file.truncate(
+            NPY_HEADER_SIZE + capacity * self.dim * self.dtype.itemsize
+        )
+        self._file.flush()
+        self.capacity = capacity
+        if capacity:
+            self._matrix = np.memmap(
+                self._file,
+                dtype=self.dtype,
+                mode="r+",
+                offset=NPY_HEADER_SIZE,
+                shape=(capacity, self.dim),
+            )
+
+    def add(self, embedding):
+        if self.rows == self.capacity:
+            self._resize(max(2 * self.capacity, 1))
+        self._matrix[self.rows] = embedding
+        self.rows += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._resize(self.rows)
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Drops the partial matrix."""
+        self._matrix = None
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def latency_report(crops, elapsed, latencies, batch_sizes):
+    """crops/s of the run and percentiles of the model latencies (seconds)."""
+    speed = crops / max(elapsed, 1e-9)
+    report = f"{crops} crops in {elapsed:.1f}s: {speed:.1f} crops/s"
+    if not latencies:
+        return report + ", no forward passes"
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1e3, [50, 95, 99])
+    return (
+        f"{report}, {len(latencies)} through the model with latency "
+        f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, "
+        f"mean batch {np.mean(batch_sizes):.1f}"
+    )
+
+
+def resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def ready(future):
+    """Whether a pending crop has its embedding (or failed to decode)."""
+    if not future.done():
+        return False
+    result = future.result()
+    return not isinstance(result, Future) or result.done()
+
+
+class OrderedEmbedder:
+    """
+    Embeds crops in source order. Each chunk of loaded crops is looked
+    up in the cache (if any); the missing ones are decoded in `pool` and
+    run through `batcher`. Finished crops are written to `writer` and
+    `keys_file` in the order they were submitted, and the new embeddings
+    are put into the cache in batches.
+    """
+
+    def __init__(self, batcher, pool, writer, keys_file, name, size,
+                 cache=None, batch_size=64):
+        self.batcher = batcher
+        self.pool = pool
+        self.writer = writer
+        self.keys_file = keys_file
+        self.name = name
+        self.size = size
+        self.cache = cache
+        self.batch_size = batch_size
+        # (key, crop hash, future) in source order. The future holds the
+        # cached embedding, or the batcher future of a decoded crop (None
+        # if the crop cannot be decoded)
+        self.pending = deque()
+        self.new_entries = []
+
+    def _submit(self, data):
+        image = decode(data)
+        if image is None:
+            return None
+        return self.batcher.submit(preprocess(image, self.size))
+
+    def lookup(self, chunk):
+        """Queues a chunk of (key, encoded crop, crop hash) items."""
+        hits = {}
+        if self.cache is not None:
+            hits = self.cache.get_many(h for _, _, h in chunk)
+        for key, data, digest in chunk:
+            if data is None:
+                print(f"Cannot read {self.name(key)}, skipped")
+            elif digest in hits:
+                self.pending.append((key, digest, resolved(hits[digest])))
+            else:
+                self.pending.append(
+                    (key, digest, self.pool.submit(self._submit, data))
+                )
+
+    def write_ready(self, limit):
+        """
+        Writes finished crops in source order; waits only while more than
+        `limit` crops are pending.
+        """
+        pending = self.pending
+        while pending and (len(pending) > limit or ready(pending[0][2])):
+            key, digest, future = pending.popleft()
+            result = future.result()
+            if result is None:
+                print(f"Cannot decode {self.name(key)}, skipped")
+                continue
+            if isinstance(result, Future):
+                result = result.result()
+                if self.cache is not None:
+                    self.new_entries.append((digest, result))
+            self.writer.add(result)
+            self.keys_file.write(f"{self.name(key)}\n")
+
+        if self.new_entries and (
+            len(self.new_entries) >= self.batch_size or not pending
+        ):
+            self.cache.put_many(self.new_entries)
+            self.new_entries.clear()
+
+
+def load_model(backend, checkpoint, onnx_path, config, device, threads):
+    """load_backend with its errors as click errors."""
+    weights = checkpoint if backend == "torch" else onnx_path
+    if not os.path.exists(weights):
+        raise click.ClickException(f"{weights} does not exist")
+    try:
+        return load_backend(
+            backend, checkpoint, onnx_path, config, device, threads
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+def open_cache(cache_path, weights, size, cache_size_mb):
+    """The embedding cache of the weights file, None without --cache."""
+    if not cache_path:
+        return None
+    # Embeddings of different backends differ slightly, so each weights
+    # file has its own cache entries
+    return EmbeddingCache(
+        cache_path, model_fingerprint(weights, size), cache_size_mb * 2 ** 20
+    )
+
+
+def embed_crops(crops, model, size, writer, cache, batch_size, max_wait,
+                decode_threads):
+    """
+    Reads the crops of a source (see open_source) with `decode_threads`
+    threads and writes their embeddings to `writer` and
+    <writer.path>.keys.txt.
+
+    :return: the DynamicBatcher that ran the model, for its latencies
+    """
+    count, keys, read, name = crops
+
+    def load(key):
+        data = read(key)
+        if data is None or cache is None:
+            return key, data, None
+        return key, data, crop_hash(data)
+
+    def embed(batch):
+        return l2_normalize(model(np.stack(batch)))
+
+    # Enough crops in flight for the batcher to fill whole batches; a
+    # stream is looked up in the cache crop by crop so it is not delayed
+    limit = 4 * batch_size
+    chunk_size = 1 if count is None else batch_size
+    batcher = DynamicBatcher(embed, batch_size, max_wait)
+    with batcher, ThreadPoolExecutor(decode_threads) as pool, open(
+        writer.path + ".keys.txt", "w"
+    ) as keys_file:
+        embedder = OrderedEmbedder(
+            batcher, pool, writer, keys_file, name, size, cache, batch_size
+        )
+        chunk = []
+        for item in bounded_map(pool, load, keys, limit):
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                embedder.lookup(chunk)
+                chunk = []
+                embedder.write_ready(limit)
+        embedder.lookup(chunk)
+        embedder.write_ready(0)
+    return batcher
+
+
+@click.command()
+@click.argument("source")
+@click.argument("output_filepath", type=click.Path())
+@click.option(
+    "--backend",
+    default="torch",
+    type=click.Choice(BACKENDS),
+    help="Inference backend; onnxruntime and openvino run --onnx on CPU.",
+)
+@click.option(
+    "--checkpoint",
+    default=DEFAULT_CHECKPOINT,
+    type=click.Path(),
+    help="Trained OSNet weights (torchreid checkpoint) for the torch backend.",
+)
+@click.option(
+    "--onnx",
+    "onnx_path",
+    default=DEFAULT_ONNX,
+    type=click.Path(),
+    help="Model exported by export_onnx.py for onnxruntime/openvino.",
+)
+@click.option(
+    "--config",
+    "config_path",
+    default=DEFAULT_CONFIG,
+    type=click.Path(exists=True),
+    help="Training config with the model name and input size.",
+)
+@click.option("--device", default="cpu", help="auto, cpu, cuda or cuda:N.")
+@click.option("--batch-size", default=64, type=int, help="Largest batch.")
+@click.option(
+    "--max-wait-ms",
+    default=5.0,
+    type=float,
+    help="How long a batch waits to fill after its first crop.",
+)
+@click.option(
+    "--threads",
+    default=os.cpu_count(),
+    type=int,
+    help="Intra-op threads of the backend on CPU.",
+)
+@click.option(
+    "--decode-threads",
+    default=2,
+    type=int,
+    help="Threads reading, hashing and decoding crops.",
+)
+@click.option(
+    "--dtype",
+    default="float16",
+    type=click.Choice(["float16", "float32"]),
+    help="Dtype of the embedding matrix.",
+)
+@click.option(
+    "--cache",
+    "cache_path",
+    default=None,
+    type=click.Path(),
+    help="Embedding cache (sqlite) to reuse embeddings of unchanged crops.",
+)
+@click.option(
+    "--cache-size-mb",
+    default=1024.0,
+    type=float,
+    help="Size budget of the cache; least recently used embeddings "
+    "are evicted.",
+)
+def main(
+    source,
+    output_filepath,
+    backend,
+    checkpoint,
+    onnx_path,
+    config_path,
+    device,
+    batch_size,
+    max_wait_ms,
+    threads,
+    decode_threads,
+    dtype,
+    cache_path,
+    cache_size_mb,
+):
+    """
+    Writes L2-normalized ReID embeddings of the crops in SOURCE (a crop
+    folder, a packed <split>.idx.npy or "-" for crop paths on stdin) to
+    OUTPUT_FILEPATH (.npy, memory-mapped) and <OUTPUT_FILEPATH>.keys.txt.
+    """
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    size = (config["data"]["width"], config["data"]["height"])
+
+    model, weights = load_model(
+        backend, checkpoint, onnx_path, config, device, threads
+    )
+    cache = open_cache(cache_path, weights, size, cache_size_mb)
+
+    crops = open_source(source)
+    start = time.perf_counter()
+    with EmbeddingWriter(
+        output_filepath, model.feature_dim, dtype, crops[0]
+    ) as writer:
+        batcher = embed_crops(
+            crops, model, size, writer, cache, batch_size,
+            max_wait_ms / 1e3, decode_threads,
+        )
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{writer.rows} embeddings of size {writer.dim} -> {output_filepath}"
+    )
+    print(
+        latency_report(
+            writer.rows, elapsed, batcher.latencies, batcher.batch_sizes
+        )
+    )
+    if cache is not None:
+        print(cache.report())
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+"""
+INT8 post-training quantization of the exported ReID model (see
+export_onnx.py) with onnxruntime, guarded by retrieval accuracy.
+
+- dynamic: weights are quantized ahead of time, activations on the fly;
+  needs no data.
+- static: activations are quantized too (QDQ, per-channel weights),
+  with ranges calibrated on a random sample of bounding_box_train.
+
+The FP32 model and every quantized one embed query and
+bounding_box_test of the dataset written by create_reid_dataset.py, and
+mAP / Rank-1 are computed with the Market1501 protocol of torchreid
+(reimplemented in numpy, so the check needs no torch). A
+quantized model whose mAP or Rank-1 drops more than the allowed points
+below FP32 is rejected: its file is not written and the command fails
+once the report is out. Accepted models run in predict_model with
+--backend onnxruntime --onnx <model>.int8-<method>.onnx.
+
+    python -m src.models.quantize_model --calib-crops 512 --max-map-drop 1.0
+"""
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import numpy as np
+import yaml
+
+from src.config import DEFAULT_CONFIG
+from src.data.checkpoint import atomic_path, atomic_write
+from src.data.crop_store import PackedCropStore
+from src.models.backends import DEFAULT_ONNX, OnnxRuntimeBackend, l2_normalize
+from src.models.predict_model import decode, open_source, preprocess
+
+try:
+    from onnxruntime import quantization
+except ImportError:
+    quantization = None
+
+METHODS = ("dynamic", "static")
+CALIBRATION_METHODS = ("minmax", "entropy", "percentile")
+
+# pid and camera of a Market1501 crop name, as torchreid parses them
+CROP_NAME = re.compile(r"([-\d]+)_c(\d)")
+
+
+class AccuracyDrop(Exception):
+    """A quantized model lost more accuracy than allowed."""
+
+
+def read_part(dataset_dir, part, packed):
+    """
+    Crops of a split with their identities.
+
+    :return: (keys, function reading the encoded crop of a key,
+        pids, camids)
+    """
+    if packed:
+        store = PackedCropStore(dataset_dir, part)
+        pids = np.asarray(store.index["pid"], dtype=np.int64)
+        camids = np.asarray(store.index["camid"], dtype=np.int64)
+        return list(range(len(store))), store.raw, pids, camids
+
+    _, keys, read, _ = open_source(os.path.join(dataset_dir, part))
+    crops = []
+    for key in keys:
+        match = CROP_NAME.search(os.path.basename(key))
+        # pid -1 marks junk crops, skipped by torchreid as well
+        if match and int(match.group(1)) != -1:
+            crops.append((key, int(match.group(1)), int(match.group(2))))
+    keys = [key for key, _, _ in crops]
+    pids = np.array([pid for _, pid, _ in crops], dtype=np.int64)
+    camids = np.array([camid for _, _, camid in crops], dtype=np.int64)
+    return keys, read, pids, camids
+
+
+def batches(keys, read, size, batch_size, pool):
+    """Preprocessed NCHW float32 batches of the crops, in order."""
+
+    def load(key):
+        image = decode(read(key))
+        if image is None:
+            raise click.ClickException(f"Cannot decode crop {key}")
+        return preprocess(image, size)
+
+    for start in range(0, len(keys), batch_size):
+        yield np.stack(list(pool.map(load, keys[start:start + batch_size])))
+
+
+class CalibrationCrops:
+    """
+    Calibration data for quantize_static (the CalibrationDataReader
+    interface of onnxruntime): batches of `count` training crops drawn at
+    random.
+    """
+
+    def __init__(
+        self, input_name, keys, read, size, count, batch_size, pool, seed=0
+    ):
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(keys), min(count, len(keys)), replace=False)
+        self.input_name = input_name
+        self.keys = [keys[i] for i in sorted(sample)]
+        self.read = read
+        self.size = size
+        self.batch_size = batch_size
+        self.pool = pool
+        self.rewind()
+
+    def get_next(self):
+        batch = next(self._batches, None)
+        return None if batch is None else {self.input_name: batch}
+
+    def rewind(self):
+        self._batches = batches(
+            self.keys, self.read, self.size, self.batch_size, self.pool
+        )
+
+
+def quantize(
+    method,
+    model_path,
+    output_path,
+    calibration=None,
+    calibration_method="minmax",
+):
+    if method == "dynamic":
+        quantization.quantize_dynamic(
+            model_path, output_path, weight_type=quantization.QuantType.QInt8
+        )
+        return
+    quantization.quantize_static(
+        model_path,
+        output_path,
+        calibration,
+        quant_format=quantization.QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=quantization.QuantType.QUInt8,
+        weight_type=quantization.QuantType.QInt8,
+        calibrate_method={
+            "minmax": quantization.CalibrationMethod.MinMax,
+            "entropy": quantization.CalibrationMethod.Entropy,
+            "percentile": quantization.CalibrationMethod.Percentile,
+        }[calibration_method],
+    )
+
+
+def evaluate_rank(distmat, q_pids, g_pids, q_camids, g_camids, max_rank=50):
+    """
+    CMC curve and mAP of a query x gallery distance matrix, as
+    torchreid.metrics.evaluate_rank computes them for Market1501: gallery
+    crops of the query identity seen by the query camera are not counted,
+    and queries without a match left in the gallery are skipped.
+
+    :return: (cmc of max_rank values, mAP), both as fractions
+    """
+    max_rank = min(max_rank, distmat.shape[1])
+    order = np.argsort(distmat, axis=1)
+    cmcs, aps = [], []
+    for q, row in enumerate(order):
+        same_pid = g_pids[row] == q_pids[q]
+        keep = ~(same_pid & (g_camids[row] == q_camids[q]))
+        hits = same_pid[keep]
+        if not hits.any():
+            continue
+        # A query stays matched at every rank after its first hit
+        cmc = np.ones(max_rank, dtype=np.float32)
+        cmc[: np.argmax(hits)] = 0
+        cmcs.append(cmc)
+        precision = np.cumsum(hits) / np.arange(1, len(hits) + 1)
+        aps.append(precision[hits].mean())
+    if not cmcs:
+        raise ValueError("no query has a match in the gallery")
+    return np.mean(cmcs, axis=0), float(np.mean(aps))
+
+
+def evaluate(backend, query, gallery, size, batch_size, pool):
+    """
+    mAP, Rank-1 and Rank-5 (in %) of a backend on query against gallery
+    with cosine distance, and its throughput (crops/s of forward passes
+    only, decoding excluded).
+    """
+    features = []
+    crops, elapsed = 0, 0.0
+    for keys, read, _, _ in (query, gallery):
+        part = []
+        for batch in batches(keys, read, size, batch_size, pool):
+            start = time.perf_counter()
+            part.append(backend(batch))
+            elapsed += time.perf_counter() - start
+            crops += len(batch)
+        features.append(l2_normalize(np.concatenate(part)))
+
+    distmat = 1 - features[0] @ features[1].T
+    cmc, mean_ap = evaluate_rank(
+        distmat, query[2], gallery[2], query[3], gallery[3]
+    )
+    return {
+        "mAP": mean_ap * 100,
+        "rank1": float(cmc[0]) * 100,
+        "rank5": float(cmc[min(4, len(cmc) - 1)]) * 100,
+        "crops_per_s": crops / max(elapsed, 1e-9),
+    }
+
+
+def quantized_path(model_path, method, output_dir=None):
+    folder, name = os.path.split(model_path)
+    stem = os.path.splitext(name)[0]
+    return os.path.join(output_dir or folder, f"{stem}.int8-{method}.onnx")
+
+
+def calibration_data(input_name, dataset_dir, packed, size, count,
+                     batch_size, pool):
+    """CalibrationCrops of `count` crops of bounding_box_train."""
+    keys, read, _, _ = read_part(dataset_dir, "bounding_box_train", packed)
+    return CalibrationCrops(
+        input_name, keys, read, size, count, batch_size, pool
+    )
+
+
+def check_accuracy(result, baseline, max_map_drop, max_rank1_drop):
+    """Raises AccuracyDrop if result lost too much mAP or Rank-1."""
+    map_drop = baseline["mAP"] - result["mAP"]
+    rank1_drop = baseline["rank1"] - result["rank1"]
+    if map_drop > max_map_drop or rank1_drop > max_rank1_drop:
+        raise AccuracyDrop(
+            f"mAP -{map_drop:.1f}, Rank-1 -{rank1_drop:.1f} points"
+        )
+
+
+def quantize_checked(method, onnx_path, path, calibration, calib_method,
+                     evaluate_model, accept):
+    """
+    Quantizes onnx_path into path with `method` and evaluates it with
+    evaluate_model(model_path). The file is only written if
+    accept(result) does not raise AccuracyDrop.
+
+    :return: report entry of the quantized model
+    """
+    result = {"path": path}
+    try:
+        with atomic_path(path) as tmp_path:
+            quantize(method, onnx_path, tmp_path, calibration, calib_method)
+            result.update(
+                evaluate_model(tmp_path),
+                size_mb=os.path.getsize(tmp_path) / 2 ** 20,
+            )
+            accept(result)
+        result["status"] = "accepted"
+    except AccuracyDrop as e:
+        result["status"] = f"rejected ({e})"
+    return result
+
+
+def format_row(name, result, baseline):
+    map_delta = result["mAP"] - baseline["mAP"]
+    rank1_delta = result["rank1"] - baseline["rank1"]
+    speedup = result["crops_per_s"] / baseline["crops_per_s"]
+    return (
+        f"{name:>12}: mAP {result['mAP']:5.1f} ({map_delta:+.1f}), "
+        f"Rank-1 {result['rank1']:5.1f} ({rank1_delta:+.1f}), "
+        f"{result['crops_per_s']:7.1f} crops/s (x{speedup:.2f}), "
+        f"{result['size_mb']:.1f} MB, {result['status']}"
+    )
+
+
+def write_report(report, path):
+    """
+    Writes the JSON report and prints a row per model.
+
+    :return: names of the rejected models
+    """
+    atomic_write(path, json.dumps(report, indent=2))
+    rejected = []
+    for name, result in report.items():
+        if name == "settings":
+            continue
+        print(format_row(name, result, report["fp32"]))
+        if result["status"].startswith("rejected"):
+            rejected.append(name)
+    print(f"Report: {path}")
+    return rejected
+
+
+@click.command()
+@click.option(
+    "--onnx",
+    "onnx_path",
+    default=DEFAULT_ONNX,
+    type=click.Path(exists=True),
+    help="FP32 model exported by export_onnx.py.",
+)
+@click.option(
+    "--config",
+    "config_path",
+    default=DEFAULT_CONFIG,
+    type=click.Path(exists=True),
+    help="Training config with the input size and data.root.",
+)
+@click.option(
+    "--packed",
+    is_flag=True,
+    help="Read market1501_packed shards instead of jpg folders.",
+)
+@click.option(
+    "--method",
+    "methods",
+    multiple=True,
+    default=METHODS,
+    type=click.Choice(METHODS),
+    help="Quantization to try; repeat for several.",
+)
+@click.option(
+    "--calib-crops",
+    default=512,
+    type=int,
+    help="Training crops used to calibrate static quantization.",
+)
+@click.option(
+    "--calib-method",
+    default="minmax",
+    type=click.Choice(CALIBRATION_METHODS),
+    help="How static quantization picks activation ranges.",
+)
+@click.option(
+    "--max-map-drop",
+    default=1.0,
+    type=float,
+    help="Largest allowed mAP drop below FP32, in points.",
+)
+@click.option(
+    "--max-rank1-drop",
+    default=1.0,
+    type=float,
+    help="Largest allowed Rank-1 drop below FP32, in points.",
+)
+@click.option(
+    "--batch-size", default=32, type=int, help="Inference batch size."
+)
+@click.option(
+    "--threads",
+    default=os.cpu_count(),
+    type=int,
+    help="Intra-op threads of onnxruntime.",
+)
+@click.option(
+    "--output-dir",
+    default=None,
+    type=click.Path(),
+    help="Folder of the quantized models (default: next to --onnx).",
+)
+@click.option(
+    "--report",
+    "report_path",
+    default=None,
+    type=click.Path(),
+    help="JSON report (default: quantization_report.json in the output "
+    "folder).",
+)
+def main(
+    onnx_path,
+    config_path,
+    packed,
+    methods,
+    calib_crops,
+    calib_method,
+    max_map_drop,
+    max_rank1_drop,
+    batch_size,
+    threads,
+    output_dir,
+    report_path,
+):
+    """
+    Quantizes the ReID model to INT8 and keeps the models that stay
+    accurate.
+    """
+    if quantization is None:
+        raise click.ClickException("onnxruntime is not installed")
+
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    size = (config["data"]["width"], config["data"]["height"])
+    dataset_dir = os.path.join(
+        config["data"].get("root", os.path.join("data", "interim")),
+        "market1501_packed" if packed else "market1501",
+    )
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    pool = ThreadPoolExecutor(max_workers=2)
+    query = read_part(dataset_dir, "query", packed)
+    gallery = read_part(dataset_dir, "bounding_box_test", packed)
+    print(
+        f"Evaluating on {len(query[0])} query and "
+        f"{len(gallery[0])} gallery crops"
+    )
+
+    def evaluate_model(model_path):
+        backend = OnnxRuntimeBackend(model_path, threads)
+        return evaluate(backend, query, gallery, size, batch_size, pool)
+
+    fp32 = OnnxRuntimeBackend(onnx_path, threads)
+    baseline = evaluate(fp32, query, gallery, size, batch_size, pool)
+    baseline.update(
+        path=onnx_path,
+        size_mb=os.path.getsize(onnx_path) / 2 ** 20,
+        status="baseline",
+    )
+    report = {"fp32": baseline}
+
+    def accept(result):
+        check_accuracy(result, baseline, max_map_drop, max_rank1_drop)
+
+    for method in methods:
+        calibration = None
+        if method == "static":
+            calibration = calibration_data(
+                fp32.input_name,
+                dataset_dir,
+                packed,
+                size,
+                calib_crops,
+                batch_size,
+                pool,
+            )
+        report[f"int8-{method}"] = quantize_checked(
+            method,
+            onnx_path,
+            quantized_path(onnx_path, method, output_dir),
+            calibration,
+            calib_method,
+            evaluate_model,
+            accept,
+        )
+    pool.shutdown()
+
+    report["settings"] = {
+        "dataset": dataset_dir,
+        "calib_crops": calib_crops,
+        "calib_method": calib_method,
+        "max_map_drop": max_map_drop,
+        "max_rank1_drop": max_rank1_drop,
+        "batch_size": batch_size,
+        "threads": threads,
+    }
+    rejected = write_report(
+        report,
+        report_path
+        or os.path.join(
+            output_dir or os.path.dirname(onnx_path),
+            "quantization_report.json",
+        ),
+    )
+    if rejected:
+        raise click.ClickException(
+            f"Rejected {', '.join(rejected)}: accuracy dropped too much"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,203 @@
+import os.path as osp
+import time
+
+import click
+import cv2
+import numpy as np
+import torch
 import torchreid
+import yaml
+from PIL import Image
+from torchreid.data import ImageDataset
+
+from src.config import DEFAULT_CONFIG
+from src.data.crop_store import PackedCropStore
+
+PACKED_PARTS = ("bounding_box_train", "query", "bounding_box_test")
+
+
+class PackedMarket1501(ImageDataset):
+    """
+    Market1501 read from the packed shards written by
+    create_reid_dataset.py --packed. Crops are decoded straight from the
+    memory-mapped shard, so no per-crop file is opened during training.
+    """
+
+    dataset_dir = "market1501_packed"
+
+    def __init__(self, root="", **kwargs):
+        self.root = osp.abspath(osp.expanduser(root))
+        self.dataset_dir = osp.join(self.root, self.dataset_dir)
+        self.stores = {
+            part: PackedCropStore(self.dataset_dir, part)
+            for part in PACKED_PARTS
+        }
+
+        train = self.records("bounding_box_train", relabel=True)
+        query = self.records("query")
+        gallery = self.records("bounding_box_test")
+
+        super(PackedMarket1501, self).__init__(train, query, gallery, **kwargs)
+
+    def records(self, part, relabel=False):
+        # impath is "<part>/<index in shard>", resolved in __getitem__
+        index = self.stores[part].index
+        pids = np.asarray(index["pid"]).tolist()
+        camids = np.asarray(index["camid"]).tolist()
+        if relabel:
+            pid2label = {
+                pid: label for label, pid in enumerate(sorted(set(pids)))
+            }
+            pids = [pid2label[pid] for pid in pids]
+        return [
+            (f"{part}/{i}", pid, camid)
+            for i, (pid, camid) in enumerate(zip(pids, camids))
+        ]
+
+    def __getitem__(self, index):
+        img_path, pid, camid, dsetid = self.data[index]
+        part, i = img_path.rsplit("/", 1)
+        img = cv2.cvtColor(self.stores[part].read(int(i)), cv2.COLOR_BGR2RGB)
+        img = Image.fromarray(img)
+        if self.transform is not None:
+            img = self._transform_image(self.transform, self.k_tfm, img)
+        return {
+            "img": img,
+            "pid": pid,
+            "camid": camid,
+            "impath": img_path,
+            "dsetid": dsetid,
+        }
+
+
+torchreid.data.register_image_dataset("packed_market1501", PackedMarket1501)
+
 
+def select_device(name="auto"):
+    """
+    Resolves "auto", "cpu", "cuda" or "cuda:N" to a torch.device; "auto"
+    picks the GPU when one is available. torchreid moves tensors with
+    .cuda(), so a specific GPU is made the current device.
+    """
+    if name == "auto":
+        name = "cuda" if torch.cuda.is_available() else "cpu"
+    device = torch.device(name)
+    if device.type == "cuda":
+        if not torch.cuda.is_available():
+            raise click.ClickException(
+                f"{name} requested but CUDA is not available"
+            )
+        if device.index is not None:
+            torch.cuda.set_device(device)
+    elif device.type != "cpu":
+        raise click.ClickException(f"Unsupported device {name}")
+    return device
 
-def main():
-    # This code creates an ImageDataManager object that manages image data for training and testing.
+
+def tune_loader(
+    loader, workers, pin_memory, persistent_workers, prefetch_factor
+):
+    """
+    Rebuilds a torchreid DataLoader with the same dataset, sampler and
+    batch size but our worker settings: persistent workers are not
+    restarted every epoch and prefetch_factor batches are kept ready per
+    worker. Both only apply with workers > 0.
+    """
+    options = {}
+    if workers > 0:
+        options["persistent_workers"] = persistent_workers
+        options["prefetch_factor"] = prefetch_factor
+    return torch.utils.data.DataLoader(
+        loader.dataset,
+        batch_size=loader.batch_size,
+        sampler=loader.sampler,
+        num_workers=workers,
+        pin_memory=pin_memory,
+        drop_last=loader.drop_last,
+        **options,
+    )
+
+
+class ThroughputSoftmaxEngine(torchreid.engine.ImageSoftmaxEngine):
+    """ImageSoftmaxEngine that reports training samples/s after every epoch."""
+
+    def train(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = super(ThroughputSoftmaxEngine, self).train(*args, **kwargs)
+        if self.use_gpu:
+            torch.cuda.synchronize()
+        elapsed = time.perf_counter() - start
+
+        samples = len(self.train_loader) * self.train_loader.batch_size
+        speed = samples / max(elapsed, 1e-9)
+        print(
+            f"Epoch {self.epoch + 1}: {samples} samples in {elapsed:.1f}s, "
+            f"{speed:.1f} samples/s"
+        )
+        if self.writer is not None:
+            self.writer.add_scalar("Train/samples_per_s", speed, self.epoch)
+        return result
+
+
+@click.command()
+@click.option(
+    "--packed",
+    is_flag=True,
+    help="Train on market1501_packed shards instead of jpg folders.",
+)
+@click.option(
+    "--config",
+    "config_path",
+    default=DEFAULT_CONFIG,
+    type=click.Path(exists=True),
+    help="Training config: input size, batch sizes, device and loader "
+    "settings.",
+)
+@click.option(
+    "--device",
+    default=None,
+    help="auto, cpu, cuda or cuda:N; overrides `device` of the config.",
+)
+@click.option(
+    "--workers",
+    default=None,
+    type=int,
+    help="Data loader processes; overrides data.workers of the config.",
+)
+def main(packed, config_path, device, workers):
+    dataset = "packed_market1501" if packed else "market1501"
+
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    data_cfg = config["data"]
+    loader_cfg = config.get("loader", {})
+
+    device = select_device(device or config.get("device", "auto"))
+    use_gpu = device.type == "cuda"
+    if workers is None:
+        workers = data_cfg.get("workers", 4)
+    # Pinned memory only speeds up copies to a GPU
+    pin_memory = use_gpu and loader_cfg.get("pin_memory", True)
+    print(f"Training on {device} with {workers} loader workers")
+
+    # This code creates an ImageDataManager object that manages image data
+    # for training and testing.
     datamanager = torchreid.data.ImageDataManager(
-        root="data\interim",  # The directory where the data is stored.
-        sources=["market1501"],  # The source dataset to use.
-        targets=["market1501"],  # The target dataset to use.
-        height=256,  # The height of the input image.
-        width=128,  # The width of the input image.
-        batch_size_train=32,  # Batch size for training images.
-        batch_size_test=64,  # Batch size for testing images.
-        transforms=[
-            "random_flip",
-            "random_crop",
-        ],  # Data augmentation techniques to apply during training. # type: ignore
+        # The directory where the data is stored.
+        root=data_cfg.get("root", osp.join("data", "interim")),
+        sources=[dataset],  # The source dataset to use.
+        targets=[dataset],  # The target dataset to use.
+        height=data_cfg["height"],  # The height of the input image.
+        width=data_cfg["width"],  # The width of the input image.
+        # Batch sizes for training and testing images.
+        batch_size_train=config["train"]["batch_size"],
+        batch_size_test=config["test"]["batch_size"],
+        workers=workers,  # Number of data loader processes.
+        use_gpu=use_gpu,
+        # Data augmentation techniques to apply during training.
+        # random_crop resizes every sample in every epoch, which undoes
+        # crops pre-resized by create_reid_dataset --resize
+        transforms=data_cfg.get("transforms", ["random_flip"]),
         norm_mean=[
             0.485,
             0.456,
@@ -27,6 +210,19 @@ def main():
         ],  # Standard deviation values used for normalization of input images
     )
 
+    # torchreid does not expose persistent workers and prefetching, so the
+    # loaders are rebuilt with them before the engine takes them over
+    tune = dict(
+        workers=workers,
+        pin_memory=pin_memory,
+        persistent_workers=loader_cfg.get("persistent_workers", True),
+        prefetch_factor=loader_cfg.get("prefetch_factor", 2),
+    )
+    datamanager.train_loader = tune_loader(datamanager.train_loader, **tune)
+    for loaders in datamanager.test_loader.values():
+        for part, loader in loaders.items():
+            loaders[part] = tune_loader(loader, **tune)
+
     model = torchreid.models.build_model(
         name="osnet_x1_0",
         num_classes=datamanager.num_train_pids,
@@ -34,19 +230,26 @@ def main():
         pretrained=True,
     )
 
-    model = model.cuda()
+    model = model.to(device)
 
     # This code builds an Adam optimizer with learning rate of 0.0003.
     optimizer = torchreid.optim.build_optimizer(model, optim="adam", lr=0.0003)
 
-    # This code builds a single step learning rate scheduler with step size of 20 epochs.
+    # This code builds a single step learning rate scheduler with step size
+    # of 20 epochs.
     scheduler = torchreid.optim.build_lr_scheduler(
         optimizer, lr_scheduler="single_step", stepsize=20
     )
 
-    # This code creates an ImageSoftmaxEngine object that trains and tests the model using softmax loss function.
-    engine = torchreid.engine.ImageSoftmaxEngine(
-        datamanager, model, optimizer=optimizer, scheduler=scheduler, label_smooth=True
+    # This code creates an ImageSoftmaxEngine object that trains and tests
+    # the model using softmax loss function.
+    engine = ThroughputSoftmaxEngine(
+        datamanager,
+        model,
+        optimizer=optimizer,
+        scheduler=scheduler,
+        use_gpu=use_gpu,
+        label_smooth=True,
     )
 
     engine.run(
@@ -0,0 +1,87 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+WIDTH, HEIGHT = 320, 180
+
+
+def write_sequence(root, game, frames, image_dir, seed):
+    """
+    One game in the NCAA layout: <game>/anno/<frame>.json next to
+    <game>/<image_dir>/<frame>.jpg, twelve numbered players and a ball.
+    """
+    rng = np.random.default_rng(seed)
+    anno_dir = os.path.join(root, game, "anno")
+    frame_dir = os.path.join(root, game, image_dir)
+    os.makedirs(anno_dir, exist_ok=True)
+    os.makedirs(frame_dir, exist_ok=True)
+    for frame in range(frames):
+        name = f"{frame:05d}"
+        image = rng.integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(frame_dir, name + ".jpg"), image)
+
+        shapes = []
+        for player in range(1, 13):
+            x = int(rng.integers(0, WIDTH - 30))
+            y = int(rng.integers(0, HEIGHT - 55))
+            shapes.append({
+                "label": str(player),
+                "points": [[x, y], [x + 30, y + 55]],
+                "shape_type": "rectangle",
+            })
+        shapes.append({"label": "ball", "points": [[1, 1], [5, 5]],
+                       "shape_type": "rectangle"})
+        with open(os.path.join(anno_dir, name + ".json"), "w") as f:
+            json.dump({
+                "shapes": shapes,
+                "imageWidth": WIDTH,
+                "imageHeight": HEIGHT,
+                "imageData": "aGVsbG8=",
+                "imagePath": name + ".jpg",
+            }, f)
+
+
+@pytest.fixture
+def labelme_tree(tmp_path):
+    """Builds LabelMe sequences under tmp_path/raw and returns the root."""
+
+    def build(games=2, frames=4, image_dir="playerTrackingFrames"):
+        root = str(tmp_path / "raw")
+        for game in range(games):
+            write_sequence(root, f"game{game}", frames, image_dir, game)
+        return root
+
+    return build
+
+
+def make_sequence(frames, objects, seed=0):
+    """
+    Synthetic MOT ground truth and tracker output: noisy boxes, missed
+    detections, identity switches and false positives.
+    """
+    rng = np.random.default_rng(seed)
+    frame = np.repeat(np.arange(1, frames + 1), objects)
+    ids = np.tile(np.arange(1, objects + 1), frames)
+    start = rng.uniform(0, 1200, (objects, 2))
+    speed = rng.normal(0, 1, (objects, 2))
+    xy = np.abs(start[ids - 1] + speed[ids - 1] * frame[:, None]) % 1200
+    wh = np.tile([40.0, 90.0], (len(frame), 1))
+    gt = np.column_stack([frame, ids, xy, wh, np.ones((len(frame), 4))])
+
+    t = gt.copy()
+    t[:, 2:4] += rng.normal(0, 4, (len(t), 2))
+    t[:, 1] += (rng.random(len(t)) < 0.01) * 100
+    t = t[rng.random(len(t)) > 0.05]
+    fp = t[rng.random(len(t)) < 0.02].copy()
+    fp[:, 2:4] = rng.uniform(0, 1200, (len(fp), 2))
+    fp[:, 1] = 1000
+    return gt, np.concatenate([t, fp])
+
+
+@pytest.fixture
+def mot_sequence():
+    """make_sequence(frames, objects, seed) -> (gt, tracker) MOT rows."""
+    return make_sequence
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from src.data.checkpoint import (
+    JOURNAL_NAME,
+    Journal,
+    JournalMismatch,
+    atomic_path,
+    atomic_write,
+    is_partial_output,
+)
+
+PLAN = {"mode": "ncaa", "inputs": 3}
+
+
+def test_journal_resumes_flushed_records(tmp_path):
+    path = str(tmp_path / JOURNAL_NAME)
+    with Journal(path, PLAN) as journal:
+        journal.append({"frame": 1})
+        journal.flush()
+        journal.append({"frame": 2})
+        journal.flush()
+
+    resumed = Journal(path, PLAN)
+    assert resumed.records == [{"frame": 1}, {"frame": 2}]
+    resumed.append({"frame": 3})
+    resumed.close()
+    assert len(Journal(path, PLAN)) == 3
+
+
+def test_unflushed_records_are_lost(tmp_path):
+    path = str(tmp_path / JOURNAL_NAME)
+    journal = Journal(path, PLAN)
+    journal.append({"frame": 1})
+    journal.flush()
+    journal.append({"frame": 2})
+    # Crash before the next flush
+    del journal
+    assert Journal(path, PLAN).records == [{"frame": 1}]
+
+
+def test_journal_of_another_plan_is_refused(tmp_path):
+    path = str(tmp_path / JOURNAL_NAME)
+    Journal(path, PLAN).close()
+    with pytest.raises(JournalMismatch):
+        Journal(path, {**PLAN, "mode": "baller_tv"})
+
+
+def test_torn_record_is_dropped(tmp_path):
+    path = str(tmp_path / JOURNAL_NAME)
+    with Journal(path, PLAN) as journal:
+        journal.append({"frame": 1})
+    with open(path, "ab") as f:
+        f.write(b'{"frame": 2, "pa')
+
+    journal = Journal(path, PLAN)
+    assert journal.records == [{"frame": 1}]
+    journal.append({"frame": 3})
+    journal.close()
+    assert Journal(path, PLAN).records == [{"frame": 1}, {"frame": 3}]
+
+
+def test_complete_record_without_newline_is_dropped(tmp_path):
+    path = str(tmp_path / JOURNAL_NAME)
+    Journal(path, PLAN).close()
+    with open(path, "ab") as f:
+        f.write(b'{"frame": 1}')
+    assert Journal(path, PLAN).records == []
+
+
+def test_reset_keeps_the_plan(tmp_path):
+    path = str(tmp_path / JOURNAL_NAME)
+    with Journal(path, PLAN) as journal:
+        journal.append({"frame": 1})
+        journal.reset()
+    assert Journal(path, PLAN).records == []
+
+
+def test_atomic_path_leaves_no_partial_file(tmp_path):
+    path = str(tmp_path / "label.txt")
+    atomic_write(path, "old")
+    with pytest.raises(RuntimeError):
+        with atomic_path(path) as tmp:
+            with open(tmp, "w") as f:
+                f.write("half")
+            raise RuntimeError
+    assert os.listdir(tmp_path) == ["label.txt"]
+    with open(path) as f:
+        assert f.read() == "old"
+
+    atomic_write(path, b"new")
+    with open(path, "rb") as f:
+        assert f.read() == b"new"
+
+
+def test_is_partial_output(tmp_path):
+    out = tmp_path / "crops"
+    assert not is_partial_output(str(out))
+    out.mkdir()
+    assert not is_partial_output(str(out))
+    (out / "0").mkdir()
+    assert is_partial_output(str(out))
+    Journal(str(out / JOURNAL_NAME), PLAN).close()
+    assert not is_partial_output(str(out))
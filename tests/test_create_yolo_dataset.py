@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from src.data import create_yolo_dataset
+from src.data.create_yolo_dataset import build_dataset
+from src.data.manifest import Manifest
+
+
+def outputs(output_dir):
+    """Every file of the built dataset with its contents."""
+    files = {}
+    for split in ("train", "valid", "test"):
+        for sub in ("images", "labels"):
+            folder = os.path.join(output_dir, split, sub)
+            for name in sorted(os.listdir(folder)):
+                with open(os.path.join(folder, name), "rb") as f:
+                    files[f"{split}/{sub}/{name}"] = f.read()
+    return files
+
+
+@pytest.fixture
+def dataset(labelme_tree, tmp_path):
+    root = labelme_tree(games=3, frames=3)
+    output_dir = str(tmp_path / "yolo")
+    build_dataset([root], output_dir, workers=1)
+    return root, output_dir
+
+
+def test_rebuild_converts_only_changed_frames(dataset, capsys):
+    root, output_dir = dataset
+    before = outputs(output_dir)
+    assert len(before) == 2 * 9
+    capsys.readouterr()
+
+    build_dataset([root], output_dir, workers=1)
+    assert "Converted 0 frames (9 up to date)" in capsys.readouterr().out
+    assert outputs(output_dir) == before
+
+    anno = os.path.join(root, "game1", "anno", "00001.json")
+    with open(anno, "r") as f:
+        text = f.read()
+    with open(anno, "w") as f:
+        f.write(text.replace('"label": "1"', '"label": "ball"', 1))
+    build_dataset([root], output_dir, workers=1)
+    assert "Converted 1 frames (8 up to date)" in capsys.readouterr().out
+
+    after = outputs(output_dir)
+    changed = [name for name in before if before[name] != after[name]]
+    assert changed == [
+        name for name in before
+        if name.endswith("labels/game1-playerTrackingFrames-00001.txt")
+    ]
+
+
+def test_deleted_frames_lose_their_outputs(dataset):
+    root, output_dir = dataset
+    os.remove(os.path.join(root, "game2", "playerTrackingFrames", "00000.jpg"))
+    build_dataset([root], output_dir, workers=1)
+
+    names = [os.path.basename(name) for name in outputs(output_dir)]
+    assert len(names) == 2 * 8
+    assert not any(name.startswith("game2-playerTrackingFrames-00000")
+                   for name in names)
+    assert len(Manifest(output_dir)) == 8
+
+
+def test_relative_and_absolute_input_share_the_manifest(dataset, capsys):
+    root, output_dir = dataset
+    capsys.readouterr()
+    build_dataset([os.path.relpath(root)], output_dir, workers=1)
+    assert "Converted 0 frames (9 up to date)" in capsys.readouterr().out
+
+
+def test_failed_frames_are_retried(labelme_tree, tmp_path, monkeypatch,
+                                   capsys):
+    root = labelme_tree(games=2, frames=2)
+    output_dir = str(tmp_path / "yolo")
+
+    def broken(source, target, mode):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(create_yolo_dataset, "materialize", broken)
+        build_dataset([root], output_dir, workers=1)
+    assert "4 frames failed" in capsys.readouterr().out
+    assert outputs(output_dir) == {}
+
+    build_dataset([root], output_dir, workers=1)
+    assert "Converted 4 frames (0 up to date)" in capsys.readouterr().out
+    assert len(outputs(output_dir)) == 2 * 4
@@ -0,0 +1,78 @@
+import itertools
+import time
+
+import numpy as np
+import pytest
+
+from src.features.build_features import EmbeddingCache, crop_hash
+
+DIM = 16
+SIZE = DIM * 4  # bytes of one float32 embedding
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Every call is one tick later, so LRU order does not depend on the
+    # resolution of time.time()
+    ticks = itertools.count()
+    monkeypatch.setattr(time, "time", lambda: float(next(ticks)))
+
+
+def embedding(seed):
+    return np.random.default_rng(seed).standard_normal(DIM, np.float32)
+
+
+def key(name):
+    return crop_hash(name.encode())
+
+
+def test_round_trip_and_models_are_separate(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    with EmbeddingCache(path, "model-a") as cache:
+        cache.put_many([(key("x"), embedding(0)), (key("y"), embedding(1))])
+        found = cache.get_many([key("x"), key("z")])
+        assert list(found) == [key("x")]
+        np.testing.assert_array_equal(found[key("x")], embedding(0))
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    with EmbeddingCache(path, "model-b") as other:
+        assert other.get_many([key("x"), key("y")]) == {}
+        assert len(other) == 0
+    with EmbeddingCache(path, "model-a") as reopened:
+        assert len(reopened) == 2
+        assert reopened.bytes == 2 * SIZE
+
+
+def test_existing_entries_are_kept(tmp_path):
+    with EmbeddingCache(str(tmp_path / "cache.sqlite"), "m") as cache:
+        cache.put_many([(key("x"), embedding(0))])
+        cache.put_many([(key("x"), embedding(1))])
+        np.testing.assert_array_equal(
+            cache.get_many([key("x")])[key("x")], embedding(0)
+        )
+        assert cache.bytes == SIZE
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    with EmbeddingCache(path, "m", max_bytes=3 * SIZE) as cache:
+        for name in ("a", "b", "c"):
+            cache.put_many([(key(name), embedding(ord(name)))])
+        cache.get_many([key("a")])
+        # Over budget: trims to EVICT_TO of it, dropping b and c
+        cache.put_many([(key("d"), embedding(0))])
+
+        kept = cache.get_many([key(name) for name in "abcd"])
+        assert sorted(kept) == sorted([key("a"), key("d")])
+        assert cache.bytes == 2 * SIZE
+
+
+def test_eviction_spans_all_models(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    with EmbeddingCache(path, "old") as old:
+        old.put_many([(key("x"), embedding(0)), (key("y"), embedding(1))])
+    with EmbeddingCache(path, "new", max_bytes=2 * SIZE) as new:
+        new.put_many([(key("x"), embedding(2))])
+        # The older entries go first, whichever model wrote them
+        assert [model for model, _, _ in new.models()] == ["new"]
+        assert len(new) == 1
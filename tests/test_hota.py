@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from src.metrics.hota import ALPHAS, hota
+
+
+def mot_rows(rows):
+    """(frame, id, x, y) rows of 10 x 10 boxes as a MOT array."""
+    rows = np.asarray(rows, dtype=float)
+    n = len(rows)
+    return np.column_stack(
+        [rows, np.full((n, 2), 10.0), np.ones((n, 4))]
+    ).reshape(n, 10)
+
+
+def three_objects(frames=5):
+    return mot_rows([
+        [frame, obj, 50.0 * obj, 0]
+        for frame in range(1, frames + 1)
+        for obj in (1, 2, 3)
+    ])
+
+
+def test_perfect_tracking():
+    gt = three_objects()
+    t = gt.copy()
+    t[:, 1] += 10
+    mean = hota(gt, t)["mean"]
+    for field in ("HOTA", "DetA", "AssA", "LocA", "DetRe", "DetPr",
+                  "AssRe", "AssPr"):
+        assert mean[field] == pytest.approx(1.0), field
+
+
+def test_id_switch():
+    # One object seen by the tracker as id 7 in frames 1-2 and id 8 in
+    # frames 3-4: every detection matches, and each gt/tracker id pair
+    # covers 2 of the 4 frames of the gt track, so AssA = 2 / (4 + 2 - 2)
+    gt = mot_rows([[frame, 1, 0, 0] for frame in range(1, 5)])
+    t = mot_rows([[frame, 7 if frame < 3 else 8, 0, 0]
+                  for frame in range(1, 5)])
+    mean = hota(gt, t)["mean"]
+    assert mean["DetA"] == pytest.approx(1.0)
+    assert mean["AssA"] == pytest.approx(0.5)
+    assert mean["AssRe"] == pytest.approx(0.5)
+    assert mean["AssPr"] == pytest.approx(1.0)
+    assert mean["HOTA"] == pytest.approx(np.sqrt(0.5))
+
+
+def test_empty_hypothesis():
+    gt = three_objects()
+    res = hota(gt, np.empty((0, 10)))
+    np.testing.assert_array_equal(res["HOTA_FN"], len(gt))
+    np.testing.assert_array_equal(res["HOTA_FP"], 0)
+    mean = res["mean"]
+    assert mean["HOTA"] == 0.0
+    assert mean["DetA"] == 0.0
+    assert mean["AssA"] == 0.0
+    assert mean["LocA"] == 1.0
+
+
+def test_localization_threshold():
+    # Shifting a 10 x 10 box by 2 px gives IoU 8 / 12: matches count
+    # only for alpha <= 2/3, which are 13 of the 19 thresholds
+    gt = mot_rows([[frame, 1, 0, 0] for frame in range(1, 4)])
+    t = mot_rows([[frame, 1, 2, 0] for frame in range(1, 4)])
+    res = hota(gt, t)
+    matched = ALPHAS <= 2 / 3
+    assert matched.sum() == 13
+
+    np.testing.assert_allclose(res["DetA"], matched.astype(float))
+    np.testing.assert_allclose(res["HOTA"], matched.astype(float))
+    np.testing.assert_allclose(res["LocA"], np.where(matched, 2 / 3, 1.0))
+    assert res["mean"]["HOTA"] == pytest.approx(13 / 19)
+    assert res["mean"]["LocA"] == pytest.approx((13 * 2 / 3 + 6) / 19)
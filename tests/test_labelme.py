@@ -0,0 +1,81 @@
+import importlib.util
+import json
+import sys
+
+import pytest
+
+from src.data import labelme
+
+BACKENDS = {
+    "msgspec": (),
+    "orjson": ("msgspec",),
+    "json": ("msgspec", "orjson"),
+}
+
+
+def load_reader(blocked, monkeypatch):
+    """A separate copy of src.data.labelme that cannot import `blocked`."""
+    for name in blocked:
+        monkeypatch.setitem(sys.modules, name, None)
+    spec = importlib.util.spec_from_file_location(
+        f"labelme_{'_'.join(blocked) or 'all'}", labelme.__file__
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def as_tuple(annotation):
+    return (
+        [(s.label, s.points) for s in annotation.shapes],
+        annotation.image_width,
+        annotation.image_height,
+    )
+
+
+ANNOTATIONS = {
+    "sizes": {"imageWidth": 1280, "imageHeight": 720},
+    "null sizes": {"imageWidth": None, "imageHeight": None},
+    "no sizes": {},
+}
+
+
+@pytest.mark.parametrize("case", sorted(ANNOTATIONS))
+def test_backends_agree(case, monkeypatch):
+    data = {
+        "version": "4.5.6",
+        "flags": {},
+        "shapes": [
+            {"label": "7", "points": [[1.5, 2], [30, 60.25]],
+             "group_id": None, "shape_type": "rectangle", "flags": {}},
+            {"label": "ball", "points": [[0, 0], [4, 4]],
+             "shape_type": "rectangle"},
+        ],
+        "imagePath": "00001.jpg",
+        "imageData": "/9j/4AAQSkZJRgABAQ==",
+        **ANNOTATIONS[case],
+    }
+    raw = json.dumps(data, indent=2).encode()
+    expected = (
+        [("7", [[1.5, 2], [30, 60.25]]), ("ball", [[0, 0], [4, 4]])],
+        data.get("imageWidth") or 0,
+        data.get("imageHeight") or 0,
+    )
+
+    for backend, blocked in BACKENDS.items():
+        if blocked == () and labelme.msgspec is None:
+            continue
+        if backend == "orjson" and labelme.orjson is None:
+            continue
+        reader = load_reader(blocked, monkeypatch)
+        assert reader.BACKEND == backend
+        assert as_tuple(reader.decode_annotation(raw)) == expected, backend
+
+
+def test_strip_image_data_keeps_other_fields():
+    raw = b'{"imageData": "abc/+=", "imagePath": "x.jpg", "shapes": []}'
+    stripped = labelme.strip_image_data(raw)
+    assert json.loads(stripped) == {
+        "imageData": None, "imagePath": "x.jpg", "shapes": []
+    }
+    assert labelme.strip_image_data(b'{"shapes": []}') == b'{"shapes": []}'
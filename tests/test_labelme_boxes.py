@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from src.data.labelme import Annotation, Shape
+from src.data.labelme_to_crops import (
+    DENSE_BOXES,
+    _iof,
+    parse_boxes,
+    select_boxes,
+)
+
+WIDTH, HEIGHT = 640, 360
+
+
+def dict_filter(shapes, frame, max_iof_thr):
+    """
+    Overlap filter of labelme_to_crops before vectorization: max IoF per
+    box tuple from the N x N matrix, crop size from slicing the frame.
+    """
+    boxes = [[int(v) for xy in s["points"] for v in xy] for s in shapes]
+    boxes = np.asarray(boxes)
+    max_iof = {}
+    if len(boxes) == 1:
+        max_iof[tuple(boxes[0].tolist())] = 0.0
+    elif len(boxes) > 1:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            iof_matrix = _iof(boxes, boxes)
+        np.fill_diagonal(iof_matrix, 0)
+        for i, box in enumerate(boxes.tolist()):
+            max_iof[tuple(box)] = np.max(iof_matrix[i])
+
+    keep = []
+    for x, y, x2, y2 in boxes.tolist():
+        crop = frame[y:y2, x:x2]
+        keep.append(not (crop.shape[0] < 2 or crop.shape[1] < 2
+                         or max_iof[(x, y, x2, y2)] > max_iof_thr))
+    return np.array(keep, dtype=bool)
+
+
+def random_shapes(n, seed):
+    rng = np.random.default_rng(seed)
+    w = rng.integers(20, 60, n)
+    h = rng.integers(50, 140, n)
+    x = rng.integers(-20, WIDTH - 40, n)
+    y = rng.integers(-40, HEIGHT - 100, n)
+    shapes = [
+        {"label": str(i % 12 + 1),
+         "points": [[float(x[i]), float(y[i])],
+                    [float(x[i] + w[i]), float(y[i] + h[i])]]}
+        for i in range(n)
+    ]
+    # Degenerate, inverted and repeated boxes
+    shapes.append({"label": "1", "points": [[10.0, 10.0], [10.0, 50.0]]})
+    shapes.append({"label": "2", "points": [[90.0, 90.0], [50.0, 40.0]]})
+    shapes.append(dict(shapes[0]))
+    return shapes
+
+
+@pytest.mark.parametrize("n", [1, 5, DENSE_BOXES, 4 * DENSE_BOXES])
+@pytest.mark.parametrize("thr", [0.0, 0.2, 0.6])
+def test_select_boxes_matches_dict_filter(n, thr):
+    shapes = random_shapes(n, seed=n)
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    annotation = Annotation(
+        [Shape(s["label"], s["points"]) for s in shapes], WIDTH, HEIGHT
+    )
+
+    boxes = parse_boxes(annotation, "ncaa")
+    keep = select_boxes(boxes, WIDTH, HEIGHT, thr)
+    np.testing.assert_array_equal(keep, dict_filter(shapes, frame, thr))
+
+
+def test_parse_boxes_skips_non_players():
+    annotation = Annotation(
+        [Shape("3", [[1.7, 2.2], [30.9, 60.1]]),
+         Shape("ball", [[0, 0], [4, 4]]),
+         Shape("13", [[0, 0], [40, 80]])],
+        WIDTH,
+        HEIGHT,
+    )
+    boxes = parse_boxes(annotation, "ncaa")
+    assert boxes.tolist() == [(3, 1, 2, 30, 60)]
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+from src.data.sequence_index import build_index
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_crops(jsons_dir, out_dir, *args):
+    subprocess.run(
+        [sys.executable, "-m", "src.data.labelme_to_crops",
+         "--jsons-dir", jsons_dir, "--out-dir", out_dir, *args],
+        cwd=REPO,
+        check=True,
+        capture_output=True,
+    )
+
+
+def read_output(out_dir):
+    files = {}
+    for root, _, names in os.walk(out_dir):
+        for name in names:
+            if name.startswith(".progress"):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            if name == "dataset.txt":
+                data = data.replace(out_dir.encode(), b"")
+            files[os.path.relpath(path, out_dir)] = data
+    return files
+
+
+def test_index_and_glob_write_the_same_crops(labelme_tree, tmp_path):
+    root = labelme_tree(image_dir="frames")
+    index_path = str(tmp_path / "index.npz")
+    build_index(root, index_path, workers=1)
+
+    run_crops(root, str(tmp_path / "glob"))
+    run_crops(root, str(tmp_path / "index"), "--index", index_path)
+
+    by_glob = read_output(str(tmp_path / "glob"))
+    by_index = read_output(str(tmp_path / "index"))
+    assert len(by_glob) > 2
+    assert by_glob == by_index
@@ -0,0 +1,67 @@
+import errno
+import os
+
+import pytest
+
+from src.data import materialize as materialize_module
+from src.data.materialize import MODES, materialize
+
+
+@pytest.fixture(autouse=True)
+def fresh_modes(monkeypatch):
+    monkeypatch.setattr(materialize_module, "_unsupported", set())
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "frame.jpg"
+    path.write_bytes(b"frame bytes")
+    return str(path)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_every_mode_places_the_file(source, tmp_path, mode):
+    target = str(tmp_path / "out" / "frame.jpg")
+    os.makedirs(os.path.dirname(target))
+    used = materialize(source, target, mode)
+
+    assert used in (mode, "copy")
+    with open(target, "rb") as f:
+        assert f.read() == b"frame bytes"
+    assert os.listdir(os.path.dirname(target)) == ["frame.jpg"]
+    if used == "hardlink":
+        assert os.path.samefile(source, target)
+    if used == "symlink":
+        assert os.path.islink(target)
+
+
+def test_unsupported_mode_falls_back_to_copy(source, tmp_path, monkeypatch):
+    calls = []
+
+    def cross_device(src, dst):
+        calls.append(dst)
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    for name in ("a.jpg", "b.jpg"):
+        target = str(tmp_path / name)
+        assert materialize(source, target, "hardlink") == "copy"
+        assert not os.path.islink(target)
+        with open(target, "rb") as f:
+            assert f.read() == b"frame bytes"
+    # The failed mode is not tried again for the next file
+    assert len(calls) == 1
+
+
+def test_other_errors_are_raised(tmp_path):
+    target = str(tmp_path / "frame.jpg")
+    with pytest.raises(FileNotFoundError):
+        materialize(str(tmp_path / "missing.jpg"), target, "hardlink")
+    assert os.listdir(tmp_path) == []
+
+
+def test_existing_target_is_replaced(source, tmp_path):
+    target = tmp_path / "copy.jpg"
+    target.write_bytes(b"old")
+    materialize(source, str(target), "symlink")
+    assert target.read_bytes() == b"frame bytes"
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.metrics.mot_io import (
+    CACHE_ENV,
+    cache_dir_from_env,
+    load_mot,
+    parse_mot,
+)
+
+
+def write_mot(path, rows, sep=" ", trailing_newline=True):
+    text = "\n".join(sep.join(f"{v:g}" for v in row) for row in rows)
+    path.write_text(text + ("\n" if trailing_newline else ""))
+    return str(path)
+
+
+@pytest.fixture
+def rows(mot_sequence):
+    gt, _ = mot_sequence(50, 4)
+    return np.round(gt, 2)
+
+
+@pytest.mark.parametrize("sep", [" ", ","])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_parse_matches_loadtxt(tmp_path, rows, sep, trailing_newline):
+    path = write_mot(tmp_path / "gt.txt", rows, sep, trailing_newline)
+    expected = np.loadtxt(path, delimiter=sep)
+    np.testing.assert_array_equal(parse_mot(path), expected)
+    np.testing.assert_array_equal(parse_mot(path, chunk_rows=7), expected)
+
+
+def test_blank_lines_and_empty_files(tmp_path, rows):
+    path = tmp_path / "gt.txt"
+    write_mot(path, rows[:3])
+    path.write_text(path.read_text() + "\n\n")
+    np.testing.assert_array_equal(parse_mot(str(path)), rows[:3])
+
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+    assert parse_mot(str(empty)).shape == (0, 10)
+
+
+def test_cache_follows_the_file_contents(tmp_path, rows):
+    path = write_mot(tmp_path / "gt.txt", rows)
+    cache_dir = str(tmp_path / "cache")
+
+    first = load_mot(path, cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    cached = load_mot(path, cache_dir)
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached, first)
+
+    # New contents under the same name and mtime miss the cache
+    stat = os.stat(path)
+    write_mot(tmp_path / "gt.txt", rows[:10])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    np.testing.assert_array_equal(load_mot(path, cache_dir), rows[:10])
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_cache_dir_from_env(tmp_path, monkeypatch):
+    monkeypatch.delenv(CACHE_ENV, raising=False)
+    assert cache_dir_from_env() is None
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(CACHE_ENV, "mot_cache")
+    assert cache_dir_from_env() == str(tmp_path / "mot_cache")
@@ -0,0 +1,67 @@
+import motmetrics as mm
+import numpy as np
+import pytest
+
+from src.metrics.calculate_tracking_metrics import METRICS, accumulate
+from src.metrics.online_metrics import OnlineMOTAccumulator, iter_frames
+
+
+def offline(gt, t):
+    summary = mm.metrics.create().compute(
+        accumulate(gt, t), metrics=METRICS + ["num_switches"], name="acc"
+    )
+    return summary.iloc[0].to_dict()
+
+
+def online(gt, t):
+    acc = OnlineMOTAccumulator(gt)
+    order = np.argsort(t[:, 0], kind="stable")
+    lines = (" ".join(map(str, row)) for row in t[order])
+    for frame, t_dets in iter_frames(lines):
+        acc.update(frame, t_dets)
+    acc.finalize()
+    return acc.summary()
+
+
+def assert_same(gt, t):
+    expected, actual = offline(gt, t), online(gt, t)
+    for name in METRICS + ["num_switches"]:
+        assert actual[name] == pytest.approx(expected[name]), name
+
+
+def mot_rows(frame, boxes, ids):
+    boxes = np.asarray(boxes, dtype=float)
+    return np.column_stack(
+        [np.full(len(boxes), frame), ids, boxes, np.ones((len(boxes), 4))]
+    )
+
+
+def test_synthetic_sequence(mot_sequence):
+    gt, t = mot_sequence(300, 8)
+    # Frames without any GT or tracker rows
+    keep = (gt[:, 0] % 50 != 0) & (gt[:, 0] < 280)
+    assert_same(gt[keep], t[t[:, 0] % 50 != 0])
+
+
+def test_crowded_frame():
+    # gt_i and gt_(i+1) overlap with IoU 0.54; the tracker box t_(i+1)
+    # sits exactly on gt_i, so only the diagonal matches everyone
+    width, shift = 100.0, 100.0 * 0.46 / 1.54
+    gt_boxes = [[i * shift, 0, width, 100] for i in range(5)]
+    t_boxes = [[-shift, 0, width, 100]] + gt_boxes[:4]
+    gt = mot_rows(1, gt_boxes, np.arange(1, 6))
+    t = mot_rows(1, t_boxes, np.arange(11, 16))
+
+    assert_same(gt, t)
+    summary = online(gt, t)
+    assert summary["recall"] == pytest.approx(1.0)
+    assert summary["mota"] == pytest.approx(1.0)
+
+
+def test_empty_frames_are_counted():
+    box = [[0, 0, 10, 10]]
+    gt = np.concatenate([mot_rows(1, box, [1]), mot_rows(5, box, [1])])
+    t = gt.copy()
+    t[:, 1] = 7
+    assert_same(gt, t)
+    assert online(gt, t)["num_frames"] == 5
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.models.quantize_model import (
+    AccuracyDrop,
+    check_accuracy,
+    evaluate_rank,
+)
+
+# Gallery: pid 1 in cameras 1 and 2, pid 2 and pid 3 in camera 1
+G_PIDS = np.array([1, 1, 2, 3])
+G_CAMIDS = np.array([1, 2, 1, 1])
+
+
+def test_evaluate_rank_by_hand():
+    q_pids = np.array([1, 2, 4, 1])
+    q_camids = np.array([2, 2, 2, 3])
+    distmat = np.array([
+        # pid 1 of camera 2 is not counted: hits F T F, AP 1/2
+        [0.3, 0.1, 0.2, 0.4],
+        # hits F F T F, AP 1/3
+        [0.1, 0.5, 0.3, 0.2],
+        # pid 4 is not in the gallery: skipped
+        [0.1, 0.2, 0.3, 0.4],
+        # camera 3 keeps both pid 1 crops: hits T F F T, AP (1 + 2/4) / 2
+        [0.1, 0.9, 0.2, 0.3],
+    ])
+
+    cmc, mean_ap = evaluate_rank(distmat, q_pids, G_PIDS, q_camids, G_CAMIDS)
+
+    np.testing.assert_allclose(cmc, [1 / 3, 2 / 3, 1, 1])
+    assert mean_ap == pytest.approx((1 / 2 + 1 / 3 + 3 / 4) / 3)
+
+
+def test_evaluate_rank_without_matches():
+    # Every pid 1 crop is seen by the camera of the query
+    with pytest.raises(ValueError):
+        evaluate_rank(
+            np.zeros((1, 4)), np.array([1]), G_PIDS, np.array([2]),
+            np.full(4, 2),
+        )
+
+
+def test_check_accuracy():
+    baseline = {"mAP": 80.0, "rank1": 90.0}
+    check_accuracy({"mAP": 79.5, "rank1": 89.0}, baseline, 1.0, 1.0)
+    with pytest.raises(AccuracyDrop):
+        check_accuracy({"mAP": 78.5, "rank1": 90.0}, baseline, 1.0, 1.0)
+    with pytest.raises(AccuracyDrop):
+        check_accuracy({"mAP": 80.0, "rank1": 88.0}, baseline, 1.0, 1.0)
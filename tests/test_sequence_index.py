@@ -0,0 +1,53 @@
+import os
+
+from src.data.labelme import read_annotation
+from src.data.sequence_index import SequenceIndex, build_index
+
+
+def test_index_matches_the_annotations(labelme_tree, tmp_path):
+    root = labelme_tree(games=2, frames=3)
+    index_path = str(tmp_path / "index.npz")
+    build_index(root, index_path, workers=1)
+    index = SequenceIndex.load(index_path)
+
+    assert len(index) == 6
+    for i in range(len(index)):
+        path = index.anno_path(i)
+        expected = read_annotation(path)
+        actual = index.annotation(i)
+        assert actual.image_width == expected.image_width
+        assert actual.image_height == expected.image_height
+        assert [(s.label, s.points) for s in actual.shapes] == [
+            (s.label, s.points) for s in expected.shapes
+        ]
+        assert os.path.exists(index.image_path(i))
+    assert list(index["frame"]) == [1, 2, 3] * 2
+
+
+def test_find_skips_changed_files(labelme_tree, tmp_path, monkeypatch):
+    root = labelme_tree(games=1, frames=3)
+    index_path = str(tmp_path / "index.npz")
+    build_index(root, index_path, workers=1)
+    index = SequenceIndex.load(index_path)
+
+    anno = os.path.join(root, "game0", "anno", "00001.json")
+    assert index.find(anno) == 1
+    monkeypatch.chdir(root)
+    assert index.find(os.path.join("game0", "anno", "00001.json")) == 1
+
+    with open(anno, "r") as f:
+        text = f.read()
+    with open(anno, "w") as f:
+        f.write(text.replace('"label": "1"', '"label": "ball"', 1))
+    assert index.find(anno) is None
+    assert index.load_annotation(anno).shapes[0].label == "ball"
+
+    # Same contents, new mtime
+    touched = os.path.join(root, "game0", "anno", "00000.json")
+    os.utime(touched, ns=(0, 0))
+    assert index.find(touched) is None
+
+    removed = os.path.join(root, "game0", "anno", "00002.json")
+    os.remove(removed)
+    assert index.find(removed) is None
+    assert index.find(os.path.join(root, "game0", "anno", "new.json")) is None
@@ -0,0 +1,59 @@
+import csv
+import os
+import shutil
+
+from src.data.create_yolo_dataset import SPLITS_NAME, build_dataset
+from src.data.split_dataset import SPLITS, iter_splits, write_splits
+
+
+def splits_of(root, seed=0):
+    return {os.path.relpath(path, root): (key, split)
+            for path, key, split in iter_splits(root, seed)}
+
+
+def test_every_game_stays_in_one_split(labelme_tree):
+    root = labelme_tree(games=12, frames=3)
+    by_game = {}
+    for key, split in splits_of(root).values():
+        by_game.setdefault(key, set()).add(split)
+
+    assert len(by_game) == 12
+    assert all(len(splits) == 1 for splits in by_game.values())
+    assert {s for splits in by_game.values() for s in splits} <= set(SPLITS)
+
+
+def test_split_of_a_game_does_not_depend_on_other_games(labelme_tree,
+                                                        tmp_path):
+    root = labelme_tree(games=12, frames=2)
+    full = splits_of(root)
+    assert splits_of(root) == full
+
+    shutil.copytree(os.path.join(root, "game7"),
+                    str(tmp_path / "alone" / "game7"))
+    alone = splits_of(str(tmp_path / "alone"))
+    assert alone == {path: full[path] for path in alone}
+
+    # --seed reshuffles the games
+    assert splits_of(root, seed=1) != full
+
+
+def test_written_splits_match_the_rows(labelme_tree, tmp_path, capsys):
+    root = labelme_tree(games=2, frames=2)
+    csv_path = str(tmp_path / "splits.csv")
+    rows = list(write_splits(iter_splits(root), csv_path))
+
+    with open(csv_path, newline="") as f:
+        written = list(csv.reader(f))
+    assert written[0] == ["split", "sequence", "path"]
+    assert written[1:] == [[split, key, path] for path, key, split in rows]
+    # Two games cannot fill three splits
+    assert "Warning: no sequences in" in capsys.readouterr().out
+
+
+def test_build_writes_splits_into_the_output(labelme_tree, tmp_path,
+                                             monkeypatch):
+    root = labelme_tree(games=2, frames=1)
+    monkeypatch.chdir(tmp_path)
+    build_dataset([root], "yolo", workers=1)
+    assert os.path.exists(os.path.join("yolo", SPLITS_NAME))
+    assert not os.path.exists("data")
@@ -0,0 +1,48 @@
+import motmetrics as mm
+import numpy as np
+import pandas as pd
+
+from src.metrics.calculate_tracking_metrics import accumulate
+from src.metrics.sweep import SWEEP_METRICS, find_candidates, sweep
+
+
+def save(path, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savetxt(path, rows, fmt="%g", delimiter=" ")
+    return str(path)
+
+
+def test_leaderboard_is_ranked_and_matches_single_runs(tmp_path,
+                                                       mot_sequence):
+    gt, t = mot_sequence(60, 5)
+    gt_path = save(tmp_path / "gt.txt", gt)
+    rng = np.random.default_rng(0)
+    candidates = {}
+    # Runs that drop more and more tracker rows
+    for drop in (0.4, 0.0, 0.2, 0.6):
+        name = f"drop{int(drop * 100)}"
+        kept = t[rng.random(len(t)) >= drop]
+        candidates[name] = save(tmp_path / "runs" / f"{name}.txt", kept)
+
+    leaderboard = sweep(gt_path, candidates, workers=2)
+
+    assert list(leaderboard.index) == ["drop0", "drop20", "drop40", "drop60"]
+    ranks = list(zip(leaderboard["idf1"], leaderboard["mota"]))
+    assert ranks == sorted(ranks, reverse=True)
+
+    mh = mm.metrics.create()
+    for name, path in candidates.items():
+        expected = mh.compute(
+            accumulate(gt, np.loadtxt(path)), metrics=SWEEP_METRICS, name=name
+        )
+        pd.testing.assert_frame_equal(
+            leaderboard.loc[[name]], expected, check_dtype=False
+        )
+
+
+def test_candidate_names_keep_their_folders(tmp_path):
+    for run in ("a", "b"):
+        save(tmp_path / "runs" / run / "out.txt", np.ones((1, 10)))
+    found = find_candidates(str(tmp_path / "runs" / "*" / "out.txt"))
+    assert sorted(found) == ["a/out", "b/out"]
+    assert find_candidates(str(tmp_path / "missing")) == {}
@@ -0,0 +1,88 @@
+import motmetrics as mm
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.metrics.calculate_tracking_metrics import (
+    METRICS,
+    accumulate,
+    frame_bounds,
+    index_frames,
+    iou_distances,
+)
+
+
+def iou_matrix(objs, hyps, max_iou=0.5):
+    """
+    mm.distances.iou_matrix without its np.asfarray call, which NumPy 2
+    removed (motmetrics 1.4).
+    """
+    if np.size(objs) == 0 or np.size(hyps) == 0:
+        return np.empty((0, 0))
+    dist = 1 - mm.distances.boxiou(objs[:, None], hyps[None, :])
+    return np.where(dist > max_iou, np.nan, dist)
+
+
+def accumulate_masks(gt, t):
+    """The per-frame mask loop of motMetricsEnhancedCalculator."""
+    acc = mm.MOTAccumulator(auto_id=True)
+    for frame in range(1, int(gt[:, 0].max()) + 1):
+        gt_dets = gt[gt[:, 0] == frame, 1:6]
+        t_dets = t[t[:, 0] == frame, 1:6]
+        C = iou_matrix(gt_dets[:, 1:], t_dets[:, 1:])
+        acc.update(
+            gt_dets[:, 0].astype("int").tolist(),
+            t_dets[:, 0].astype("int").tolist(),
+            C,
+        )
+    return acc
+
+
+def summary(acc):
+    return mm.metrics.create().compute(
+        acc, metrics=METRICS + ["num_switches"], name="acc"
+    )
+
+
+def test_iou_distances_match_iou_matrix(mot_sequence):
+    gt, t = mot_sequence(20, 6, seed=1)
+    # Frames without tracker rows and without GT rows
+    t = t[t[:, 0] != 4]
+    gt = gt[gt[:, 0] != 7]
+    gt_index, t_index = index_frames(gt), index_frames(t)
+    frames = np.arange(1, 21)
+    gt_bounds = frame_bounds(gt_index, frames)
+    t_bounds = frame_bounds(t_index, frames)
+
+    dists, offsets = iou_distances(
+        gt_index[0][:, 2:6], t_index[0][:, 2:6], gt_bounds, t_bounds
+    )
+    for f, frame in enumerate(frames):
+        expected = iou_matrix(
+            gt[gt[:, 0] == frame, 2:6], t[t[:, 0] == frame, 2:6]
+        )
+        actual = dists[offsets[f]:offsets[f + 1]].reshape(expected.shape)
+        np.testing.assert_allclose(actual, expected)
+
+
+@pytest.mark.parametrize("chunk_frames", [1, 7, 4096])
+def test_accumulate_matches_mask_loop(mot_sequence, chunk_frames):
+    gt, t = mot_sequence(120, 8)
+    rng = np.random.default_rng(0)
+    # The mask loop scores only up to the last GT frame
+    t = t[rng.permutation(len(t))]
+    t = t[t[:, 0] <= gt[:, 0].max()]
+
+    expected = accumulate_masks(gt, t)
+    actual = accumulate(gt, t, chunk_frames=chunk_frames)
+    pd.testing.assert_frame_equal(actual.mot_events, expected.mot_events)
+    pd.testing.assert_frame_equal(summary(actual), summary(expected))
+
+
+def test_tracker_rows_after_the_last_gt_frame_are_false_positives():
+    gt = np.array([[1, 1, 0, 0, 10, 10, 1, 1, 1, 1]], dtype=float)
+    t = np.array([[1, 5, 0, 0, 10, 10, 1, 1, 1, 1],
+                  [3, 5, 0, 0, 10, 10, 1, 1, 1, 1]], dtype=float)
+    result = summary(accumulate(gt, t)).iloc[0]
+    assert result["num_frames"] == 3
+    assert result["precision"] == pytest.approx(0.5)